@@ -0,0 +1,204 @@
+"""
+a compact, typed representation of checked programs, the representation that the engine executes.
+
+the semantic checks (lark_passes) do not use it: they run on the lark tree of the parser, and the ast is built from
+the checked tree afterwards (see graph_converters.LarkTreeToAstConverter). so the ast saves the memory of the
+statements that a session keeps (e.g. the rules it evaluates), not the memory or the time of checking a program.
+
+the nodes use __slots__ and keep the line of the statement they came from instead of a lark meta object.
+like lark trees, every node class has a "data" name, so a visitor may dispatch on it with getattr.
+
+terms (of facts, relations, ie relations and assignments) are represented as:
+str - a string constant.
+int - an int constant.
+Span - a span constant.
+VarName - a reference to a variable.
+FreeVar - a free variable.
+"""
+from lark_passes import VarTypes
+
+
+class AstNode:
+    __slots__ = ()
+    data = None
+    # the names of the fields that make up the node's identity (the slots of the node's class and of its bases)
+    _field_names = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        slots = [name for klass in reversed(cls.__mro__) for name in klass.__dict__.get("__slots__", ())]
+        cls._field_names = tuple(name for name in slots if name != "line")
+
+    def _get_fields(self):
+        return tuple(getattr(self, field) for field in self._field_names)
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self._get_fields() == other._get_fields()
+
+    def __hash__(self):
+        return hash((type(self), self._get_fields()))
+
+    def __repr__(self):
+        return type(self).__name__ + "(" + ", ".join(repr(field) for field in self._get_fields()) + ")"
+
+
+class Span(AstNode):
+    __slots__ = ("start", "stop")
+    data = "span"
+
+    def __init__(self, start, stop):
+        self.start = start
+        self.stop = stop
+
+    def __repr__(self):
+        return "[" + str(self.start) + ", " + str(self.stop) + ")"
+
+
+class VarName(AstNode):
+    __slots__ = ("name",)
+    data = "var_name"
+
+    def __init__(self, name):
+        self.name = name
+
+
+class FreeVar(AstNode):
+    __slots__ = ("name",)
+    data = "free_var_name"
+
+    def __init__(self, name):
+        self.name = name
+
+
+class Statement(AstNode):
+    """
+    a top-level statement. its line is not a part of its identity.
+    """
+    __slots__ = ()
+
+
+class Assignment(Statement):
+    """
+    var_name = value, where value is a constant or a VarName
+    """
+    __slots__ = ("var_name", "value", "line")
+    data = "assignment"
+
+    def __init__(self, var_name, value, line=None):
+        self.var_name = var_name
+        self.value = value
+        self.line = line
+
+
+class ReadAssignment(Statement):
+    """
+    var_name = read(path), where path is a str or a VarName
+    """
+    __slots__ = ("var_name", "path", "line")
+    data = "read_assignment"
+
+    def __init__(self, var_name, path, line=None):
+        self.var_name = var_name
+        self.path = path
+        self.line = line
+
+
+class RelationDeclaration(Statement):
+    __slots__ = ("name", "schema", "line")
+    data = "relation_declaration"
+
+    def __init__(self, name, schema, line=None):
+        self.name = name
+        self.schema = schema  # tuple of VarTypes
+        self.line = line
+
+
+class Fact(Statement):
+    __slots__ = ("name", "terms", "line")
+
+    def __init__(self, name, terms, line=None):
+        self.name = name
+        self.terms = terms  # tuple of constants and VarNames
+        self.line = line
+
+
+class AddFact(Fact):
+    __slots__ = ()
+    data = "add_fact"
+
+
+class RemoveFact(Fact):
+    __slots__ = ()
+    data = "remove_fact"
+
+
+class Relation(AstNode):
+    __slots__ = ("name", "terms")
+    data = "relation"
+
+    def __init__(self, name, terms):
+        self.name = name
+        self.terms = terms  # tuple of constants, VarNames and FreeVars
+
+    def get_free_var_names(self):
+        return [term.name for term in self.terms if type(term) is FreeVar]
+
+
+class IERelation(AstNode):
+    __slots__ = ()
+
+    def get_input_free_var_names(self):
+        return [term.name for term in self.input_terms if type(term) is FreeVar]
+
+    def get_output_free_var_names(self):
+        return [term.name for term in self.output_terms if type(term) is FreeVar]
+
+
+class FuncIERelation(IERelation):
+    __slots__ = ("function_name", "input_terms", "output_terms")
+    data = "func_ie_relation"
+
+    def __init__(self, function_name, input_terms, output_terms):
+        self.function_name = function_name
+        self.input_terms = input_terms
+        self.output_terms = output_terms
+
+
+class RgxIERelation(IERelation):
+    __slots__ = ("input_terms", "output_terms", "document")
+    data = "rgx_ie_relation"
+
+    def __init__(self, input_terms, output_terms, document):
+        self.input_terms = input_terms
+        self.output_terms = output_terms
+        self.document = document  # VarName
+
+
+class Rule(Statement):
+    __slots__ = ("head_name", "head_free_vars", "body", "line")
+    data = "rule"
+
+    def __init__(self, head_name, head_free_vars, body, line=None):
+        self.head_name = head_name
+        self.head_free_vars = head_free_vars  # tuple of free variable names
+        self.body = body  # tuple of Relations and IERelations
+        self.line = line
+
+    def get_body_relation_names(self):
+        return [relation.name for relation in self.body if type(relation) is Relation]
+
+
+class Query(Statement):
+    __slots__ = ("relation", "line")
+    data = "query"
+
+    def __init__(self, relation, line=None):
+        self.relation = relation
+        self.line = line
+
+
+DECL_TERM_TO_VAR_TYPE = {
+    "decl_string": VarTypes.STRING,
+    "decl_span": VarTypes.SPAN,
+    "decl_int": VarTypes.INT
+}
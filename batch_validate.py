@@ -0,0 +1,175 @@
+import argparse
+import glob
+import json
+import os
+import re
+import sys
+import time
+
+from lark import Tree
+from lark.exceptions import LarkError
+
+import exceptions
+import lark_passes
+from incremental import get_defined_relation_name, shift_tree_lines
+from parallel_front_end import create_worker_pool, get_worker_parser
+from pass_manager import PassManager
+from statement_splitter import iter_statements
+
+# the checks of main.py, with the tokens removed while parsing (the networkx conversion does not check anything)
+VALIDATION_PASSES = [
+    lark_passes.CheckReferencedVariablesInterpreter,
+    lark_passes.CheckReferencedRelationsInterpreter,
+    lark_passes.CheckRuleSafetyVisitor,
+    lark_passes.TypeCheckingInterpreter
+]
+
+# the semantic errors start with lark_passes.get_line_string()
+_ERROR_LINE_REGEX = re.compile(r'^line (\d+): ')
+
+
+def get_error_record(e, line_delta=0):
+    """
+    :param line_delta: added to the line of a syntax error, which is relative to the parsed text.
+    :return: a json serializable record of an error raised while validating a program
+    """
+    line = None
+    if isinstance(e, exceptions.CustomException):
+        match = _ERROR_LINE_REGEX.match(str(e))
+        if match:
+            line = int(match.group(1))
+    elif isinstance(e, LarkError):
+        error_line = getattr(e, "line", -1)
+        if error_line is not None and error_line > 0:
+            line = error_line + line_delta
+    return {"line": line, "type": type(e).__name__, "message": str(e)}
+
+
+def get_internal_error_record(e):
+    """
+    :return: a record of an unexpected error (not a syntax or a semantic error of the program) raised while
+        validating a program
+    """
+    return {"line": None, "type": type(e).__name__, "message": "internal error: " + (str(e) or repr(e))}
+
+
+def validate_program(text, parser=None):
+    """
+    parses and checks a program statement by statement, and keeps going after a statement that fails.
+    a statement that fails is skipped (as if it was not in the program), so a failed assignment or relation
+    definition may cause more errors in the statements that use it.
+    :param parser: a parser that removes the tokens while parsing, see parser_factory.get_parser().
+    :return: (number of statements, list of error records, see get_error_record)
+    """
+    parser = get_worker_parser() if parser is None else parser
+    pass_manager = PassManager(VALIDATION_PASSES)
+    relations_pass = pass_manager.get_pass(lark_passes.CheckReferencedRelationsInterpreter)
+    type_environment = pass_manager.get_pass(lark_passes.TypeCheckingInterpreter).type_environment
+    errors = []
+    statement_count = 0
+    for statement_text, line in iter_statements(text):
+        statement_count += 1
+        try:
+            tree = parser.parse(statement_text)
+        except LarkError as e:
+            errors.append(get_error_record(e, line - 1))
+            continue
+        if line != 1:
+            shift_tree_lines(tree, line - 1)
+        for statement in tree.children:
+            defined_relation_name = get_defined_relation_name(statement)
+            relation_was_defined = defined_relation_name in relations_pass.relation_name_to_arity
+            try:
+                pass_manager.run(Tree("start", [statement]))
+            except exceptions.CustomException as e:
+                errors.append(get_error_record(e))
+                # a rule may be registered by the relations check and then fail a later check
+                if defined_relation_name is not None and not relation_was_defined:
+                    relations_pass.undefine_relation(defined_relation_name)
+                    type_environment.remove_relation(defined_relation_name)
+    return statement_count, errors
+
+
+def validate_file(path):
+    """
+    :return: the summary of a program file: its path, number of statements, errors and wall time
+    """
+    start = time.perf_counter()
+    try:
+        with open(path, 'r') as program_file:
+            text = program_file.read()
+    except (OSError, UnicodeDecodeError) as e:
+        statement_count, errors = 0, [{"line": None, "type": type(e).__name__, "message": str(e)}]
+    else:
+        try:
+            statement_count, errors = validate_program(text)
+        except Exception as e:
+            # a bug in the checks, report it and go on with the other files
+            statement_count = sum(1 for _ in iter_statements(text))
+            errors = [get_internal_error_record(e)]
+    for error in errors:
+        error["file"] = path
+    return {"file": path, "statements": statement_count, "errors": errors,
+            "wall_time_ms": (time.perf_counter() - start) * 1000}
+
+
+def expand_paths(patterns):
+    """
+    expands glob patterns (recursive, with **), patterns that match nothing are kept as they are so they are reported
+    as missing files
+    """
+    paths = []
+    seen_paths = set()
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern, recursive=True)) if glob.has_magic(pattern) else [pattern]
+        if not matches:
+            matches = [pattern]
+        for path in matches:
+            if os.path.isdir(path) or path in seen_paths:
+                continue
+            seen_paths.add(path)
+            paths.append(path)
+    return paths
+
+
+def validate_files(paths, max_workers=None):
+    """
+    validates program files in a pool of worker processes, each of them builds the parser once.
+    :return: the summary of every file, in the order of paths
+    """
+    max_workers = (os.cpu_count() or 1) if max_workers is None else max_workers
+    if max_workers <= 1 or len(paths) <= 1:
+        return [validate_file(path) for path in paths]
+    with create_worker_pool(max_workers) as pool:
+        # send several files at once, most programs are checked faster than a round trip to a worker
+        chunksize = max(1, len(paths) // (max_workers * 8))
+        return list(pool.map(validate_file, paths, chunksize=chunksize))
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="parses and checks many program files, and reports every error")
+    arg_parser.add_argument("patterns", nargs="+", help="program files or glob patterns (** matches directories)")
+    arg_parser.add_argument("--workers", type=int, help="number of worker processes (defaults to the number of cpus)")
+    arg_parser.add_argument("--output", help="write the json summary to this path instead of stdout")
+    args = arg_parser.parse_args(argv)
+
+    start = time.perf_counter()
+    file_summaries = validate_files(expand_paths(args.patterns), args.workers)
+    errors = [error for file_summary in file_summaries for error in file_summary["errors"]]
+    summary = {
+        "file_count": len(file_summaries),
+        "failed_file_count": sum(1 for file_summary in file_summaries if file_summary["errors"]),
+        "error_count": len(errors),
+        "total_wall_time_ms": (time.perf_counter() - start) * 1000,
+        "files": file_summaries
+    }
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(summary, output_file, indent=2)
+    else:
+        sys.stdout.write(json.dumps(summary, indent=2) + "\n")
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,76 @@
+"""
+checks that running the check passes fused (with a pass_manager.PassManager) gives the same tree and raises the same
+error as running them one after another, and compares their latency.
+
+usage (from the repository root):
+    python -m benchmarks.fused_passes [repetitions]
+"""
+import sys
+import time
+
+import lark_passes
+import parser_factory
+from benchmarks.parse_to_checked import generate_program
+from main import run_passes
+from pass_manager import PassManager
+
+PASSES = [
+    lark_passes.RemoveTokensTransformer,
+    lark_passes.StringVisitor,
+    lark_passes.CheckReferencedVariablesInterpreter,
+    lark_passes.CheckReferencedRelationsInterpreter,
+    lark_passes.CheckRuleSafetyVisitor,
+    lark_passes.TypeCheckingInterpreter
+]
+
+# programs on which a pass relies on an earlier pass having checked the nodes inside the node it checks
+PROGRAMS = [
+    'new A(str)\nA("a")\n?A(X)\n',
+    "new A(str)\n?A(zz)\n",
+    "new A(str)\nr(X) <- A(X), A(zz)\n",
+    "new A(str)\n?B(X)\n",
+    "new A(str)\nA(1)\n",
+    "new A(int)\nr(X) <- A(X), A(Y)\n?r(X)\n",
+]
+
+
+def run(program, run_checks):
+    """
+    :return: (the checked tree, None) or (None, (the type of the error, its message))
+    """
+    tree = parser_factory.get_parser().parse(program)
+    try:
+        return run_checks(tree), None
+    except Exception as error:
+        return None, (type(error), str(error))
+
+
+def run_fused(tree):
+    return PassManager(PASSES).run(tree)
+
+
+def run_serial(tree):
+    return run_passes(tree, PASSES)
+
+
+def main(repetitions=3):
+    for program in PROGRAMS:
+        fused_result = run(program, run_fused)
+        serial_result = run(program, run_serial)
+        assert fused_result == serial_result, \
+            "fused and serial passes differ on:\n" + program + "fused: " + str(fused_result[1]) + \
+            "\nserial: " + str(serial_result[1])
+    print(f"{len(PROGRAMS)} programs checked the same fused and serial")
+    program = generate_program(5000)
+    for name, run_checks in [("serial", run_serial), ("fused", run_fused)]:
+        timings = []
+        for _ in range(repetitions):
+            tree = parser_factory.get_parser().parse(program)
+            start = time.perf_counter()
+            run_checks(tree)
+            timings.append(time.perf_counter() - start)
+        print(f"{name:>6}\tmin {min(timings) * 1000:8.2f}ms")
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,33 @@
+"""
+compares parsing and checking a large generated program serially and in a process pool.
+
+usage (from the repository root):
+    python -m benchmarks.parallel_front_end [number of statement groups] [number of workers]
+"""
+import sys
+import time
+
+import parser_factory
+from benchmarks.parse_to_checked import CHECK_PASSES, generate_program
+from parallel_front_end import ParallelFrontEnd, create_worker_pool
+from pass_manager import PassManager
+
+
+def main(group_count=20000, max_workers=None):
+    program = generate_program(group_count)
+    print(f"program size: {len(program) / 2 ** 20:.2f}MB")
+    parser = parser_factory.get_parser(normalize_tokens=True)
+    start = time.perf_counter()
+    PassManager(CHECK_PASSES).run(parser.parse(program))
+    print(f"{'serial':<10}{time.perf_counter() - start:8.2f}s")
+    with create_worker_pool(max_workers) as pool:
+        front_end = ParallelFrontEnd(max_workers=max_workers, pool=pool)
+        # start the workers (and build their parsers) before timing
+        list(pool.map(abs, range(front_end.max_workers)))
+        start = time.perf_counter()
+        front_end.check(program)
+        print(f"{'parallel':<10}{time.perf_counter() - start:8.2f}s\t{front_end.max_workers} workers")
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,59 @@
+"""
+compares the latency and peak memory of parsing and checking a generated program, when the tokens are removed by
+separate passes and when they are removed while parsing.
+
+usage (from the repository root):
+    python -m benchmarks.parse_to_checked [number of statement groups]
+"""
+import sys
+import time
+import tracemalloc
+
+import lark_passes
+import parser_factory
+from pass_manager import PassManager
+
+CHECK_PASSES = [
+    lark_passes.CheckReferencedVariablesInterpreter,
+    lark_passes.CheckReferencedRelationsInterpreter,
+    lark_passes.CheckRuleSafetyVisitor,
+    lark_passes.TypeCheckingInterpreter
+]
+
+
+def generate_program(group_count):
+    statements = ["new parent(str, str)", "new age(str, int)"]
+    for idx in range(group_count):
+        statements.append(f'name{idx} = "person \\\nnumber {idx}"')
+        statements.append(f'parent(name{idx}, "person{idx + 1}")')
+        statements.append(f'age("person{idx}", {idx})')
+    statements.append("grandparent(X, Y) <- parent(X, Z), parent(Z, Y)")
+    return "\n".join(statements) + "\n"
+
+
+def measure(parser, passes, program):
+    # tracing the allocations slows the run down, so the time and the memory are measured in separate runs
+    start = time.perf_counter()
+    PassManager(passes).run(parser.parse(program))
+    wall_time = time.perf_counter() - start
+    tracemalloc.start()
+    PassManager(passes).run(parser.parse(program))
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return wall_time, peak
+
+
+def main(group_count=20000):
+    program = generate_program(group_count)
+    print(f"program size: {len(program) / 2 ** 20:.2f}MB")
+    separate_passes = [lark_passes.RemoveTokensTransformer, lark_passes.StringVisitor] + CHECK_PASSES
+    for name, parser, passes in [
+        ("separate passes", parser_factory.get_parser(), separate_passes),
+        ("parse time", parser_factory.get_parser(normalize_tokens=True), CHECK_PASSES)
+    ]:
+        wall_time, peak = measure(parser, passes, program)
+        print(f"{name:<16}{wall_time:8.2f}s\tpeak {peak / 2 ** 20:8.1f}MB")
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
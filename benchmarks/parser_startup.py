@@ -0,0 +1,44 @@
+"""
+compares cold and warm construction of the grammar.lark parser.
+cold - the LALR tables are built from the grammar (and saved to an empty cache directory).
+warm - the LALR tables are loaded from the cache directory.
+
+usage (from the repository root):
+    python -m benchmarks.parser_startup [repetitions]
+"""
+import shutil
+import sys
+import tempfile
+import time
+
+import parser_factory
+
+
+def time_construction(cache_dir_factory, repetitions):
+    timings = []
+    for _ in range(repetitions):
+        cache_dir = cache_dir_factory()
+        start = time.perf_counter()
+        parser_factory.build_parser(cache_dir=cache_dir)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def print_timings(name, timings):
+    print(f'{name:<10}min {min(timings) * 1000:8.2f}ms\tmean {sum(timings) / len(timings) * 1000:8.2f}ms')
+
+
+def main(repetitions=10):
+    root_dir = tempfile.mkdtemp()
+    try:
+        warm_cache_dir = tempfile.mkdtemp(dir=root_dir)
+        parser_factory.build_parser(cache_dir=warm_cache_dir)
+        print_timings("no cache", time_construction(lambda: None, repetitions))
+        print_timings("cold", time_construction(lambda: tempfile.mkdtemp(dir=root_dir), repetitions))
+        print_timings("warm", time_construction(lambda: warm_cache_dir, repetitions))
+    finally:
+        shutil.rmtree(root_dir)
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,36 @@
+"""
+times the rule safety check on rules with wide bodies.
+the body of each rule is a chain of ie relations, written in the reverse of the order in which they become safe:
+    head(X0, Xn) <- f<X(n-1)>(Xn), ..., f<X0>(X1), base(X0)
+
+usage (from the repository root):
+    python -m benchmarks.rule_safety [repetitions]
+"""
+import sys
+import time
+
+import lark_passes
+import parser_factory
+
+BODY_SIZES = (10, 100, 1000)
+
+
+def generate_rule(body_size):
+    ie_relations = [f"f<X{idx}>(X{idx + 1})" for idx in reversed(range(body_size - 1))]
+    return f"head(X0, X{body_size - 1}) <- " + ", ".join(ie_relations + ["base(X0)"])
+
+
+def main(repetitions=5):
+    parser = parser_factory.get_parser(normalize_tokens=True)
+    for body_size in BODY_SIZES:
+        rule_tree = parser.parse(generate_rule(body_size) + "\n")
+        timings = []
+        for _ in range(repetitions):
+            start = time.perf_counter()
+            lark_passes.CheckRuleSafetyVisitor().visit(rule_tree)
+            timings.append(time.perf_counter() - start)
+        print(f"{body_size:>5} body atoms\tmin {min(timings) * 1000:8.2f}ms")
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
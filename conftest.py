@@ -0,0 +1,3 @@
+"""
+puts the repository's root on sys.path, so the tests import its modules the way main.py does
+"""
@@ -1,4 +1,7 @@
+import io
+
 import networkx as nx
+import numpy as np
 
 
 class NetxTree(nx.OrderedDiGraph):
@@ -16,26 +19,119 @@ class NetxTree(nx.OrderedDiGraph):
     def get_root(self):
         return self.__root
 
-    def pretty(self, indent_str='  '):
+    def pretty(self, indent_str='  ', out=None):
         """
         prints a representation of the networkx tree.
         Works similarly to lark's pretty() function.
+        If out (a file-like object) is given, the representation is streamed to it and None is returned.
         """
-        return ''.join(self._pretty(self.__root, 0, indent_str))
-
-    def _pretty(self, node, level, indent_str):
-        children = list(self.successors(node))
-        data_attr = nx.get_node_attributes(self, "data")
-        value_attr = nx.get_node_attributes(self, "value")
-        if len(children) == 1 and children[0] not in data_attr:
-            return [indent_str * level, data_attr[node], '\t', '%s' % (value_attr[children[0]],), '\n']
+        if out is None:
+            out = io.StringIO()
+            self._pretty(out, indent_str)
+            return out.getvalue()
+        self._pretty(out, indent_str)
 
-        ret = [indent_str * level, data_attr[node], '\n']
-        for child_node in children:
-            if child_node in data_attr:
-                ret += self._pretty(child_node, level + 1, indent_str)
+    def _pretty(self, out, indent_str, lines_per_write=4096):
+        # an iterative preorder walk that looks at each node's attributes once
+        node_attrs = self.nodes
+        lines = []
+        stack = [(self.__root, 0)]
+        while stack:
+            node, level = stack.pop()
+            attrs = node_attrs[node]
+            if "data" not in attrs:
+                assert "value" in attrs
+                lines.append('%s%s\n' % (indent_str * level, attrs["value"]))
             else:
-                assert child_node in value_attr
-                ret += [indent_str * (level + 1), '%s' % (value_attr[child_node],), '\n']
+                children = list(self.successors(node))
+                if len(children) == 1 and "data" not in node_attrs[children[0]]:
+                    lines.append('%s%s\t%s\n' % (indent_str * level, attrs["data"], node_attrs[children[0]]["value"]))
+                else:
+                    lines.append('%s%s\n' % (indent_str * level, attrs["data"]))
+                    stack.extend((child_node, level + 1) for child_node in reversed(children))
+            if len(lines) >= lines_per_write:
+                out.write(''.join(lines))
+                lines.clear()
+        out.write(''.join(lines))
+
+
+class ArrayTree:
+    """
+    A class that defines a tree that is stored in arrays.
+
+    The nodes are numbered in breadth first order (the same order LarkTreeToNetxTreeConverter uses), so the children
+    of a node are consecutive: node i's children are first_child[i], ..., first_child[i] + child_count[i] - 1.
+    A node is either an inner node, with a label (label_id[i] indexes labels), or a leaf value
+    (value_index[i] indexes values). The missing index is -1 in both cases.
+    Whole tree queries are numpy operations over these arrays.
+    """
+
+    def __init__(self, parent, first_child, child_count, label_id, value_index, labels, values):
+        self.parent = np.asarray(parent, dtype=np.int64)
+        self.first_child = np.asarray(first_child, dtype=np.int64)
+        self.child_count = np.asarray(child_count, dtype=np.int64)
+        self.label_id = np.asarray(label_id, dtype=np.int64)
+        self.value_index = np.asarray(value_index, dtype=np.int64)
+        self.labels = labels
+        self.values = values
+        self._label_to_id = {label: idx for idx, label in enumerate(labels)}
+        self._depths = None
+
+    def __len__(self):
+        return len(self.parent)
+
+    def number_of_nodes(self):
+        return len(self.parent)
+
+    def get_root(self):
+        return 0
+
+    def get_children(self, node):
+        first_child = self.first_child[node]
+        return range(first_child, first_child + self.child_count[node])
 
-        return ret
+    def get_label(self, node):
+        label_id = self.label_id[node]
+        return None if label_id < 0 else self.labels[label_id]
+
+    def get_value(self, node):
+        value_index = self.value_index[node]
+        assert value_index >= 0
+        return self.values[value_index]
+
+    def count_node_types(self):
+        """
+        returns a dictionary of label -> number of nodes with that label
+        """
+        counts = np.bincount(self.label_id[self.label_id >= 0], minlength=len(self.labels))
+        return {label: int(count) for label, count in zip(self.labels, counts)}
+
+    def find_nodes(self, label):
+        """
+        returns an array of the nodes with the given label, e.g. find_nodes("rgx_ie_relation")
+        """
+        if label not in self._label_to_id:
+            return np.empty(0, dtype=np.int64)
+        return np.flatnonzero(self.label_id == self._label_to_id[label])
+
+    def get_depths(self):
+        """
+        returns an array of the depth of each node (the root's depth is 0)
+        """
+        if self._depths is None:
+            # the breadth first order keeps each level in a consecutive range, and the next level is the range of
+            # the children of the current one
+            depths = np.empty(len(self), dtype=np.int64)
+            level_start, level_end, depth = 0, min(1, len(self)), 0
+            while level_start < level_end:
+                depths[level_start:level_end] = depth
+                child_ends = self.first_child[level_start:level_end] + self.child_count[level_start:level_end]
+                level_start, level_end, depth = level_end, max(level_end, int(child_ends.max())), depth + 1
+            self._depths = depths
+        return self._depths
+
+    def get_depth(self):
+        """
+        returns the depth of the tree
+        """
+        return int(self.get_depths().max()) if len(self) else 0
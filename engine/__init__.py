@@ -1,7 +1,22 @@
 # TODO: move stuff to diff files and folders later
+import os
+import pickle
 from abc import ABC, abstractmethod
 
-import networkx as nx
+import ast_nodes
+from engine.document_store import DocumentStore, DocumentView
+from engine.execution import Execution, ExecutionBase
+from engine.fact_import import read_code_arrays
+from engine.index_advisor import DEFAULT_INDEX_MEMORY_BUDGET, IndexAdvisor
+from engine.query_cache import QueryCache, get_query_key
+from engine.relation_store import RelationStore
+from engine.string_dictionary import StringDictionary
+from engine.term_graph import MemoryHeapBase, TermGraph, TermGraphBase
+from lark_passes import TypeEnvironment
+
+# the file of a snapshot directory (see Session.save) that holds everything but the columns of the relations
+SNAPSHOT_FILE_NAME = "session.pickle"
+SNAPSHOT_FORMAT_VERSION = 2
 
 
 class SymbolTableBase(ABC):
@@ -13,6 +28,10 @@ class SymbolTableBase(ABC):
     def remove_variable(self, name):
         pass
 
+    @abstractmethod
+    def get_variable(self, name):
+        pass
+
     @abstractmethod
     def get_all_variables(self):
         pass
@@ -27,98 +46,53 @@ class SymbolTableBase(ABC):
 
 
 class SymbolTable(SymbolTableBase):
-    def __init__(self):
+    def __init__(self, string_dictionary=None):
+        """
+        :param string_dictionary: the string_dictionary.StringDictionary of the session, string values are interned
+            in it.
+        """
         self._var_to_node = {}
+        self.string_dictionary = StringDictionary() if string_dictionary is None else string_dictionary
 
     def add_variable(self, name, data):
+        if type(data) is str:
+            data = self.string_dictionary.intern(data)
         self._var_to_node[name] = data
 
     def remove_variable(self, name):
         del self._var_to_node[name]
 
+    def get_variable(self, name):
+        return self._var_to_node[name]
+
     def get_all_variables(self):
         return ((var, data) for var, data in self._var_to_node.items())
 
 
-class MemoryHeapBase(ABC):
-    @abstractmethod
-    def collect_garbage(self):
-        pass
-
-
-# TODO: the term graph is itself a heap, what use is there to have a separate
-# TODO: structure for it? better just force it to implement heap methods imo
-# TODO: i assume some optimizations would not occur on a single node but rather,
-# TODO: they would happen on the entire term graph (global optimizations)
-# TODO: what interface would be comfy for this purpose?
-class TermGraphBase(MemoryHeapBase):
-    @abstractmethod
-    def add_term(self, name, data):
-        pass
-
-    @abstractmethod
-    def remove_term(self, name):
-        pass
-
-    @abstractmethod
-    def get_node_state(self, name):
-        # for now, computed / not computed / dirty (?)
-        pass
-
-    @abstractmethod
-    def get_term_data(self, name):
-        # will be called to get an AST and send it to the execution engine
-        # or get the result of a node's computation
-        pass
-
-    @abstractmethod
-    def transform_node_data(self, name, transformer):
-        pass
-
-    @abstractmethod
-    def transform_graph(self):
-        pass
-
-
-class TermGraph(TermGraphBase):
-    def __init__(self):
-        self._g = nx.Graph()
-
-    def add_term(self, name, attr: dict):  # attr[state / data]
-        # TODO: attr should have data but not state, we set state to not comp
-        self._g.add_node(node_for_adding=name, attr=attr)
-
-    def remove_term(self, name):
-        self._g.remove_node(name)
-
-    def get_node_state(self, name):
-        return self._g.nodes[name]['state']
-
-    def get_term_data(self, name):
-        return self._g.nodes[name]['data']
-
-    def transform_node_data(self, name, transformer):
-        assert callable(transformer)
-        return transformer(self._g.nodes[name]['data'])
-
-    def collect_garbage(self):
-        super(self).collect_garbage()
-
-    def transform_graph(self):
-        super(self).transform_graph()
-
-
 class SessionBase(ABC):
-    def __init__(self):
+    def __init__(self, index_memory_budget=DEFAULT_INDEX_MEMORY_BUDGET, spill_directory=None):
+        """
+        :param index_memory_budget: the bytes that the indexes the session creates for frequent lookups may take.
+        :param spill_directory: the directory that relations are spilled to (see relation_store.RelationStore).
+        """
         self._st = SymbolTable()
         self._tg = TermGraph()
+        # the documents that the variables assigned with read() are views of
+        self._ds = DocumentStore()
+        # the relations share the symbol table's string dictionary
+        self._rs = RelationStore(spill_directory, self._st.string_dictionary)
+        # the types of the session's variables and relations, shared with the type check of new statements
+        self.type_environment = TypeEnvironment()
+        self._index_advisor = IndexAdvisor(self._rs, index_memory_budget)
+        self._execution = Execution(self._rs, self.type_environment, self._st.get_variable, self._index_advisor,
+                                    self._tg)
 
     @abstractmethod
-    def read_state(self):
+    def read_state(self, name):
         pass
 
     @abstractmethod
-    def update_state(self):  # TODO: probably split to several smaller functions
+    def update_state(self, statement):  # TODO: probably split to several smaller functions
         pass
 
     def __repr__(self):
@@ -133,12 +107,225 @@ class SessionBase(ABC):
 
 
 class Session(SessionBase):
-    pass
-
-
-class ExecutionBase:
-    pass
+    """
+    executes checked statements (see ast_nodes) one at a time.
+
+    the results of queries are cached (see query_cache.QueryCache) until a relation or a variable they depend on
+    changes.
+    """
+
+    def __init__(self, index_memory_budget=DEFAULT_INDEX_MEMORY_BUDGET, memory_budget=None, spill_directory=None):
+        """
+        :param memory_budget: the bytes that the relations in memory may take (estimated, see
+            relation_store.ColumnarRelation.get_memory_usage), garbage is collected whenever a statement leaves them
+            over it. None for no budget.
+        """
+        super().__init__(index_memory_budget, spill_directory)
+        self.memory_budget = memory_budget
+        self._query_cache = QueryCache()
+
+    def read_state(self, name):
+        return self._st.get_variable(name)
+
+    def update_state(self, statement):
+        """
+        :return: the result of a query (see Execution.query), None for other statements
+        """
+        result = getattr(self, "_update_" + statement.data)(statement)
+        self._enforce_memory_budget()
+        return result
+
+    def import_facts(self, relation_name, path, delimiter=None, has_header=False):
+        """
+        adds the rows of a delimited text file (see fact_import) to a declared relation at once, without parsing a
+        statement per fact. every field is validated against the relation's schema before any row is added, rows
+        that are already in the relation are skipped.
+        the relations derived from the relation are computed again when they are next needed, rather than
+        maintained row by row.
+        :param delimiter: the delimiter of the fields, a tab for a .tsv file and a comma for any other file if not
+            given.
+        :param has_header: whether the first line of the file is a header.
+        :return: the number of rows that were added
+        """
+        if relation_name not in self._rs or self._execution.is_derived_relation(relation_name):
+            raise ValueError("relation " + relation_name + " is not a declared relation")
+        relation = self._rs.get_relation(relation_name)
+        code_arrays = read_code_arrays(path, relation.schema, self._st.string_dictionary, delimiter, has_header)
+        added_count = len(relation.add_code_arrays(code_arrays))
+        if added_count:
+            self._on_relation_changed(relation_name)
+        self._enforce_memory_budget()
+        return added_count
+
+    def _enforce_memory_budget(self):
+        if self.memory_budget is not None and self._rs.get_memory_usage() > self.memory_budget:
+            self.collect_garbage()
 
-
-class Execution(ExecutionBase):
-    pass
+    def collect_garbage(self):
+        """
+        drops the relations that were computed for rules but are stale (see term_graph.TermGraph.collect_garbage),
+        closes the documents that no variable is a view of, and spills the least recently used relations to files
+        until the relations in memory fit in the memory budget. a spilled relation is read back when it is used.
+        """
+        for relation_name in self._tg.collect_garbage():
+            if relation_name in self._rs:
+                self._rs.remove_relation(relation_name)
+        self._ds.collect_garbage([value.document for _, value in self._st.get_all_variables()
+                                  if isinstance(value, DocumentView)])
+        if self.memory_budget is not None:
+            for relation_name in self._rs.enforce_memory_budget(self.memory_budget):
+                self._execution.on_relation_spilled(relation_name)
+
+    def close(self):
+        """
+        closes the session's documents and removes the files of its spilled relations
+        """
+        self._ds.close()
+        self._rs.close()
+
+    def save(self, directory):
+        """
+        writes a snapshot of the session to a directory (created if needed), that load() restores without running the
+        program again: a file of each relation's columns (see relation_store.ColumnarRelation.save_columns), and a
+        file of the variables, the string dictionary, the types, the rules and the relations' schemas.
+        the derived relations that are not up to date are not saved, they are computed again after the restore.
+        the files are written next to their final paths and then moved over them, so a session that maps the
+        files of an older snapshot in the directory is not affected.
+        """
+        os.makedirs(directory, exist_ok=True)
+        variables = []
+        documents = []
+        for var_name, value in self._st.get_all_variables():
+            if isinstance(value, DocumentView):
+                documents.append((var_name, value.document.path, value.start, value.stop))
+            else:
+                variables.append((var_name, value))
+        derived_relation_names = self._execution.get_derived_relation_names()
+        relations = []
+        for relation in self._rs.get_relations():
+            if not self._execution.is_computed(relation.name):
+                continue
+            file_name = "relation-" + str(len(relations)) + ".npy"
+            self._write_snapshot_file(os.path.join(directory, file_name), relation.save_columns)
+            relations.append((relation.name, relation.schema, file_name, relation.name in derived_relation_names))
+        snapshot = {
+            "version": SNAPSHOT_FORMAT_VERSION,
+            "strings": self._st.string_dictionary.strings,
+            "variables": variables,
+            "documents": documents,
+            "type_environment": self.type_environment,
+            "rules": [rule for relation_name in derived_relation_names
+                      for rule in self._execution.get_rules(relation_name)],
+            "relations": relations
+        }
+        self._write_snapshot_file(os.path.join(directory, SNAPSHOT_FILE_NAME),
+                                  lambda file: pickle.dump(snapshot, file, protocol=pickle.HIGHEST_PROTOCOL))
+
+    @staticmethod
+    def _write_snapshot_file(path, write):
+        temporary_path = path + ".tmp"
+        with open(temporary_path, "wb") as file:
+            write(file)
+        os.replace(temporary_path, path)
+
+    @classmethod
+    def load(cls, directory, index_memory_budget=DEFAULT_INDEX_MEMORY_BUDGET, memory_budget=None,
+             spill_directory=None):
+        """
+        restores a session from a snapshot that save() wrote. the columns of the relations are memory mapped (copy on
+        write) rather than read, so restoring takes about the time of reading the strings, and a relation's pages
+        are only read when it is used. the documents of the variables assigned with read() are read again from their
+        paths.
+        :return: a new Session
+        """
+        with open(os.path.join(directory, SNAPSHOT_FILE_NAME), "rb") as file:
+            snapshot = pickle.load(file)
+        if snapshot.get("version") != SNAPSHOT_FORMAT_VERSION:
+            raise ValueError("the snapshot in " + directory + " has an unsupported format version: " +
+                             str(snapshot.get("version")))
+        session = cls(index_memory_budget, memory_budget, spill_directory)
+        session._st.string_dictionary.extend(snapshot["strings"])
+        for var_name, value in snapshot["variables"]:
+            session._st.add_variable(var_name, value)
+        for var_name, path, start, stop in snapshot["documents"]:
+            session._st.add_variable(var_name, session._ds.read(path).get_view(start, stop))
+        session.type_environment.copy_from(snapshot["type_environment"])
+        for rule in snapshot["rules"]:
+            session._execution.add_rule(rule)
+        for relation_name, schema, file_name, is_derived in snapshot["relations"]:
+            session._rs.declare(relation_name, schema).map_columns(os.path.join(directory, file_name))
+            if is_derived:
+                session._execution.on_relation_restored(relation_name)
+        return session
+
+    def get_relation(self, name):
+        """
+        :return: the relation_store.ColumnarRelation of a relation, a relation that rules define is computed first
+        """
+        return self._execution.get_relation(name)
+
+    def _get_term_value(self, term):
+        if type(term) is ast_nodes.VarName:
+            return self._st.get_variable(term.name)
+        return term
+
+    def _get_row_value(self, term):
+        """
+        the value of a term in a row of a relation, which holds the text of a document rather than a view of it
+        """
+        value = self._get_term_value(term)
+        return value.get_text() if isinstance(value, DocumentView) else value
+
+    def _update_assignment(self, statement):
+        self._st.add_variable(statement.var_name, self._get_term_value(statement.value))
+        self._on_variable_changed(statement.var_name)
+
+    def _update_read_assignment(self, statement):
+        path = self._get_term_value(statement.path)
+        if isinstance(path, DocumentView):
+            path = path.get_text()
+        self._st.add_variable(statement.var_name, self._ds.read(path))
+        self._on_variable_changed(statement.var_name)
+
+    def _get_fact_row(self, statement):
+        return tuple(self._get_row_value(term) for term in statement.terms)
+
+    def _on_relation_changed(self, relation_name, inserted_rows=None, deleted_rows=None):
+        self._execution.on_relation_changed(relation_name, inserted_rows, deleted_rows)
+        self._query_cache.invalidate_relation(relation_name)
+
+    def _on_variable_changed(self, var_name):
+        self._execution.on_variable_changed(var_name)
+        self._query_cache.invalidate_variable(var_name)
+
+    def _update_relation_declaration(self, statement):
+        self._rs.declare(statement.name, statement.schema)
+
+    def _update_add_fact(self, statement):
+        relation = self._rs.get_relation(statement.name)
+        row = relation.encode_row(self._get_fact_row(statement), add=True)
+        if row is None:
+            raise ValueError("the fact " + str(self._get_fact_row(statement)) +
+                             " does not fit the schema of relation " + statement.name)
+        if relation.add_internal(row):
+            self._on_relation_changed(statement.name, inserted_rows=(row,))
+
+    def _update_remove_fact(self, statement):
+        relation = self._rs.get_relation(statement.name)
+        row = relation.encode_row(self._get_fact_row(statement))
+        if row is not None and relation.remove_internal(row):
+            self._on_relation_changed(statement.name, deleted_rows=(row,))
+
+    def _update_rule(self, statement):
+        self._execution.add_rule(statement)
+        self._query_cache.invalidate_relation(statement.head_name)
+
+    def _update_query(self, statement):
+        relation = statement.relation
+        key = get_query_key(relation.name, [term if type(term) is ast_nodes.FreeVar else self._get_row_value(term)
+                                            for term in relation.terms])
+        result = self._query_cache.get(key)
+        if result is None:
+            result = self._execution.query(statement)
+            self._query_cache.put(key, result, *self._execution.get_dependencies(relation.name))
+        return result
@@ -0,0 +1,222 @@
+import hashlib
+import mmap
+import os
+
+# the size of the blocks that are hashed at a time, hashing a document does not read more than this into memory
+HASH_BLOCK_SIZE = 1 << 20
+
+
+def get_stat_key(path):
+    """
+    :return: what tells the versions of a file apart: its inode, its size and its modification time. raises
+        FileNotFoundError like open() would.
+    """
+    stat = os.stat(path)
+    return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+
+class Document:
+    """
+    a file that is mapped into memory the first time its content is needed.
+    the mapping is read only, so the pages of the file are shared with the os page cache (and with any other
+    process that maps the file), and only the pages that are actually read are loaded.
+    """
+
+    def __init__(self, path, size, stat_key=None):
+        """
+        :param stat_key: the get_stat_key() of the file when it was read.
+        """
+        self.path = path
+        self.size = size
+        self.stat_key = stat_key
+        self._file = None
+        self._mmap = None
+        self._buffer = None
+        self._content_hash = None
+
+    def is_open(self):
+        return self._buffer is not None
+
+    def get_buffer(self):
+        """
+        :return: a read only memoryview of the whole document, the file is mapped on the first call
+        """
+        if self._buffer is None:
+            if self.size == 0:
+                # an empty file can not be mapped
+                self._buffer = memoryview(b"")
+            else:
+                self._file = open(self.path, 'rb')
+                # only the size that was read is mapped, mapping a file that was truncated since then fails here
+                # rather than reading past its end
+                self._mmap = mmap.mmap(self._file.fileno(), self.size, access=mmap.ACCESS_READ)
+                self._buffer = memoryview(self._mmap)
+        return self._buffer
+
+    def get_content_hash(self):
+        """
+        :return: the blake2b digest of the document's content, computed once
+        """
+        if self._content_hash is None:
+            buffer = self.get_buffer()
+            content_hash = hashlib.blake2b()
+            for block_start in range(0, len(buffer), HASH_BLOCK_SIZE):
+                content_hash.update(buffer[block_start:block_start + HASH_BLOCK_SIZE])
+            self._content_hash = content_hash.digest()
+        return self._content_hash
+
+    def is_changed(self):
+        """
+        :return: whether the file was changed (or removed) since the document was read
+        """
+        try:
+            return get_stat_key(self.path) != self.stat_key
+        except OSError:
+            return True
+
+    def close(self):
+        """
+        unmaps the document, the views of the document must not be used after this
+        """
+        if self._buffer is None:
+            return
+        self._buffer.release()
+        self._buffer = None
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                # a buffer of the document is still in use, the mapping is released with the last buffer
+                pass
+            self._file.close()
+            self._mmap = None
+            self._file = None
+
+    def __repr__(self):
+        return "Document(" + repr(self.path) + ", " + str(self.size) + " bytes)"
+
+
+class DocumentView:
+    """
+    a range of bytes of a document, the value of a variable that was assigned with read().
+    creating and copying views does not copy the document, the content is only read when it is used.
+    """
+    __slots__ = ("document", "start", "stop")
+
+    def __init__(self, document, start=0, stop=None):
+        self.document = document
+        self.start = start
+        self.stop = document.size if stop is None else stop
+
+    def __len__(self):
+        return self.stop - self.start
+
+    def get_view(self, start, stop=None):
+        """
+        :return: a view of a part of this view, start and stop are relative to this view
+        """
+        stop = len(self) if stop is None else stop
+        assert 0 <= start <= stop <= len(self)
+        return DocumentView(self.document, self.start + start, self.start + stop)
+
+    def get_buffer(self):
+        """
+        :return: a read only memoryview of the view's bytes, without copying them
+        """
+        return self.document.get_buffer()[self.start:self.stop]
+
+    def get_bytes(self):
+        return self.get_buffer().tobytes()
+
+    def get_text(self, encoding="utf-8"):
+        return str(self.get_buffer(), encoding)
+
+    def __eq__(self, other):
+        return type(other) is DocumentView and self.document is other.document \
+            and self.start == other.start and self.stop == other.stop
+
+    def __hash__(self):
+        return hash((id(self.document), self.start, self.stop))
+
+    def __repr__(self):
+        return "DocumentView(" + repr(self.document.path) + ", [" + str(self.start) + ", " + str(self.stop) + "))"
+
+
+class DocumentStore:
+    """
+    the documents that a session read, each file is opened (and mapped) at most once.
+
+    documents are deduplicated by their real path (so links and relative paths to the same file share a document)
+    and by their content: when a file has the size of a document that is already in the store, the contents are
+    hashed and a file with the same content as a stored document shares it. files of a size that no other document
+    has are never hashed.
+    every read stats the file, and a file that was changed since its document was read (its inode, size or
+    modification time differ) gets a new document. the views of the old document are left as they are.
+    """
+
+    def __init__(self):
+        # real path -> (the get_stat_key() of the file when it was read, its document)
+        self._path_to_document = dict()
+        self._size_to_documents = dict()
+
+    def read(self, path):
+        """
+        :return: a view of the whole document at path. the file is not read until the view's content is used.
+        """
+        return DocumentView(self.get_document(path))
+
+    def get_document(self, path):
+        real_path = os.path.realpath(path)
+        stat_key = get_stat_key(real_path)
+        stat_key_and_document = self._path_to_document.get(real_path)
+        if stat_key_and_document is not None and stat_key_and_document[0] == stat_key:
+            return stat_key_and_document[1]
+        size = stat_key[1]
+        document = Document(real_path, size, stat_key)
+        same_size_documents = self._size_to_documents.setdefault(size, [])
+        for same_size_document in same_size_documents:
+            # the content of a document whose file was changed is not the content it was read with
+            if not same_size_document.is_changed() and \
+                    same_size_document.get_content_hash() == document.get_content_hash():
+                document.close()
+                document = same_size_document
+                break
+        else:
+            same_size_documents.append(document)
+        self._path_to_document[real_path] = (stat_key, document)
+        return document
+
+    def get_documents(self):
+        """
+        :return: the distinct documents in the store
+        """
+        return [document for documents in self._size_to_documents.values() for document in documents]
+
+    def collect_garbage(self, referenced_documents):
+        """
+        closes and forgets the documents that are not in referenced_documents (e.g. the documents that no variable
+        is a view of anymore).
+        :return: the number of documents that were closed
+        """
+        referenced_ids = {id(document) for document in referenced_documents}
+        closed_count = 0
+        for size, documents in list(self._size_to_documents.items()):
+            kept_documents = [document for document in documents if id(document) in referenced_ids]
+            for document in documents:
+                if id(document) not in referenced_ids:
+                    document.close()
+                    closed_count += 1
+            if kept_documents:
+                self._size_to_documents[size] = kept_documents
+            else:
+                del self._size_to_documents[size]
+        self._path_to_document = {path: (stat_key, document)
+                                  for path, (stat_key, document) in self._path_to_document.items()
+                                  if id(document) in referenced_ids}
+        return closed_count
+
+    def close(self):
+        for document in self.get_documents():
+            document.close()
+        self._path_to_document.clear()
+        self._size_to_documents.clear()
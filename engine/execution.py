@@ -0,0 +1,825 @@
+from abc import ABC, abstractmethod
+from collections import Counter
+
+import ast_nodes
+from engine.document_store import DocumentView
+from engine.planner import CROSS_PRODUCT, HASH_JOIN, INDEX_NESTED_LOOP, plan_rule_body
+from engine.regex_ie import extract_spans
+from engine.relation_store import RelationStatistics
+from engine.term_graph import COMPUTED, DIRTY, NOT_COMPUTED, TermGraph
+
+
+class ExecutionBase(ABC):
+    @abstractmethod
+    def add_rule(self, rule):
+        pass
+
+    @abstractmethod
+    def on_relation_changed(self, relation_name):
+        pass
+
+    @abstractmethod
+    def on_variable_changed(self, var_name):
+        pass
+
+    @abstractmethod
+    def get_relation(self, relation_name):
+        pass
+
+    @abstractmethod
+    def query(self, query):
+        pass
+
+
+class _StoredIndexProbe:
+    """
+    looks up the rows of a stored relation by a key of (internal) values in some of its columns (with one of its
+    hash indexes, its row keys when the key holds every column, or else a scan of the code arrays of the columns), in
+    the interface of the indexes of an EvalRelation (a dict from keys of values to lists of rows)
+    """
+
+    def __init__(self, relation, column_indices):
+        self._relation = relation
+        self._column_indices = column_indices
+
+    def get(self, key, default=None):
+        row_idxs = self._relation.lookup_internal(dict(zip(self._column_indices, key)))
+        if not len(row_idxs):
+            return default
+        return list(self._relation.iter_internal_rows(row_idxs))
+
+
+def select_rows(rows, column_indices, keys):
+    """
+    :param keys: the tuples of values of the given columns to select, in a collection with fast membership checks
+        (e.g. a set or the keys of a dict).
+    :return: a list of the rows that hold the values of one of the keys
+    """
+    return [row for row in rows if tuple(row[column_idx] for column_idx in column_indices) in keys]
+
+
+class EvalRelation:
+    """
+    the rows of a relation during an evaluation, with hash indexes over the columns that the joins look up.
+    the indexes are kept up to date as rows are added, so a fixpoint iteration does not rebuild them.
+
+    the rows are in the internal form of relation_store (ints for strings and (start, stop) tuples for spans).
+    the EvalRelation of a stored relation (a relation_store.ColumnarRelation) never copies its rows: it probes the
+    stored relation's own indexes (and asks the index advisor for the indexes it lacks), and when the advisor does
+    not index the stored relation (e.g. the index would not fit in its budget) it scans the code arrays of the bound
+    columns, so only the matching rows are read.
+    """
+
+    def __init__(self, rows=(), statistics=None, stored_relation=None, index_advisor=None):
+        """
+        :param statistics: the relation_store.RelationStatistics of rows, if they are known.
+        :param stored_relation: a relation_store.ColumnarRelation that holds the rows (rows is ignored).
+        :param index_advisor: the index_advisor.IndexAdvisor that indexes the stored relation.
+        """
+        self.stored_relation = stored_relation
+        self._index_advisor = index_advisor
+        self._rows = None if stored_relation is not None else set(rows)
+        # tuple of column indices -> {tuple of values -> list of rows}
+        self._indexes = dict()
+        self._statistics = statistics
+        # the number of rows when the distinct counts were computed
+        self._statistics_size = 0 if statistics is None else statistics.cardinality
+
+    @property
+    def rows(self):
+        assert self.stored_relation is None, "the rows of a stored relation are read through get_matching_rows()"
+        return self._rows
+
+    def __len__(self):
+        return len(self.stored_relation) if self.stored_relation is not None else len(self._rows)
+
+    def _has_stored_index(self, column_indices):
+        return column_indices in self.stored_relation.indexes or \
+            len(column_indices) == len(self.stored_relation.schema)
+
+    def has_index(self, column_indices):
+        if self.stored_relation is not None:
+            return self._has_stored_index(column_indices)
+        return column_indices in self._indexes
+
+    def get_statistics(self):
+        """
+        the distinct counts are computed again only when the relation has doubled since they were computed, so
+        keeping them costs O(1) amortized per added row
+        """
+        if self.stored_relation is not None:
+            return self.stored_relation.get_statistics()
+        if not self.rows:
+            return RelationStatistics(0, ())
+        if self._statistics is None or len(self.rows) > 2 * self._statistics_size:
+            width = len(next(iter(self.rows)))
+            self._statistics = RelationStatistics(
+                len(self.rows), [len({row[column_idx] for row in self.rows}) for column_idx in range(width)])
+            self._statistics_size = len(self.rows)
+        if self._statistics.cardinality != len(self.rows):
+            self._statistics = RelationStatistics(len(self.rows), self._statistics.distinct_counts)
+        return self._statistics
+
+    def get_index(self, column_indices):
+        """
+        :return: an index over the given columns, that maps a tuple of their values to a list of the rows that hold
+            them (with a get(key, default) method)
+        """
+        if self.stored_relation is not None:
+            if not self._has_stored_index(column_indices) and self._index_advisor is not None:
+                self._index_advisor.require_index(self.stored_relation, column_indices)
+            return _StoredIndexProbe(self.stored_relation, column_indices)
+        index = self._indexes.get(column_indices)
+        if index is None:
+            index = dict()
+            for row in self._rows:
+                index.setdefault(tuple(row[column_idx] for column_idx in column_indices), []).append(row)
+            self._indexes[column_indices] = index
+        return index
+
+    def get_matching_rows(self, column_indices, keys):
+        """
+        :param keys: the tuples of values of the given columns to match, see select_rows.
+        :return: an iterable of the rows that hold the values of one of the keys (every row if no column is given)
+        """
+        if self.stored_relation is not None:
+            if not column_indices:
+                return self.stored_relation.iter_internal_rows()
+            return self.stored_relation.iter_internal_rows(
+                self.stored_relation.lookup_keys_internal(column_indices, keys))
+        if not column_indices:
+            return self._rows
+        index = self._indexes.get(column_indices)
+        if index is not None:
+            return [row for key in keys for row in index.get(key, ())]
+        return select_rows(self._rows, column_indices, keys)
+
+    def add(self, rows):
+        """
+        :return: the set of rows that were not in the relation
+        """
+        assert self.stored_relation is None, "a stored relation is changed through the relation store"
+        new_rows = set(rows) - self.rows if self.rows else set(rows)
+        self.rows.update(new_rows)
+        for column_indices, index in self._indexes.items():
+            for row in new_rows:
+                index.setdefault(tuple(row[column_idx] for column_idx in column_indices), []).append(row)
+        return new_rows
+
+
+class _OldIndex:
+    def __init__(self, index, inserted_rows, deleted_index):
+        self._index = index
+        self._inserted_rows = inserted_rows
+        self._deleted_index = deleted_index
+
+    def get(self, key, default=None):
+        rows = [row for row in self._index.get(key, ()) if row not in self._inserted_rows]
+        rows.extend(self._deleted_index.get(key, ()))
+        return rows if rows else default
+
+
+class _OldEvalRelation:
+    """
+    the rows that a relation held before some rows were inserted into it and others were deleted from it, in the
+    interface of EvalRelation (and on top of the EvalRelation of its current rows)
+    """
+
+    def __init__(self, eval_relation, inserted_rows, deleted_rows):
+        self._eval_relation = eval_relation
+        self._inserted_rows = inserted_rows
+        self._deleted_rows = EvalRelation(deleted_rows)
+
+    def __len__(self):
+        return len(self._eval_relation) - len(self._inserted_rows) + len(self._deleted_rows)
+
+    def has_index(self, column_indices):
+        return self._eval_relation.has_index(column_indices)
+
+    def get_statistics(self):
+        return self._eval_relation.get_statistics()
+
+    def get_index(self, column_indices):
+        return _OldIndex(self._eval_relation.get_index(column_indices), self._inserted_rows,
+                         self._deleted_rows.get_index(column_indices))
+
+    def get_matching_rows(self, column_indices, keys):
+        rows = [row for row in self._eval_relation.get_matching_rows(column_indices, keys)
+                if row not in self._inserted_rows]
+        rows.extend(self._deleted_rows.get_matching_rows(column_indices, keys))
+        return rows
+
+
+def get_rule_var_names(rule):
+    """
+    :return: the names of the variables that a rule's body uses (as constants or as the documents of ie relations)
+    """
+    var_names = set()
+    for relation in rule.body:
+        if type(relation) is ast_nodes.Relation:
+            terms = relation.terms
+        else:
+            terms = relation.input_terms + relation.output_terms
+            if type(relation) is ast_nodes.RgxIERelation:
+                var_names.add(relation.document.name)
+        var_names.update(term.name for term in terms if type(term) is ast_nodes.VarName)
+    return var_names
+
+
+class Execution(ExecutionBase):
+    """
+    evaluates rules bottom up, with semi-naive iteration, and maintains the relations they compute incrementally.
+
+    the relations that rules define (derived relations) are computed when they are needed (by a query, or by a rule
+    that uses them), stratum by stratum: the derived relations are grouped into strongly connected components of
+    the rule dependency graph (the term graph), and the components are computed in topological order. in a component
+    of recursive rules, every iteration only joins the rows that the previous iteration derived (the delta) with the
+    full relations, so each iteration costs in proportion to its new rows, not to the whole relations.
+
+    the computed relations are kept in the relation store. a change of the rows of a relation makes the computed
+    relations that depend on it dirty (see term_graph.TermGraph), and the changes are applied to them the next time
+    they are needed, by joining only the changed rows with the other relations of each rule (through indexes):
+    a relation of non recursive rules keeps the number of derivations of each of its rows (counting), and a stratum
+    of recursive rules deletes every row that a deleted row took part in deriving, derives the ones that still have
+    another derivation again, and then adds the rows that the inserted rows derive (delete and rederive, dred).
+    a new rule or a change of a variable that rules use makes the relations not computed, to be computed again.
+    """
+
+    def __init__(self, relation_store, type_environment, get_variable, index_advisor=None, term_graph=None):
+        """
+        :param relation_store: the relation_store.RelationStore of the base relations, the derived relations are
+            stored in it as well.
+        :param type_environment: the lark_passes.TypeEnvironment that holds the schemas of the derived relations.
+        :param get_variable: returns the value of a variable by its name.
+        :param index_advisor: an index_advisor.IndexAdvisor that is told the columns that queries and rule bodies
+            bind in the stored relations, None to not index them automatically.
+        :param term_graph: the term_graph.TermGraph that holds the rules and the state of each relation.
+        """
+        self._relation_store = relation_store
+        self._string_dictionary = relation_store.string_dictionary
+        self._index_advisor = index_advisor
+        self._type_environment = type_environment
+        self._get_variable = get_variable
+        self._term_graph = TermGraph() if term_graph is None else term_graph
+        # variable name -> the derived relations whose rules use the variable
+        self._var_to_relations = dict()
+        # derived relation name -> {row -> the number of its derivations}, for the relations of non recursive rules
+        self._derivation_counts = dict()
+        # relation name -> (inserted rows, deleted rows) since the dirty relations were last maintained
+        self._pending_changes = dict()
+
+    def add_rule(self, rule):
+        if self.is_derived_relation(rule.head_name):
+            self._term_graph.get_term_data(rule.head_name).append(rule)
+        else:
+            self._term_graph.add_term(rule.head_name, [rule])
+        for relation_name in rule.get_body_relation_names():
+            self._term_graph.add_base_term(relation_name)
+            self._term_graph.add_dependency(relation_name, rule.head_name)
+        for var_name in get_rule_var_names(rule):
+            self._var_to_relations.setdefault(var_name, set()).add(rule.head_name)
+        self._invalidate(rule.head_name)
+
+    def is_derived_relation(self, relation_name):
+        return relation_name in self._term_graph and self._term_graph.get_term_data(relation_name) is not None
+
+    def get_rules(self, relation_name):
+        return self._term_graph.get_term_data(relation_name) if self.is_derived_relation(relation_name) else []
+
+    def get_derived_relation_names(self):
+        return [name for name in self._term_graph.get_terms() if self.is_derived_relation(name)]
+
+    def is_computed(self, relation_name):
+        """
+        :return: whether the rows of a relation in the relation store are up to date (always true for a base relation)
+        """
+        return relation_name not in self._term_graph or self._term_graph.get_node_state(relation_name) == COMPUTED
+
+    def on_relation_restored(self, relation_name):
+        """
+        marks a derived relation whose computed rows were put back in the relation store (e.g. from a snapshot) as
+        computed. its derivation counts are not restored, so if it has to be maintained it is computed again instead
+        (like a spilled relation).
+        """
+        self._term_graph.set_node_state(relation_name, COMPUTED)
+
+    def get_dependency_graph(self):
+        return self._term_graph.get_graph()
+
+    def get_dependencies(self, relation_name):
+        """
+        :return: (the relations that a relation is derived from, including itself, the variables that the rules of
+            those relations use)
+        """
+        if relation_name not in self._term_graph:
+            return {relation_name}, set()
+        relation_names = self._term_graph.get_dependencies(relation_name) | {relation_name}
+        var_names = {var_name for name in relation_names for rule in self.get_rules(name)
+                     for var_name in get_rule_var_names(rule)}
+        return relation_names, var_names
+
+    def _invalidate(self, relation_name):
+        for name in self._term_graph.invalidate(relation_name):
+            self._derivation_counts.pop(name, None)
+
+    def on_relation_changed(self, relation_name, inserted_rows=None, deleted_rows=None):
+        """
+        marks the derived relations that depend on a relation as dirty, so the changed rows are applied to them when
+        they are needed. if the changed rows are not given, the relations are marked as not computed.
+        """
+        if relation_name not in self._term_graph:
+            return
+        if inserted_rows is None and deleted_rows is None:
+            for name in self._term_graph.get_dependents(relation_name):
+                self._invalidate(name)
+            return
+        if not self._term_graph.mark_dirty(relation_name):
+            return
+        pending_inserted_rows, pending_deleted_rows = self._pending_changes.setdefault(relation_name, (set(), set()))
+        for row in inserted_rows or ():
+            if row in pending_deleted_rows:
+                pending_deleted_rows.remove(row)
+            else:
+                pending_inserted_rows.add(row)
+        for row in deleted_rows or ():
+            if row in pending_inserted_rows:
+                pending_inserted_rows.remove(row)
+            else:
+                pending_deleted_rows.add(row)
+
+    def on_relation_spilled(self, relation_name):
+        """
+        drops the derivation counts of a relation whose rows were spilled from memory, if the relation has to be
+        maintained later it is computed again instead
+        """
+        self._derivation_counts.pop(relation_name, None)
+
+    def on_variable_changed(self, var_name):
+        """
+        marks the derived relations whose rules use a variable (and the relations that depend on them) as not computed
+        """
+        for relation_name in self._var_to_relations.get(var_name, ()):
+            self._invalidate(relation_name)
+
+    def get_relation(self, relation_name):
+        """
+        :return: the relation_store.ColumnarRelation of a relation, computed (or maintained) if it is a derived
+            relation
+        """
+        if self.is_derived_relation(relation_name):
+            if self._pending_changes:
+                self._maintain()
+            if self._term_graph.get_node_state(relation_name) != COMPUTED:
+                self._compute(relation_name)
+        return self._relation_store.get_relation(relation_name)
+
+    def query(self, query):
+        """
+        :return: a list of the distinct tuples of values of the query's free variables (in the order of their first
+            appearance) that the query's relation holds
+        """
+        relation = self.get_relation(query.relation.name)
+        bindings = dict()
+        free_var_to_columns = dict()
+        for column_idx, term in enumerate(query.relation.terms):
+            if type(term) is ast_nodes.FreeVar:
+                free_var_to_columns.setdefault(term.name, []).append(column_idx)
+            else:
+                bindings[column_idx] = self._get_constant_value(term, add=False)
+                if bindings[column_idx] is None:
+                    # a string that is in no relation
+                    return []
+        if self._index_advisor is not None:
+            self._index_advisor.record_access(relation, bindings)
+        results = []
+        seen_results = set()
+        for row_idx in relation.lookup_internal(bindings).tolist():
+            row = relation.get_row(row_idx)
+            if any(row[column_idx] != row[columns[0]] for columns in free_var_to_columns.values()
+                   for column_idx in columns[1:]):
+                continue
+            result = tuple(row[columns[0]] for columns in free_var_to_columns.values())
+            if result not in seen_results:
+                seen_results.add(result)
+                results.append(result)
+        return results
+
+    def _get_constant_text(self, term):
+        if type(term) is ast_nodes.VarName:
+            value = self._get_variable(term.name)
+            # a relation holds the text of a document, not a view of it
+            return value.get_text() if isinstance(value, DocumentView) else value
+        return term
+
+    def _get_constant_value(self, term, add=True):
+        """
+        :return: the value of a constant term in internal form (see relation_store), None if it is a string that is
+            not in the string dictionary and add is False
+        """
+        value = self._get_constant_text(term)
+        if type(value) is str:
+            return self._string_dictionary.get_id(value, add)
+        if type(value) is ast_nodes.Span:
+            return value.start, value.stop
+        return value
+
+    def _compute(self, relation_name):
+        """
+        computes a derived relation and the derived relations it depends on that are not computed
+        """
+        needed_relations = [name for name in self._term_graph.get_dependencies(relation_name) | {relation_name}
+                            if self.is_derived_relation(name) and
+                            self._term_graph.get_node_state(name) == NOT_COMPUTED]
+        eval_relations = dict()
+        for stratum in self._term_graph.get_strata(needed_relations):
+            self._compute_stratum(stratum, eval_relations)
+            for name in stratum:
+                self._store_relation(name, eval_relations[name].rows)
+                self._term_graph.set_node_state(name, COMPUTED)
+
+    def _store_relation(self, relation_name, rows):
+        if relation_name in self._relation_store:
+            self._relation_store.remove_relation(relation_name)
+        relation = self._relation_store.declare(relation_name,
+                                                self._type_environment.relation_name_to_schema[relation_name])
+        for row in rows:
+            relation.add_internal(row)
+
+    def _get_stored_eval_relation(self, relation_name):
+        return EvalRelation(stored_relation=self.get_relation(relation_name), index_advisor=self._index_advisor)
+
+    def _get_eval_relation(self, relation_name, eval_relations):
+        eval_relation = eval_relations.get(relation_name)
+        if eval_relation is None:
+            eval_relation = self._get_stored_eval_relation(relation_name)
+            eval_relations[relation_name] = eval_relation
+        return eval_relation
+
+    def _get_body_eval_relations(self, rule, eval_relations, delta_idx=None, delta_rows=None):
+        return [None if type(relation) is not ast_nodes.Relation
+                else delta_rows if relation_idx == delta_idx
+                else self._get_eval_relation(relation.name, eval_relations)
+                for relation_idx, relation in enumerate(rule.body)]
+
+    def _compute_stratum(self, stratum, eval_relations):
+        for relation_name in stratum:
+            eval_relations[relation_name] = EvalRelation()
+        rules = [rule for relation_name in stratum for rule in self.get_rules(relation_name)]
+        extraction_cache = dict()
+        is_recursive = self._term_graph.is_recursive(stratum)
+        derived_rows = {relation_name: [] for relation_name in stratum}
+        for rule in rules:
+            derived_rows[rule.head_name].extend(self._evaluate_rule(
+                rule, self._get_body_eval_relations(rule, eval_relations), extraction_cache))
+        if not is_recursive:
+            # count the derivations of each row, to maintain the relation when the relations it depends on change
+            for relation_name, rows in derived_rows.items():
+                self._derivation_counts[relation_name] = Counter(rows)
+        deltas = {relation_name: eval_relations[relation_name].add(rows)
+                  for relation_name, rows in derived_rows.items()}
+        if not is_recursive:
+            return
+        # only the rules with a relation of the stratum in their body derive new rows after the first iteration
+        recursive_rules = [rule for rule in rules if any(name in stratum for name in rule.get_body_relation_names())]
+        while any(deltas.values()):
+            derived_rows = {relation_name: set() for relation_name in stratum}
+            for rule in recursive_rules:
+                for relation_idx, relation in enumerate(rule.body):
+                    if type(relation) is ast_nodes.Relation and deltas.get(relation.name):
+                        derived_rows[rule.head_name].update(self._evaluate_rule(
+                            rule, self._get_body_eval_relations(rule, eval_relations, relation_idx,
+                                                                deltas[relation.name]),
+                            extraction_cache, relation_idx))
+            deltas = {relation_name: eval_relations[relation_name].add(rows)
+                      for relation_name, rows in derived_rows.items()}
+
+    def _maintain(self):
+        """
+        applies the pending changes to the dirty relations, stratum by stratum
+        """
+        changes = self._pending_changes
+        self._pending_changes = dict()
+        eval_relations = dict()
+        extraction_cache = dict()
+        for stratum in self._term_graph.get_strata(self._term_graph.get_terms(DIRTY)):
+            if any(self._term_graph.get_node_state(relation_name) != DIRTY for relation_name in stratum):
+                # invalidated by a relation it depends on
+                continue
+            if self._term_graph.is_recursive(stratum):
+                self._maintain_recursive_stratum(stratum, changes, eval_relations, extraction_cache)
+            else:
+                relation_name, = stratum
+                if relation_name not in self._derivation_counts:
+                    # the counts were dropped (see on_relation_spilled)
+                    self._invalidate(relation_name)
+                    continue
+                self._maintain_counted_relation(relation_name, changes, eval_relations, extraction_cache)
+            for relation_name in stratum:
+                self._term_graph.set_node_state(relation_name, COMPUTED)
+
+    def _get_versioned_eval_relations(self, rule, changes, eval_relations, delta_idx, delta_rows):
+        """
+        :return: the body eval relations of a delta rule: the relations before delta_idx hold their changed rows and
+            the ones after it hold their rows from before the changes, so summing the delta rules of every changed
+            relation in the body counts every new (or lost) derivation exactly once.
+        """
+        body_eval_relations = []
+        for relation_idx, relation in enumerate(rule.body):
+            if type(relation) is not ast_nodes.Relation:
+                body_eval_relations.append(None)
+            elif relation_idx == delta_idx:
+                body_eval_relations.append(delta_rows)
+            else:
+                eval_relation = self._get_eval_relation(relation.name, eval_relations)
+                if relation_idx > delta_idx and relation.name in changes:
+                    eval_relation = _OldEvalRelation(eval_relation, *changes[relation.name])
+                body_eval_relations.append(eval_relation)
+        return body_eval_relations
+
+    def _maintain_counted_relation(self, relation_name, changes, eval_relations, extraction_cache):
+        counts = self._derivation_counts[relation_name]
+        count_deltas = Counter()
+        for rule in self.get_rules(relation_name):
+            for relation_idx, relation in enumerate(rule.body):
+                if type(relation) is not ast_nodes.Relation or relation.name not in changes:
+                    continue
+                inserted_rows, deleted_rows = changes[relation.name]
+                for sign, delta_rows in ((1, inserted_rows), (-1, deleted_rows)):
+                    if not delta_rows:
+                        continue
+                    body_eval_relations = self._get_versioned_eval_relations(rule, changes, eval_relations,
+                                                                             relation_idx, delta_rows)
+                    for row in self._evaluate_rule(rule, body_eval_relations, extraction_cache, relation_idx):
+                        count_deltas[row] += sign
+        relation = self._relation_store.get_relation(relation_name)
+        inserted_rows = set()
+        deleted_rows = set()
+        for row, count_delta in count_deltas.items():
+            if not count_delta:
+                continue
+            old_count = counts.get(row, 0)
+            new_count = old_count + count_delta
+            assert new_count >= 0, "a row of " + relation_name + " lost more derivations than it had"
+            if new_count:
+                counts[row] = new_count
+            else:
+                del counts[row]
+            if not old_count:
+                relation.add_internal(row)
+                inserted_rows.add(row)
+            elif not new_count:
+                relation.remove_internal(row)
+                deleted_rows.add(row)
+        if inserted_rows or deleted_rows:
+            changes[relation_name] = (inserted_rows, deleted_rows)
+
+    def _maintain_recursive_stratum(self, stratum, changes, eval_relations, extraction_cache):
+        rules = [rule for relation_name in stratum for rule in self.get_rules(relation_name)]
+        relations = {relation_name: self._relation_store.get_relation(relation_name) for relation_name in stratum}
+        old_eval_relations = dict()
+        for relation_name, (inserted_rows, deleted_rows) in changes.items():
+            old_eval_relations[relation_name] = _OldEvalRelation(
+                self._get_eval_relation(relation_name, eval_relations), inserted_rows, deleted_rows)
+
+        def get_delta_rule_rows(changed_rows, body_eval_relations):
+            """
+            :return: {head name -> the rows that the rules derive with one relation of their body taking its rows
+                from changed_rows (relation name -> rows), and the others from body_eval_relations}
+            """
+            derived_rows = {relation_name: set() for relation_name in stratum}
+            for rule in rules:
+                for relation_idx, relation in enumerate(rule.body):
+                    if type(relation) is ast_nodes.Relation and changed_rows.get(relation.name):
+                        derived_rows[rule.head_name].update(self._evaluate_rule(
+                            rule, self._get_body_eval_relations(rule, body_eval_relations, relation_idx,
+                                                                changed_rows[relation.name]),
+                            extraction_cache, relation_idx))
+            return derived_rows
+
+        # delete every row that a deleted row takes part in deriving, with the relations as they were before the
+        # changes (the relations of the stratum are not changed yet)
+        for relation_name in stratum:
+            old_eval_relations[relation_name] = self._get_eval_relation(relation_name, eval_relations)
+        deleted_rows = {relation_name: set() for relation_name in stratum}
+        delta = {relation_name: deleted for relation_name, (_, deleted) in changes.items() if deleted}
+        while any(delta.values()):
+            derived_rows = get_delta_rule_rows(delta, old_eval_relations)
+            delta = {relation_name: {row for row in rows if relations[relation_name].contains_internal(row) and
+                                     row not in deleted_rows[relation_name]}
+                     for relation_name, rows in derived_rows.items()}
+            for relation_name, rows in delta.items():
+                deleted_rows[relation_name].update(rows)
+        for relation_name, rows in deleted_rows.items():
+            for row in rows:
+                relations[relation_name].remove_internal(row)
+        # derive the deleted rows that have another derivation again, and the rows that the inserted rows derive,
+        # with the relations as they are after the changes
+        derived_rows = {relation_name: set() for relation_name in stratum}
+        for rule in rules:
+            head_rows = deleted_rows[rule.head_name]
+            if head_rows:
+                derived_rows[rule.head_name].update(self._evaluate_rule(
+                    rule, self._get_body_eval_relations(rule, eval_relations), extraction_cache,
+                    head_rows=head_rows))
+        inserted = {relation_name: inserted for relation_name, (inserted, _) in changes.items() if inserted}
+        for relation_name, rows in get_delta_rule_rows(inserted, eval_relations).items():
+            derived_rows[relation_name].update(rows)
+        added_rows = {relation_name: set() for relation_name in stratum}
+        while True:
+            delta = {relation_name: {row for row in rows if relations[relation_name].add_internal(row)}
+                     for relation_name, rows in derived_rows.items()}
+            if not any(delta.values()):
+                break
+            for relation_name, rows in delta.items():
+                added_rows[relation_name].update(rows)
+            derived_rows = get_delta_rule_rows(delta, eval_relations)
+        for relation_name in stratum:
+            net_inserted_rows = added_rows[relation_name] - deleted_rows[relation_name]
+            net_deleted_rows = deleted_rows[relation_name] - added_rows[relation_name]
+            if net_inserted_rows or net_deleted_rows:
+                changes[relation_name] = (net_inserted_rows, net_deleted_rows)
+
+    def _evaluate_rule(self, rule, body_eval_relations, extraction_cache, delta_idx=None, head_rows=None):
+        """
+        joins the relations of a rule body and projects the result on the rule head.
+        :param body_eval_relations: the EvalRelation of each relation in the body (the rows of the delta for the
+            relation at delta_idx, None for ie relations).
+        :param head_rows: if given, only these rows of the head are derived.
+        :return: a list of the rows that the rule derives, a row once for each of its derivations
+        """
+        # each binding is a tuple of the values of the free variables bound so far, by the order they were bound in
+        bindings = [()]
+        free_var_to_position = dict()
+        if head_rows is not None:
+            bindings = self._get_head_bindings(rule, head_rows, free_var_to_position)
+        plan = self.plan_rule(rule, body_eval_relations, delta_idx, free_var_to_position, len(bindings))
+        if self._index_advisor is not None:
+            for step in plan:
+                eval_relation = body_eval_relations[step.relation_idx]
+                if step.key_columns and isinstance(eval_relation, EvalRelation) and \
+                        eval_relation.stored_relation is not None:
+                    self._index_advisor.record_access(eval_relation.stored_relation, step.key_columns)
+        for step in plan:
+            if not bindings:
+                return []
+            relation = rule.body[step.relation_idx]
+            if type(relation) is ast_nodes.Relation:
+                bindings = self._join_relation(relation, bindings, free_var_to_position,
+                                               body_eval_relations[step.relation_idx], step.algorithm)
+            elif type(relation) is ast_nodes.RgxIERelation:
+                bindings = self._join_rgx_ie_relation(relation, bindings, free_var_to_position, extraction_cache)
+            else:
+                raise NotImplementedError("ie functions are not supported yet: " + relation.function_name)
+        head_positions = [free_var_to_position[free_var] for free_var in rule.head_free_vars]
+        return [tuple(binding[position] for position in head_positions) for binding in bindings]
+
+    @staticmethod
+    def _get_head_bindings(rule, head_rows, free_var_to_position):
+        """
+        :return: the bindings of the head's free variables to the values of each row in head_rows
+        """
+        head_positions = []
+        for free_var in rule.head_free_vars:
+            head_positions.append(free_var_to_position.setdefault(free_var, len(free_var_to_position)))
+        bindings = []
+        for row in head_rows:
+            binding = [None] * len(free_var_to_position)
+            if all(binding[position] is None or binding[position] == value
+                   for position, value in zip(head_positions, row)):
+                for position, value in zip(head_positions, row):
+                    binding[position] = value
+                bindings.append(tuple(binding))
+        return bindings
+
+    @staticmethod
+    def plan_rule(rule, body_eval_relations, delta_idx=None, bound_free_vars=(), binding_count=1):
+        """
+        :param body_eval_relations: the EvalRelation of each relation in the rule body (the delta's rows for the
+            relation at delta_idx, None for ie relations).
+        :param bound_free_vars: the free variables that are bound before the body is joined, and binding_count the
+            number of their bindings.
+        :return: the planner's join steps for the rule body
+        """
+        def get_statistics(relation_idx):
+            if relation_idx == delta_idx:
+                # the delta is small and joined first, assume its values are distinct
+                delta_size = len(body_eval_relations[relation_idx])
+                return RelationStatistics(delta_size, [delta_size] * len(rule.body[relation_idx].terms))
+            return body_eval_relations[relation_idx].get_statistics()
+
+        def has_index(relation_idx, key_columns):
+            # the relations that a semi-naive iteration (or a maintenance) probes are probed again in the next
+            # iterations, so their indexes pay off
+            if relation_idx == delta_idx:
+                # the rows of the delta are scanned
+                return False
+            return delta_idx is not None or bool(bound_free_vars) or \
+                body_eval_relations[relation_idx].has_index(key_columns)
+
+        return plan_rule_body(rule.body, get_statistics, has_index, delta_idx, bound_free_vars, binding_count)
+
+    def _get_term_plan(self, terms, free_var_to_position):
+        """
+        splits the terms of a relation by what the join does with them.
+        :return: (key columns, key sources, new columns, equal column pairs), where each key source is
+            (True, position of a bound free variable) or (False, constant value), the new columns hold the values
+            of free variables that the relation binds, and each pair of equal columns holds the same new free variable.
+        """
+        key_columns = []
+        key_sources = []
+        new_columns = []
+        equal_column_pairs = []
+        new_free_var_to_column = dict()
+        for column_idx, term in enumerate(terms):
+            if type(term) is ast_nodes.FreeVar:
+                if term.name in free_var_to_position:
+                    key_columns.append(column_idx)
+                    key_sources.append((True, free_var_to_position[term.name]))
+                elif term.name in new_free_var_to_column:
+                    equal_column_pairs.append((new_free_var_to_column[term.name], column_idx))
+                else:
+                    new_free_var_to_column[term.name] = column_idx
+                    new_columns.append(column_idx)
+            else:
+                key_columns.append(column_idx)
+                key_sources.append((False, self._get_constant_value(term)))
+        for free_var, column_idx in new_free_var_to_column.items():
+            free_var_to_position[free_var] = len(free_var_to_position)
+        return tuple(key_columns), key_sources, new_columns, equal_column_pairs
+
+    def _join_relation(self, relation, bindings, free_var_to_position, eval_relation, algorithm):
+        """
+        :param eval_relation: an EvalRelation (or _OldEvalRelation), or the set of rows of a delta.
+        """
+        key_columns, key_sources, new_columns, equal_column_pairs = \
+            self._get_term_plan(relation.terms, free_var_to_position)
+        if algorithm == INDEX_NESTED_LOOP:
+            if isinstance(eval_relation, set):
+                # a delta has no indexes, its rows are scanned
+                algorithm = HASH_JOIN
+            else:
+                index = eval_relation.get_index(key_columns)
+                if len(bindings) > 1 and not eval_relation.has_index(key_columns):
+                    # a stored relation that the index advisor did not index, a single scan of its code arrays for
+                    # every binding costs less than a scan per binding
+                    algorithm = HASH_JOIN
+        new_bindings = []
+        if algorithm == CROSS_PRODUCT:
+            rows = eval_relation if isinstance(eval_relation, set) else eval_relation.get_matching_rows((), None)
+            for row in rows:
+                if equal_column_pairs and any(row[first] != row[second] for first, second in equal_column_pairs):
+                    continue
+                new_values = tuple(row[column_idx] for column_idx in new_columns)
+                new_bindings.extend(binding + new_values for binding in bindings)
+        elif algorithm == INDEX_NESTED_LOOP:
+            for binding in bindings:
+                key = tuple(binding[source] if is_bound else source for is_bound, source in key_sources)
+                for row in index.get(key, ()):
+                    if equal_column_pairs and any(row[first] != row[second] for first, second in equal_column_pairs):
+                        continue
+                    new_bindings.append(binding + tuple(row[column_idx] for column_idx in new_columns))
+        else:
+            assert algorithm == HASH_JOIN
+            key_to_bindings = dict()
+            for binding in bindings:
+                key = tuple(binding[source] if is_bound else source for is_bound, source in key_sources)
+                key_to_bindings.setdefault(key, []).append(binding)
+            # only the rows that match a binding are read (a stored relation is scanned in its code arrays)
+            rows = select_rows(eval_relation, key_columns, key_to_bindings) if isinstance(eval_relation, set) \
+                else eval_relation.get_matching_rows(key_columns, key_to_bindings)
+            for row in rows:
+                if equal_column_pairs and any(row[first] != row[second] for first, second in equal_column_pairs):
+                    continue
+                key = tuple(row[column_idx] for column_idx in key_columns)
+                new_values = tuple(row[column_idx] for column_idx in new_columns)
+                new_bindings.extend(binding + new_values for binding in key_to_bindings[key])
+        return new_bindings
+
+    def _join_rgx_ie_relation(self, relation, bindings, free_var_to_position, extraction_cache):
+        if len(relation.input_terms) != 1:
+            raise NotImplementedError("a regex ie relation must have a single input (the regex)")
+        input_term = relation.input_terms[0]
+        input_position = free_var_to_position[input_term.name] if type(input_term) is ast_nodes.FreeVar else None
+        document = self._get_variable(relation.document.name)
+        output_terms = relation.output_terms
+        key_columns, key_sources, new_columns, equal_column_pairs = \
+            self._get_term_plan(output_terms, free_var_to_position)
+        new_bindings = []
+        for binding in bindings:
+            pattern = self._string_dictionary.get_string(binding[input_position]) if input_position is not None \
+                else self._get_constant_text(input_term)
+            cache_key = (pattern, id(document))
+            rows = extraction_cache.get(cache_key)
+            if rows is None:
+                rows = list(extract_spans(pattern, document))
+                extraction_cache[cache_key] = rows
+            for row in rows:
+                if len(row) != len(output_terms) or None in row:
+                    continue
+                if any(row[column_idx] != (binding[source] if is_bound else source)
+                       for column_idx, (is_bound, source) in zip(key_columns, key_sources)):
+                    continue
+                if equal_column_pairs and any(row[first] != row[second] for first, second in equal_column_pairs):
+                    continue
+                new_bindings.append(binding + tuple(row[column_idx] for column_idx in new_columns))
+        return new_bindings
@@ -0,0 +1,160 @@
+"""
+reads the facts of a relation from a delimited text file (csv or tsv), a row per line and a field per column of the
+relation's schema, straight into the int64 code arrays of relation_store.ColumnarRelation.
+
+the fields are not parsed one fact at a time: the file is split into the fields of each column, and each column is
+validated and encoded as a whole (ints are converted by numpy, spans are matched by a single regex over the whole
+column and their numbers parsed by numpy, and strings are encoded through a dict of the distinct strings of the
+column). a span is written as it is in a program, [start, stop).
+"""
+import csv
+import io
+import re
+from itertools import chain, count, repeat
+
+import numpy as np
+
+from lark_passes import VarTypes
+
+# a column of spans without their whitespace, a span per line. the numbers of a span have at most 18 digits, so they
+# fit in an int64
+SPAN_COLUMN_REGEX = re.compile(r"(?:\[\d{1,18},\d{1,18}\)\n)*")
+SPAN_REGEX = re.compile(r"[ \t]*\[[ \t]*\d{1,18}[ \t]*,[ \t]*\d{1,18}[ \t]*\)[ \t]*")
+SPAN_WHITESPACE = str.maketrans("", "", " \t")
+SPAN_DELIMITERS = str.maketrans("[,)", "   ")
+
+
+def get_default_delimiter(path):
+    return "\t" if str(path).lower().endswith(".tsv") else ","
+
+
+def get_field_counts(text, delimiter):
+    """
+    :return: an int64 array of the number of fields in each line of text
+    """
+    if len(delimiter.encode("utf-8")) != 1:
+        lines = text.split("\n")
+        return np.fromiter(map(str.count, lines, repeat(delimiter)), dtype=np.int64, count=len(lines)) + 1
+    # a line break and the delimiter are single bytes in utf-8, which are never a part of another character
+    text_bytes = np.frombuffer(text.encode("utf-8"), dtype=np.uint8)
+    line_ends = np.append(np.flatnonzero(text_bytes == ord("\n")), len(text_bytes))
+    delimiter_counts = np.searchsorted(np.flatnonzero(text_bytes == ord(delimiter)), line_ends)
+    return np.diff(delimiter_counts, prepend=0) + 1
+
+
+def split_columns(text, arity, delimiter=",", has_header=False):
+    """
+    :param text: the content of the file.
+    :return: a list of the fields of each column (a list of strings per column)
+    """
+    first_row = 2 if has_header else 1
+    if '"' in text:
+        # quoted fields may hold delimiters and line breaks, only a csv reader splits them right
+        rows = list(csv.reader(io.StringIO(text), delimiter=delimiter))
+        if has_header and rows:
+            rows.pop(0)
+        field_counts = np.fromiter(map(len, rows), dtype=np.int64, count=len(rows))
+        fields = list(chain.from_iterable(rows))
+    else:
+        if has_header:
+            header_end = text.find("\n")
+            text = "" if header_end == -1 else text[header_end + 1:]
+        if text.endswith("\n"):
+            text = text[:-1]
+        elif not text:
+            # no lines at all, rather than an empty line
+            text = None
+        field_counts = np.empty(0, dtype=np.int64) if text is None else get_field_counts(text, delimiter)
+        fields = [] if text is None else text.replace("\n", delimiter).split(delimiter)
+    bad_rows = np.flatnonzero(field_counts != arity)
+    if len(bad_rows):
+        row_idx = int(bad_rows[0])
+        raise ValueError("row " + str(first_row + row_idx) + " has " + str(field_counts[row_idx]) +
+                         " fields (expected " + str(arity) + ")")
+    return [fields[column_idx::arity] for column_idx in range(arity)]
+
+
+def _get_bad_field_error(fields, is_valid, type_name, first_row):
+    for row_idx, field in enumerate(fields):
+        if not is_valid(field):
+            return ValueError("row " + str(first_row + row_idx) + ": " + repr(field) + " is not a valid " +
+                              type_name)
+    raise AssertionError("every field is valid")
+
+
+def _is_int(field):
+    try:
+        return -2 ** 63 <= int(field) < 2 ** 63
+    except ValueError:
+        return False
+
+
+def encode_int_column(fields, first_row=1):
+    try:
+        # numpy converts the fields with int(), without a python loop
+        return [np.array(fields, dtype=np.int64)]
+    except (ValueError, OverflowError):
+        raise _get_bad_field_error(fields, _is_int, "int", first_row)
+
+
+def encode_span_column(fields, first_row=1):
+    """
+    :return: the starts and the stops of the spans
+    """
+    text = ("\n".join(fields) + "\n").translate(SPAN_WHITESPACE) if fields else ""
+    if SPAN_COLUMN_REGEX.fullmatch(text) is None:
+        raise _get_bad_field_error(fields, SPAN_REGEX.fullmatch, "spn", first_row)
+    if not fields:
+        return [np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)]
+    # the column matched the regex, so it only holds the numbers of the spans once the delimiters are spaces
+    codes = np.fromstring(text.translate(SPAN_DELIMITERS), dtype=np.int64, sep=" ")
+    assert len(codes) == 2 * len(fields)
+    starts = codes[0::2]
+    stops = codes[1::2]
+    bad_rows = np.flatnonzero(starts > stops)
+    if len(bad_rows):
+        row_idx = int(bad_rows[0])
+        raise ValueError("row " + str(first_row + row_idx) + ": the span " + fields[row_idx].strip() +
+                         " ends before it starts")
+    return [starts, stops]
+
+
+def encode_string_column(fields, string_dictionary):
+    """
+    adds the distinct strings of the column to the string dictionary
+    :return: the ids of the strings
+    """
+    string_to_column_id = dict()
+    column_ids = np.fromiter(map(string_to_column_id.setdefault, fields, count()), dtype=np.int64, count=len(fields))
+    # column_ids holds the first position of each string, map them to the dictionary's ids
+    first_positions = np.fromiter(string_to_column_id.values(), dtype=np.int64, count=len(string_to_column_id))
+    string_ids = np.empty(len(fields), dtype=np.int64)
+    string_ids[first_positions] = string_dictionary.get_ids(string_to_column_id)
+    return [string_ids[column_ids]]
+
+
+def read_code_arrays(path, schema, string_dictionary, delimiter=None, has_header=False):
+    """
+    :param schema: the lark_passes.VarTypes of the relation's columns.
+    :param string_dictionary: the string_dictionary.StringDictionary that the strings are encoded in.
+    :param delimiter: the delimiter of the fields, a tab for a .tsv file and a comma for any other file if not given.
+    :param has_header: whether the first line is a header (which is skipped).
+    :return: the code arrays of the rows (see relation_store.ColumnarRelation.get_code_arrays)
+    """
+    with open(path, encoding="utf-8") as file:
+        text = file.read()
+    if delimiter is None:
+        delimiter = get_default_delimiter(path)
+    columns = split_columns(text, len(schema), delimiter, has_header)
+    first_row = 2 if has_header else 1
+    column_code_arrays = [None] * len(schema)
+    # the strings are encoded last, so a file with a bad field does not add strings to the dictionary
+    for column_idx, var_type in enumerate(schema):
+        if var_type is VarTypes.INT:
+            column_code_arrays[column_idx] = encode_int_column(columns[column_idx], first_row)
+        elif var_type is VarTypes.SPAN:
+            column_code_arrays[column_idx] = encode_span_column(columns[column_idx], first_row)
+    for column_idx, var_type in enumerate(schema):
+        if var_type is VarTypes.STRING:
+            column_code_arrays[column_idx] = encode_string_column(columns[column_idx], string_dictionary)
+    return [code_array for code_arrays in column_code_arrays for code_array in code_arrays]
@@ -0,0 +1,147 @@
+"""
+creates and drops the hash indexes of the stored relations by the way they are accessed.
+
+every lookup of a relation (by a query, or by a join in a rule body) binds some of its columns (to constants or to
+the values of bound free variables) and leaves the others free. the advisor counts the uses of each binding pattern
+(a relation and its bound columns), and once a pattern is used often enough on a relation large enough for a scan to
+cost more than an index, it indexes the relation over the bound columns (see relation_store.ColumnarRelation.indexes).
+the relation keeps the index up to date on its adds and removes from then on.
+
+the estimated memory of the indexes that the advisor created is kept under a budget. the counts decay (they are
+halved every AGING_PERIOD accesses), so a pattern that is no longer used loses its index to the patterns in use: when
+an index does not fit, the indexes of the least used patterns are dropped to make room, and only if they are used
+less than the new pattern (so two patterns do not keep dropping each other's index).
+"""
+from engine.relation_store import HashIndex
+
+DEFAULT_INDEX_MEMORY_BUDGET = 256 << 20
+# the number of uses of a pattern (since its count last decayed) before it is indexed
+MIN_PATTERN_USES = 3
+# smaller relations are scanned, an index would not save much
+MIN_INDEXED_ROWS = 256
+AGING_PERIOD = 1024
+
+
+class IndexAdvisor:
+    def __init__(self, relation_store, memory_budget=DEFAULT_INDEX_MEMORY_BUDGET, min_uses=MIN_PATTERN_USES,
+                 min_rows=MIN_INDEXED_ROWS):
+        """
+        :param relation_store: the relation_store.RelationStore whose relations are indexed.
+        :param memory_budget: the bytes that the indexes the advisor creates may take (estimated, see
+            relation_store.HashIndex.nbytes).
+        """
+        self._relation_store = relation_store
+        self.memory_budget = memory_budget
+        self.min_uses = min_uses
+        self.min_rows = min_rows
+        # (relation name, column indices) -> decaying count of uses
+        self._pattern_uses = dict()
+        # (relation name, column indices) -> the relation that the advisor created the pattern's index on
+        self._indexed_patterns = dict()
+        self._access_count = 0
+
+    def record_access(self, relation, column_indices, min_uses=None, min_rows=None):
+        """
+        counts an access to relation (a relation_store.ColumnarRelation) with the given columns bound, and indexes
+        the relation over them if the pattern is used often enough.
+        :param min_uses: overrides self.min_uses (and min_rows overrides self.min_rows) for this access.
+        :return: whether the relation has an index over the columns
+        """
+        column_indices = tuple(sorted(column_indices))
+        if not column_indices or len(column_indices) == len(relation.schema):
+            # a scan or a membership check, neither needs a secondary index
+            return False
+        pattern = (relation.name, column_indices)
+        uses = self._pattern_uses.get(pattern, 0) + 1
+        self._pattern_uses[pattern] = uses
+        self._access_count += 1
+        if self._access_count % AGING_PERIOD == 0:
+            self._age()
+            self.enforce_budget()
+        if column_indices in relation.indexes:
+            return True
+        if uses < (self.min_uses if min_uses is None else min_uses) or \
+                len(relation) < (self.min_rows if min_rows is None else min_rows):
+            return False
+        code_width = sum(relation.columns[column_idx].code_width for column_idx in column_indices)
+        if not self._make_room(HashIndex.estimate_nbytes_for(len(relation), code_width), uses):
+            return False
+        relation.create_index(column_indices)
+        self._indexed_patterns[pattern] = relation
+        return True
+
+    def require_index(self, relation, column_indices):
+        """
+        indexes relation over the given columns on the first access with them (if the index fits in the budget), for
+        lookups that are known to repeat, e.g. the probes of the maintenance of derived relations.
+        :return: whether the relation has an index over the columns
+        """
+        return self.record_access(relation, column_indices, min_uses=1, min_rows=0)
+
+    def get_indexed_patterns(self):
+        """
+        :return: the (relation name, column indices) patterns that the advisor's indexes serve
+        """
+        self._forget_dropped_indexes()
+        return list(self._indexed_patterns)
+
+    def get_index_nbytes(self):
+        """
+        :return: the estimated memory of the indexes that the advisor created
+        """
+        self._forget_dropped_indexes()
+        return sum(relation.indexes[column_indices].nbytes
+                   for (_, column_indices), relation in self._indexed_patterns.items())
+
+    def enforce_budget(self):
+        """
+        drops the indexes of the least used patterns until the indexes fit in the memory budget again (they grow
+        with their relations)
+        """
+        self._make_room(0, None)
+
+    def _forget_dropped_indexes(self):
+        """
+        forgets the indexes of relations that were removed from the store (e.g. a derived relation that was computed
+        again, its new relation is indexed again on its next accesses) or that were dropped by others
+        """
+        for pattern, relation in list(self._indexed_patterns.items()):
+            relation_name, column_indices = pattern
+            if relation_name not in self._relation_store or \
+                    self._relation_store.get_relation(relation_name) is not relation or \
+                    column_indices not in relation.indexes:
+                del self._indexed_patterns[pattern]
+
+    def _make_room(self, nbytes, uses):
+        """
+        drops the indexes of the least used patterns (used less than uses, any pattern if uses is None) until nbytes
+        more fit in the budget.
+        :return: whether nbytes fit
+        """
+        free_bytes = self.memory_budget - nbytes - self.get_index_nbytes()
+        if free_bytes >= 0:
+            return True
+        victims = sorted(self._indexed_patterns, key=lambda pattern: self._pattern_uses.get(pattern, 0))
+        if uses is not None:
+            victims = [pattern for pattern in victims if self._pattern_uses.get(pattern, 0) < uses]
+            # drop nothing if dropping every candidate would not make enough room
+            if free_bytes + sum(self._get_nbytes(pattern) for pattern in victims) < 0:
+                return False
+        for pattern in victims:
+            if free_bytes >= 0:
+                break
+            free_bytes += self._get_nbytes(pattern)
+            relation = self._indexed_patterns.pop(pattern)
+            relation.drop_index(pattern[1])
+        return free_bytes >= 0
+
+    def _get_nbytes(self, pattern):
+        return self._indexed_patterns[pattern].indexes[pattern[1]].nbytes
+
+    def _age(self):
+        for pattern in list(self._pattern_uses):
+            uses = self._pattern_uses[pattern] // 2
+            if uses or pattern in self._indexed_patterns:
+                self._pattern_uses[pattern] = uses
+            else:
+                del self._pattern_uses[pattern]
@@ -0,0 +1,107 @@
+"""
+chooses the order in which the relations of a rule body are joined, and how each of them is joined.
+
+the plan is left deep: the relations are joined one at a time to the bindings of the relations before them. the
+planner is greedy, at each step it joins the relation that is estimated to produce the fewest bindings, out of the
+relations that are safe to join (an ie relation is safe once its input free variables are bound, as in
+lark_passes.get_safe_relation_order). the estimates use the cardinality of each relation and the number of distinct
+values in each of its columns (relation_store.RelationStatistics).
+"""
+import ast_nodes
+from lark_passes import get_safe_relation_order
+
+# probe an index of the relation (kept between evaluations) with the key of each binding
+INDEX_NESTED_LOOP = "index nested loop"
+# build a hash table of the bindings by their keys, and scan the relation once to probe it
+HASH_JOIN = "hash join"
+# the relation shares no bound column with the bindings, every binding is paired with every row
+CROSS_PRODUCT = "cross product"
+# run the ie relation for each binding
+IE_JOIN = "ie join"
+
+# the estimated number of rows an ie relation produces for an input, nothing is known about them before they run
+IE_FAN_OUT = 10.0
+
+
+class JoinStep:
+    __slots__ = ("relation_idx", "algorithm", "estimated_rows", "key_columns")
+
+    def __init__(self, relation_idx, algorithm, estimated_rows, key_columns=()):
+        """
+        :param key_columns: the columns of the relation that are bound when it is joined (see get_key_columns).
+        """
+        self.relation_idx = relation_idx
+        self.algorithm = algorithm
+        self.estimated_rows = estimated_rows
+        self.key_columns = key_columns
+
+    def __repr__(self):
+        return "JoinStep(" + str(self.relation_idx) + ", " + self.algorithm + ", " + \
+               format(self.estimated_rows, ".1f") + ")"
+
+
+def _get_input_and_output_free_vars(relation):
+    if type(relation) is ast_nodes.Relation:
+        return set(), set(relation.get_free_var_names())
+    return set(relation.get_input_free_var_names()), set(relation.get_output_free_var_names())
+
+
+def get_key_columns(relation, bound_free_vars):
+    """
+    :return: the columns of a (non ie) relation whose values are known before it is joined: its constants and its
+        bound free variables
+    """
+    return tuple(column_idx for column_idx, term in enumerate(relation.terms)
+                 if type(term) is not ast_nodes.FreeVar or term.name in bound_free_vars)
+
+
+def plan_rule_body(body, get_statistics, has_index, first_idx=None, bound_free_vars=(), binding_count=1):
+    """
+    :param body: the relations of a rule body (see ast_nodes.Rule).
+    :param get_statistics: returns the relation_store.RelationStatistics of a relation of the body by its index.
+    :param has_index: returns whether the relation of the body at an index has an index over the given columns (or
+        will keep one that is created, e.g. a relation that is probed in every iteration of a recursive evaluation).
+    :param first_idx: the index of a relation that must be joined first (the delta of a semi-naive iteration).
+    :param bound_free_vars: the free variables that are bound before the body is joined, and binding_count the
+        number of their bindings (e.g. the rows of the head that are checked for being derived).
+    :return: a list of JoinSteps
+    """
+    free_vars = [_get_input_and_output_free_vars(relation) for relation in body]
+    safe_order, _ = get_safe_relation_order([input_free_vars for input_free_vars, _ in free_vars],
+                                            [output_free_vars for _, output_free_vars in free_vars])
+    assert len(safe_order) == len(body), "the rule is not safe"
+    bound_free_vars = set(bound_free_vars)
+    remaining_idxs = list(range(len(body)))
+    estimated_rows = float(binding_count)
+    plan = []
+    while remaining_idxs:
+        best_step = None
+        candidate_idxs = [first_idx] if first_idx is not None and not plan else remaining_idxs
+        for relation_idx in candidate_idxs:
+            input_free_vars, _ = free_vars[relation_idx]
+            if not input_free_vars <= bound_free_vars:
+                continue
+            step = _plan_join(body[relation_idx], relation_idx, estimated_rows, bound_free_vars, get_statistics,
+                              has_index)
+            if best_step is None or step.estimated_rows < best_step.estimated_rows:
+                best_step = step
+        plan.append(best_step)
+        remaining_idxs.remove(best_step.relation_idx)
+        bound_free_vars.update(free_vars[best_step.relation_idx][1])
+        estimated_rows = best_step.estimated_rows
+    return plan
+
+
+def _plan_join(relation, relation_idx, estimated_rows, bound_free_vars, get_statistics, has_index):
+    if type(relation) is not ast_nodes.Relation:
+        return JoinStep(relation_idx, IE_JOIN, estimated_rows * IE_FAN_OUT)
+    statistics = get_statistics(relation_idx)
+    key_columns = get_key_columns(relation, bound_free_vars)
+    if not key_columns:
+        return JoinStep(relation_idx, CROSS_PRODUCT, estimated_rows * statistics.cardinality)
+    output_rows = estimated_rows * statistics.estimate_matching_rows(key_columns)
+    # building an index costs a scan of the relation, as does a hash join, but a hash join only keeps a table of the
+    # bindings. an index pays off when it is already there or when there are more bindings than rows.
+    if has_index(relation_idx, key_columns) or estimated_rows >= statistics.cardinality:
+        return JoinStep(relation_idx, INDEX_NESTED_LOOP, output_rows, key_columns)
+    return JoinStep(relation_idx, HASH_JOIN, output_rows, key_columns)
@@ -0,0 +1,97 @@
+"""
+caches the results of queries between the changes of the relations they read.
+
+a query is keyed by its relation's name and its terms, normalized: a constant (or a variable) term by its value, and
+a free variable by the position of its first appearance (so ?parent("bob", X) and ?parent("bob", Y) share an entry).
+every entry records the relations its result depends on (the query's relation and the relations it is derived from
+through the rule dependency graph) and the variables that the rules of those relations use, and is invalidated only
+when one of them changes.
+"""
+from collections import OrderedDict
+
+import ast_nodes
+
+QUERY_CACHE_SIZE = 1024
+
+
+def get_query_key(relation_name, term_values):
+    """
+    :param term_values: the terms of the query's relation, with the value of each constant or variable term (and the
+        ast_nodes.FreeVar of each free variable).
+    """
+    free_var_to_position = dict()
+    key_terms = []
+    for term in term_values:
+        if type(term) is ast_nodes.FreeVar:
+            key_terms.append(ast_nodes.FreeVar(free_var_to_position.setdefault(term.name, len(free_var_to_position))))
+        else:
+            key_terms.append(term)
+    return relation_name, tuple(key_terms)
+
+
+class QueryCache:
+    def __init__(self, max_size=QUERY_CACHE_SIZE):
+        self.max_size = max_size
+        # query key -> tuple of result rows, the least recently used key first
+        self._results = OrderedDict()
+        # relation name (or variable name) -> the keys of the entries that depend on it
+        self._relation_to_keys = dict()
+        self._var_to_keys = dict()
+        # query key -> (relation names, variable names) that the entry depends on
+        self._key_to_dependencies = dict()
+
+    def __len__(self):
+        return len(self._results)
+
+    def get(self, key):
+        """
+        :return: a list of the cached result rows, or None if the query is not cached
+        """
+        result = self._results.get(key)
+        if result is None:
+            return None
+        self._results.move_to_end(key)
+        return list(result)
+
+    def put(self, key, result, relation_names, var_names=()):
+        """
+        :param relation_names: the relations that the result depends on.
+        :param var_names: the variables that the result depends on.
+        """
+        if key in self._results:
+            self._remove(key)
+        self._results[key] = tuple(result)
+        self._key_to_dependencies[key] = (tuple(relation_names), tuple(var_names))
+        for relation_name in relation_names:
+            self._relation_to_keys.setdefault(relation_name, set()).add(key)
+        for var_name in var_names:
+            self._var_to_keys.setdefault(var_name, set()).add(key)
+        if len(self._results) > self.max_size:
+            self._remove(next(iter(self._results)))
+
+    def invalidate_relation(self, relation_name):
+        """
+        removes the entries that depend on a relation
+        """
+        for key in list(self._relation_to_keys.get(relation_name, ())):
+            self._remove(key)
+
+    def invalidate_variable(self, var_name):
+        for key in list(self._var_to_keys.get(var_name, ())):
+            self._remove(key)
+
+    def clear(self):
+        self._results.clear()
+        self._relation_to_keys.clear()
+        self._var_to_keys.clear()
+        self._key_to_dependencies.clear()
+
+    def _remove(self, key):
+        del self._results[key]
+        relation_names, var_names = self._key_to_dependencies.pop(key)
+        for names, name_to_keys in ((relation_names, self._relation_to_keys), (var_names, self._var_to_keys)):
+            for name in names:
+                keys = name_to_keys[name]
+                keys.discard(key)
+                if not keys:
+                    del name_to_keys[name]
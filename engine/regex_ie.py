@@ -0,0 +1,148 @@
+"""
+regex information extraction: finds the spans that a regex matches in a document.
+
+the spans are byte offsets into the document (the utf-8 encoding of a string), from the start of the document.
+a match of a regex with capture groups yields the span of every group (None for a group that did not take part in
+the match), and a match of a regex without groups yields the span of the whole match.
+"""
+import re
+from collections import OrderedDict
+
+import numpy as np
+
+from engine.document_store import DocumentView
+from engine.span_column import SpanColumn
+
+PATTERN_CACHE_SIZE = 256
+DEFAULT_CHUNK_SIZE = 1 << 20
+DEFAULT_MAX_MATCH_LENGTH = 4096
+# the number of matches that are collected in lists before they are moved to the span columns
+COLUMN_BATCH_SIZE = 1 << 16
+
+# pattern text -> compiled bytes pattern
+_compiled_patterns = OrderedDict()
+
+
+def get_compiled_pattern(pattern_text):
+    """
+    :return: the compiled (bytes) regex of pattern_text, the last PATTERN_CACHE_SIZE patterns are cached
+    """
+    compiled_pattern = _compiled_patterns.get(pattern_text)
+    if compiled_pattern is not None:
+        _compiled_patterns.move_to_end(pattern_text)
+        return compiled_pattern
+    compiled_pattern = re.compile(pattern_text.encode("utf-8"))
+    _compiled_patterns[pattern_text] = compiled_pattern
+    if len(_compiled_patterns) > PATTERN_CACHE_SIZE:
+        _compiled_patterns.popitem(last=False)
+    return compiled_pattern
+
+
+def _get_match_spans(match, offset):
+    if match.re.groups == 0:
+        return (offset + match.start(), offset + match.end()),
+    return tuple(None if match.start(group) == -1 else (offset + match.start(group), offset + match.end(group))
+                 for group in range(1, match.re.groups + 1))
+
+
+def iter_buffer_matches(pattern, buffer):
+    """
+    scans a bytes-like object (e.g. the memoryview of a memory mapped document) without copying it.
+    only the pages of a memory mapped document that the scan reaches are read, and the os may drop them afterwards.
+    :return: a generator of the spans of each match, see the module's docstring
+    """
+    for match in pattern.finditer(buffer):
+        yield _get_match_spans(match, 0)
+
+
+def iter_stream_matches(pattern, stream, chunk_size=DEFAULT_CHUNK_SIZE, max_match_length=DEFAULT_MAX_MATCH_LENGTH):
+    """
+    scans a binary file object a chunk at a time, at most chunk_size + 2 * max_match_length bytes are kept in memory.
+    yields the same matches as scanning the whole content at once, as long as the regex never looks further than
+    max_match_length bytes from the start of a match attempt (including lookarounds).
+
+    a match is yielded only once the chunks read so far reach max_match_length bytes past its start, so its attempt
+    saw the same bytes that it would have seen in the whole content. the scan continues from the end of the last
+    yielded match when the next chunk is read, and the bytes before it are dropped (except for max_match_length bytes
+    that a lookbehind may look at).
+    :return: a generator of the spans of each match, see the module's docstring
+    """
+    buffer = bytearray()
+    # the offset in the stream of buffer[0]
+    buffer_offset = 0
+    # the position in the buffer that the next match attempt starts from
+    scan_position = 0
+    # the position of the last empty match, an empty match may not follow it at the same position
+    last_empty_match_position = None
+    at_end = False
+    while not at_end:
+        chunk = stream.read(chunk_size)
+        at_end = not chunk
+        buffer += chunk
+        safe_end = len(buffer) if at_end else len(buffer) - max_match_length
+        for match in pattern.finditer(buffer, scan_position):
+            if match.start() >= safe_end and not at_end:
+                break
+            if match.start() == match.end():
+                if match.start() == last_empty_match_position:
+                    continue
+                last_empty_match_position = match.start()
+            yield _get_match_spans(match, buffer_offset)
+            scan_position = match.end()
+        # the attempts that start before safe_end and did not match would not match in the whole content either
+        scan_position = max(scan_position, safe_end)
+        # keep the bytes that a lookbehind of the next match attempts may look at
+        drop_end = max(0, scan_position - max_match_length)
+        if drop_end:
+            del buffer[:drop_end]
+            buffer_offset += drop_end
+            scan_position -= drop_end
+            if last_empty_match_position is not None:
+                last_empty_match_position -= drop_end
+
+
+def extract_spans(pattern_text, document, chunk_size=DEFAULT_CHUNK_SIZE, max_match_length=DEFAULT_MAX_MATCH_LENGTH):
+    """
+    the regex ie function: finds the spans that pattern_text matches in document.
+    :param document: a str, a document_store.DocumentView, a bytes-like object or a binary file object (which is
+        scanned a chunk at a time, see iter_stream_matches).
+    :return: a generator of the spans of each match, see the module's docstring
+    """
+    pattern = get_compiled_pattern(pattern_text)
+    if isinstance(document, str):
+        return iter_buffer_matches(pattern, document.encode("utf-8"))
+    if isinstance(document, DocumentView):
+        return iter_buffer_matches(pattern, document.get_buffer())
+    if hasattr(document, "read"):
+        return iter_stream_matches(pattern, document, chunk_size, max_match_length)
+    return iter_buffer_matches(pattern, document)
+
+
+def extract_span_columns(pattern_text, document, chunk_size=DEFAULT_CHUNK_SIZE,
+                         max_match_length=DEFAULT_MAX_MATCH_LENGTH):
+    """
+    same as extract_spans, but collects the spans into a span_column.SpanColumn per group (a single column for a
+    regex without groups), row i of the columns holds the spans of the i-th match.
+    a match in which a group did not take part has no span for it, so it is left out.
+    """
+    group_count = max(1, get_compiled_pattern(pattern_text).groups)
+    columns = [SpanColumn() for _ in range(group_count)]
+    batch = []
+    for match_spans in extract_spans(pattern_text, document, chunk_size, max_match_length):
+        if None in match_spans:
+            continue
+        batch.append(match_spans)
+        if len(batch) == COLUMN_BATCH_SIZE:
+            _extend_span_columns(columns, batch)
+            batch = []
+    _extend_span_columns(columns, batch)
+    return columns
+
+
+def _extend_span_columns(columns, batch):
+    if not batch:
+        return
+    # (matches, groups, 2) array of the batch's spans
+    spans = np.array(batch, dtype=np.int64)
+    for group, column in enumerate(columns):
+        column.extend(spans[:, group, 0], spans[:, group, 1])
@@ -0,0 +1,1058 @@
+"""
+typed columnar storage of relations.
+
+a relation keeps a column per attribute of its schema: an int column is an int64 array, a str column is an int64
+array of the ids of its strings in a string_dictionary.StringDictionary (shared by the relations of a session), and a
+spn column is a span_column.SpanColumn.
+every value is encoded as int64 codes (one code, or two for a span), so a row is a fixed number of int64 codes.
+
+the evaluation of rules works on the internal form of rows, in which a value is its code (an int, the id of a
+string) or its pair of codes (a (start, stop) tuple, for a span), so it only compares and hashes ints.
+"""
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+from collections import OrderedDict
+from itertools import chain
+
+import numpy as np
+
+import ast_nodes
+from engine.span_column import INITIAL_CAPACITY, SpanColumn
+from engine.string_dictionary import StringDictionary
+from lark_passes import VarTypes
+
+
+class IntColumn:
+    """
+    a growable int64 array
+    """
+
+    code_width = 1
+
+    def __init__(self):
+        self._size = 0
+        self._values = np.empty(INITIAL_CAPACITY, dtype=np.int64)
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def values(self):
+        return self._values[:self._size]
+
+    @property
+    def nbytes(self):
+        return self._values.nbytes
+
+    def encode(self, value, add=False):
+        """
+        :return: the codes of value (a tuple of code_width ints), or None if value can not be in the column
+        """
+        return (value,) if type(value) is int else None
+
+    def decode(self, codes):
+        return int(codes[0])
+
+    def get_code_arrays(self):
+        return self.values,
+
+    def append(self, codes):
+        if self._size == len(self._values):
+            self._values = np.resize(self._values, max(INITIAL_CAPACITY, 2 * len(self._values)))
+        self._values[self._size] = codes[0]
+        self._size += 1
+
+    def extend(self, code_arrays):
+        new_size = self._size + len(code_arrays[0])
+        if new_size > len(self._values):
+            self._values = np.resize(self._values, max(INITIAL_CAPACITY, 2 * len(self._values), new_size))
+        self._values[self._size:new_size] = code_arrays[0]
+        self._size = new_size
+
+    def set(self, idx, codes):
+        self._values[idx] = codes[0]
+
+    def get_codes(self, idx):
+        return int(self._values[idx]),
+
+    def pop(self):
+        assert self._size > 0
+        self._size -= 1
+
+    def set_code_arrays(self, code_arrays, copy=True):
+        """
+        replaces the rows of the column with the given codes (arrays of code_width).
+        :param copy: whether to copy the codes, otherwise the column keeps the given int64 arrays (e.g. memory mapped
+            ones) as its storage until it grows.
+        """
+        self._size = len(code_arrays[0])
+        if copy:
+            self._values = np.empty(max(INITIAL_CAPACITY, self._size), dtype=np.int64)
+            self._values[:self._size] = code_arrays[0]
+        else:
+            self._values = code_arrays[0]
+
+
+class StringColumn(IntColumn):
+    """
+    a dictionary encoded column of strings: each row holds the id of its string in a string dictionary
+    """
+
+    def __init__(self, string_dictionary):
+        super().__init__()
+        self.string_dictionary = string_dictionary
+
+    def encode(self, value, add=False):
+        if type(value) is not str:
+            return None
+        code = self.string_dictionary.get_id(value, add)
+        return None if code is None else (code,)
+
+    def decode(self, codes):
+        return self.string_dictionary.strings[codes[0]]
+
+
+class SpanCodeColumn:
+    """
+    adapts a span_column.SpanColumn to the interface of the relation's columns, a span is encoded as (start, stop)
+    """
+
+    code_width = 2
+
+    def __init__(self):
+        self.spans = SpanColumn()
+
+    def __len__(self):
+        return len(self.spans)
+
+    @property
+    def nbytes(self):
+        return self.spans.nbytes
+
+    def encode(self, value, add=False):
+        if type(value) is ast_nodes.Span:
+            return value.start, value.stop
+        if type(value) is tuple and len(value) == 2:
+            return value
+        return None
+
+    def decode(self, codes):
+        return ast_nodes.Span(int(codes[0]), int(codes[1]))
+
+    def get_code_arrays(self):
+        return self.spans.starts, self.spans.stops
+
+    def append(self, codes):
+        self.spans.append(codes[0], codes[1])
+
+    def extend(self, code_arrays):
+        self.spans.extend(code_arrays[0], code_arrays[1])
+
+    def set(self, idx, codes):
+        self.spans.set(idx, codes[0], codes[1])
+
+    def get_codes(self, idx):
+        return int(self.spans.starts[idx]), int(self.spans.stops[idx])
+
+    def pop(self):
+        self.spans.pop()
+
+    def set_code_arrays(self, code_arrays, copy=True):
+        self.spans = SpanColumn(code_arrays[0], code_arrays[1]) if copy \
+            else SpanColumn.from_arrays(code_arrays[0], code_arrays[1])
+
+
+VAR_TYPE_TO_COLUMN_TYPE = {
+    VarTypes.INT: IntColumn,
+    VarTypes.STRING: StringColumn,
+    VarTypes.SPAN: SpanCodeColumn
+}
+
+
+class RelationStatistics:
+    """
+    the number of rows of a relation and the number of distinct values in each of its columns
+    """
+
+    def __init__(self, cardinality, distinct_counts):
+        self.cardinality = cardinality
+        self.distinct_counts = tuple(distinct_counts)
+
+    def estimate_matching_rows(self, key_columns):
+        """
+        estimates the number of rows that hold given values in key_columns, assuming the columns are independent and
+        their values are uniformly distributed
+        """
+        if not self.cardinality:
+            return 0.0
+        estimate = float(self.cardinality)
+        for column_idx in key_columns:
+            estimate /= max(1, self.distinct_counts[column_idx])
+        return max(1.0, estimate)
+
+
+class HashIndex:
+    """
+    maps the codes of some of the columns of a relation to the indices of the rows that hold them.
+    a key of a single row (the common case for selective columns) maps to the row index itself, only a key of several
+    rows maps to a set of them.
+    """
+
+    # rough sizes (in bytes) of the objects an index keeps per key, per code in a key and per row of a key of several
+    # rows, used to estimate the memory of an index without walking it
+    KEY_BYTES = 120
+    CODE_BYTES = 36
+    SET_BYTES = 216
+    SET_ROW_BYTES = 60
+
+    def __init__(self, column_indices, code_width=None):
+        """
+        :param code_width: the number of codes in a key (the columns' code widths summed), len(column_indices) if
+            not given.
+        """
+        self.column_indices = tuple(column_indices)
+        self.code_width = len(self.column_indices) if code_width is None else code_width
+        self._key_to_rows = dict()
+        # the number of keys of several rows, and the number of rows they hold
+        self._set_count = 0
+        self._set_row_count = 0
+
+    def add(self, key, row_idx):
+        rows = self._key_to_rows.get(key)
+        if rows is None:
+            self._key_to_rows[key] = row_idx
+        elif type(rows) is int:
+            self._key_to_rows[key] = {rows, row_idx}
+            self._set_count += 1
+            self._set_row_count += 2
+        else:
+            rows.add(row_idx)
+            self._set_row_count += 1
+
+    def remove(self, key, row_idx):
+        rows = self._key_to_rows[key]
+        if type(rows) is int:
+            assert rows == row_idx
+            del self._key_to_rows[key]
+            return
+        rows.discard(row_idx)
+        self._set_row_count -= 1
+        if len(rows) == 1:
+            self._key_to_rows[key] = next(iter(rows))
+            self._set_count -= 1
+            self._set_row_count -= 1
+
+    def get_rows(self, key):
+        rows = self._key_to_rows.get(key, ())
+        return (rows,) if type(rows) is int else rows
+
+    def get_distinct_key_count(self):
+        return len(self._key_to_rows)
+
+    @classmethod
+    def estimate_nbytes_for(cls, row_count, code_width):
+        """
+        :return: the estimated memory of an index over row_count rows, assuming every row has a distinct key
+        """
+        return row_count * (cls.KEY_BYTES + code_width * cls.CODE_BYTES)
+
+    @property
+    def nbytes(self):
+        """
+        an estimate of the memory of the index, in O(1)
+        """
+        return sys.getsizeof(self._key_to_rows) + \
+            len(self._key_to_rows) * (self.KEY_BYTES + self.code_width * self.CODE_BYTES) + \
+            self._set_count * self.SET_BYTES + self._set_row_count * self.SET_ROW_BYTES
+
+
+# the multiplier of the hash of a row's codes (2 ** 64 divided by the golden ratio, made odd)
+ROW_HASH_MULTIPLIER = 0x9E3779B97F4A7C15
+_UINT64_MASK = (1 << 64) - 1
+
+
+def get_row_hashes(code_arrays):
+    """
+    :return: a uint64 array of the hash of each row of code arrays (see ColumnarRelation.get_code_arrays)
+    """
+    row_hashes = np.zeros(len(code_arrays[0]), dtype=np.uint64)
+    for code_array in code_arrays:
+        row_hashes ^= code_array.astype(np.uint64)
+        row_hashes *= np.uint64(ROW_HASH_MULTIPLIER)
+    return row_hashes
+
+
+class RowKeyTable:
+    """
+    the set semantics of a ColumnarRelation: a hash table from the codes of a row to its index, with open addressing
+    and linear probing.
+    the table is a single int64 array of row indices that is at most half full, and the codes of a row are compared
+    with the relation's code arrays rather than kept in the table, so it costs 16 to 32 bytes per row. the rows of
+    code arrays are hashed, looked up and inserted together with numpy, a probe step at a time.
+    the methods get the relation's code arrays (see ColumnarRelation.get_code_arrays), which must hold the rows in
+    the table.
+    """
+
+    EMPTY = -1
+    # the slot of a removed row, a probe goes on past it
+    REMOVED = -2
+    MIN_CAPACITY = 8
+
+    def __init__(self, code_arrays=(), row_count=0):
+        """
+        builds the table of the first row_count rows of code_arrays, which must be distinct
+        """
+        self._set_capacity(row_count)
+        if row_count:
+            self._insert(code_arrays, np.arange(row_count, dtype=np.int64))
+
+    def __len__(self):
+        return self._row_count
+
+    @property
+    def nbytes(self):
+        return self._slots.nbytes
+
+    def _set_capacity(self, row_count):
+        # a new table is at most a quarter full, so it takes as many rows again before it grows
+        capacity = self.MIN_CAPACITY
+        while capacity < 4 * row_count:
+            capacity *= 2
+        self._slots = np.full(capacity, self.EMPTY, dtype=np.int64)
+        self._shift = 64 - (capacity.bit_length() - 1)
+        self._row_count = 0
+        # the slots that are not EMPTY
+        self._used_count = 0
+
+    def _get_slot(self, codes):
+        row_hash = 0
+        for code in codes:
+            row_hash = ((row_hash ^ (code & _UINT64_MASK)) * ROW_HASH_MULTIPLIER) & _UINT64_MASK
+        return row_hash >> self._shift
+
+    def _get_slots(self, code_arrays):
+        """
+        same as _get_slot(), for each row of code_arrays
+        """
+        return (get_row_hashes(code_arrays) >> np.uint64(self._shift)).astype(np.int64)
+
+    def _find_slot(self, codes, code_arrays):
+        """
+        :param codes: the codes of a row, flattened (as in the code arrays).
+        :return: the slot of the row with the given codes, or None if it is not in the table
+        """
+        slots = self._slots
+        slot_mask = len(slots) - 1
+        slot = self._get_slot(codes)
+        while True:
+            row_idx = slots.item(slot)
+            if row_idx >= 0:
+                for code_array, code in zip(code_arrays, codes):
+                    if code_array.item(row_idx) != code:
+                        break
+                else:
+                    return slot
+            elif row_idx == self.EMPTY:
+                return None
+            slot = (slot + 1) & slot_mask
+
+    def find(self, codes, code_arrays):
+        """
+        :return: the index of the row with the given codes, or None if it is not in the table
+        """
+        slot = self._find_slot(codes, code_arrays)
+        return None if slot is None else self._slots.item(slot)
+
+    def find_many(self, code_arrays, query_code_arrays):
+        """
+        :return: an int64 array of the index of each row of query_code_arrays in the table, EMPTY for the rows that
+            are not in it
+        """
+        slot_mask = len(self._slots) - 1
+        found_row_idxs = np.full(len(query_code_arrays[0]), self.EMPTY, dtype=np.int64)
+        query_idxs = np.arange(len(found_row_idxs), dtype=np.int64)
+        slots = self._get_slots(query_code_arrays)
+        while len(query_idxs):
+            row_idxs = self._slots[slots]
+            matches = row_idxs >= 0
+            live_row_idxs = row_idxs[matches]
+            live_query_idxs = query_idxs[matches]
+            live_matches = np.ones(len(live_row_idxs), dtype=bool)
+            for code_array, query_code_array in zip(code_arrays, query_code_arrays):
+                live_matches &= code_array[live_row_idxs] == query_code_array[live_query_idxs]
+            matches[matches] = live_matches
+            found_row_idxs[query_idxs[matches]] = row_idxs[matches]
+            # the probes that neither found their row nor reached an empty slot go on to the next slot
+            probing = ~matches & (row_idxs != self.EMPTY)
+            query_idxs = query_idxs[probing]
+            slots = (slots[probing] + 1) & slot_mask
+        return found_row_idxs
+
+    def add(self, codes, row_idx, code_arrays):
+        """
+        adds a row that is not in the table
+        """
+        if 2 * (self._used_count + 1) > len(self._slots):
+            self._resize(code_arrays, self._row_count + 1)
+        slot_mask = len(self._slots) - 1
+        slot = self._get_slot(codes)
+        while self._slots[slot] >= 0:
+            slot = (slot + 1) & slot_mask
+        if self._slots[slot] == self.EMPTY:
+            self._used_count += 1
+        self._slots[slot] = row_idx
+        self._row_count += 1
+
+    def add_many(self, code_arrays, row_idxs):
+        """
+        adds the rows of code_arrays at row_idxs (an int64 array), which must be distinct and not in the table
+        """
+        if 2 * (self._used_count + len(row_idxs)) > len(self._slots):
+            self._resize(code_arrays, self._row_count + len(row_idxs))
+        self._insert(code_arrays, row_idxs)
+
+    def _insert(self, code_arrays, row_idxs):
+        slot_mask = len(self._slots) - 1
+        slots = self._get_slots([code_array[row_idxs] for code_array in code_arrays])
+        self._row_count += len(row_idxs)
+        while len(row_idxs):
+            old_row_idxs = self._slots[slots]
+            free = old_row_idxs < 0
+            # the rows that probe the same free slot all write it, and the one whose write is kept takes it
+            self._slots[slots[free]] = row_idxs[free]
+            placed = self._slots[slots] == row_idxs
+            self._used_count += int(np.count_nonzero(placed & (old_row_idxs == self.EMPTY)))
+            row_idxs = row_idxs[~placed]
+            slots = (slots[~placed] + 1) & slot_mask
+
+    def _resize(self, code_arrays, row_count):
+        """
+        rebuilds the table for row_count rows, which also drops the REMOVED slots
+        """
+        row_idxs = self._slots[self._slots >= 0]
+        self._set_capacity(row_count)
+        self._insert(code_arrays, row_idxs)
+
+    def _find_row_slot(self, codes, row_idx):
+        """
+        :return: the slot of a row that is in the table, by its codes and its index (so no codes are compared)
+        """
+        slots = self._slots
+        slot_mask = len(slots) - 1
+        slot = self._get_slot(codes)
+        while slots.item(slot) != row_idx:
+            assert slots.item(slot) != self.EMPTY
+            slot = (slot + 1) & slot_mask
+        return slot
+
+    def remove(self, codes, row_idx):
+        """
+        removes a row that is in the table, with the given codes at row_idx
+        """
+        self._slots[self._find_row_slot(codes, row_idx)] = self.REMOVED
+        self._row_count -= 1
+
+    def move(self, codes, row_idx, new_row_idx):
+        """
+        changes the index of a row that is in the table, e.g. when it moves to the place of a removed row
+        """
+        self._slots[self._find_row_slot(codes, row_idx)] = new_row_idx
+
+
+class ColumnarRelation:
+    """
+    a relation (a set of rows) stored as typed columns.
+
+    a RowKeyTable from the codes of the rows to their indices gives the relation set semantics and O(1) adds, removes
+    and membership checks. the table of a relation whose rows were set at once (see set_code_arrays()) is not built
+    until the relation has been probed for single rows ROW_KEY_SCANS times (each probe scans the columns until then),
+    so a relation that is only scanned, or changed by a few rows, never builds it.
+    a removed row is replaced by the last row, so the columns
+    stay dense. hash indexes over some of the columns may be created to find the rows with given values in those
+    columns in O(1), other lookups scan the code arrays of the bound columns.
+    """
+
+    def __init__(self, name, schema, string_dictionary=None):
+        """
+        :param schema: a sequence of lark_passes.VarTypes.
+        :param string_dictionary: the string_dictionary.StringDictionary of the string columns, a new one if not
+            given.
+        """
+        self.name = name
+        self.schema = tuple(schema)
+        self.string_dictionary = StringDictionary() if string_dictionary is None else string_dictionary
+        self.columns = [StringColumn(self.string_dictionary) if VAR_TYPE_TO_COLUMN_TYPE[var_type] is StringColumn
+                        else VAR_TYPE_TO_COLUMN_TYPE[var_type]() for var_type in self.schema]
+        self._code_widths = tuple(column.code_width for column in self.columns)
+        self._size = 0
+        # a RowKeyTable of the rows, None until it is built (see _find_row())
+        self._row_keys = RowKeyTable()
+        self._row_scan_count = 0
+        # column indices -> HashIndex
+        self.indexes = dict()
+        # changes on every add and remove
+        self._version = 0
+        self._statistics = None
+        # the number of rows when the distinct counts were computed
+        self._statistics_size = 0
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def version(self):
+        """
+        changes whenever rows are added or removed
+        """
+        return self._version
+
+    @property
+    def nbytes(self):
+        """
+        the size of the columns (without the string dictionary and the indexes)
+        """
+        return sum(column.nbytes for column in self.columns)
+
+    # a scan of the columns costs about as much as building the row keys of a few percent of the rows
+    ROW_KEY_SCANS = 64
+
+    def get_memory_usage(self):
+        """
+        an estimate of the memory of the relation: its columns, its row keys and its indexes (the string dictionary
+        is shared with other relations, so it is not included)
+        """
+        row_keys_nbytes = 0 if self._row_keys is None else self._row_keys.nbytes
+        return self.nbytes + row_keys_nbytes + self.get_index_nbytes()
+
+    def get_code_arrays(self):
+        """
+        :return: the int64 code arrays of the columns, in order (two for a span column)
+        """
+        return [code_array for column in self.columns for code_array in column.get_code_arrays()]
+
+    def get_code_matrix(self):
+        """
+        :return: a (rows, codes per row) int64 array of the codes of every row
+        """
+        code_arrays = self.get_code_arrays()
+        return np.stack(code_arrays, axis=1) if code_arrays else np.empty((0, 0), dtype=np.int64)
+
+    def save(self, file):
+        """
+        writes the relation (without its indexes and its string dictionary, its string ids stay valid as long as
+        the dictionary is kept) to a binary file object
+        """
+        pickle.dump((self.name, self.schema), file, protocol=pickle.HIGHEST_PROTOCOL)
+        np.save(file, self.get_code_matrix(), allow_pickle=False)
+
+    @classmethod
+    def load(cls, file, string_dictionary):
+        """
+        reads a relation that save() wrote
+        :param string_dictionary: the dictionary that the relation's string ids refer to.
+        """
+        name, schema = pickle.load(file)
+        relation = cls(name, schema, string_dictionary)
+        relation.set_code_matrix(np.load(file, allow_pickle=False))
+        return relation
+
+    def save_columns(self, file):
+        """
+        writes the codes of the relation to a .npy file (a path or a binary file object), column by column (a (codes
+        per row, rows) int64 array), so map_columns() can map each code array of the file as it is
+        """
+        code_arrays = self.get_code_arrays()
+        np.save(file, np.stack(code_arrays) if len(self) else np.empty((len(code_arrays), 0), dtype=np.int64),
+                allow_pickle=False)
+
+    def map_columns(self, path):
+        """
+        replaces the rows of an empty relation with the rows in a file that save_columns() wrote. the file is memory
+        mapped copy on write, so its pages are read when they are used, and changes to the relation never reach the
+        file (a column is copied into memory when it grows).
+        """
+        code_matrix = np.load(path, mmap_mode='c', allow_pickle=False)
+        if not code_matrix.shape[1]:
+            code_matrix = np.empty(code_matrix.shape, dtype=np.int64)
+        assert code_matrix.dtype == np.int64 and len(code_matrix) == len(self.get_code_arrays()), \
+            "the file " + path + " does not hold the columns of relation " + self.name
+        self.set_code_arrays(list(code_matrix), copy=False)
+
+    def set_code_matrix(self, code_matrix):
+        """
+        replaces the rows of an empty relation with the rows of a code matrix (see get_code_matrix)
+        """
+        code_matrix = np.asarray(code_matrix, dtype=np.int64)
+        self.set_code_arrays([code_matrix[:, code_idx] for code_idx in range(code_matrix.shape[1])])
+
+    def set_code_arrays(self, code_arrays, copy=True):
+        """
+        replaces the rows of an empty relation with the rows of code arrays (see get_code_arrays), which must hold
+        distinct rows.
+        :param copy: whether to copy the codes, otherwise the columns keep the given arrays as their storage.
+        """
+        assert not len(self), "the relation " + self.name + " is not empty"
+        code_idx = 0
+        for column in self.columns:
+            column.set_code_arrays(code_arrays[code_idx:code_idx + column.code_width], copy)
+            code_idx += column.code_width
+        self._size = len(code_arrays[0]) if code_arrays else 0
+        self._row_keys = None
+        self._row_scan_count = 0
+        self._version += 1
+        for column_indices in list(self.indexes):
+            del self.indexes[column_indices]
+            self.create_index(column_indices)
+
+    def _find_row(self, row_codes):
+        """
+        :return: the index of the row with the given codes, or None if it is not in the relation
+        """
+        if self._row_keys is None:
+            self._row_scan_count += 1
+            if self._row_scan_count <= self.ROW_KEY_SCANS:
+                mask = np.ones(len(self), dtype=bool)
+                for code_array, code in zip(self.get_code_arrays(), self._get_key(row_codes)):
+                    mask &= code_array == code
+                row_idxs = np.flatnonzero(mask)
+                return int(row_idxs[0]) if len(row_idxs) else None
+            self._build_row_keys()
+        return self._row_keys.find(self._get_key(row_codes), self.get_code_arrays())
+
+    def _build_row_keys(self):
+        self._row_keys = RowKeyTable(self.get_code_arrays(), len(self))
+
+    def add_code_arrays(self, code_arrays):
+        """
+        adds the rows of code arrays (see get_code_arrays) at once, skipping the rows that are already in the
+        relation or that repeat in the arrays. the rows are added to an empty relation without building its row keys.
+        :return: an int64 array of the indices (in the arrays) of the rows that were added
+        """
+        code_arrays = [np.asarray(code_array, dtype=np.int64) for code_array in code_arrays]
+        new_idxs = self._get_distinct_row_idxs(code_arrays)
+        if not len(self) and not self.indexes:
+            self.set_code_arrays([code_array[new_idxs] for code_array in code_arrays])
+            return new_idxs
+        if self._row_keys is None:
+            self._build_row_keys()
+        found_row_idxs = self._row_keys.find_many(self.get_code_arrays(),
+                                                  [code_array[new_idxs] for code_array in code_arrays])
+        new_idxs = new_idxs[found_row_idxs == RowKeyTable.EMPTY]
+        first_row_idx = self._size
+        new_code_arrays = [code_array[new_idxs] for code_array in code_arrays]
+        code_idx = 0
+        for column in self.columns:
+            column.extend(new_code_arrays[code_idx:code_idx + column.code_width])
+            code_idx += column.code_width
+        self._size += len(new_idxs)
+        self._version += 1
+        self._row_keys.add_many(self.get_code_arrays(), np.arange(first_row_idx, self._size, dtype=np.int64))
+        for column_indices, index in self.indexes.items():
+            index_code_lists = [code_array[first_row_idx:].tolist() for column_idx in column_indices
+                                for code_array in self.columns[column_idx].get_code_arrays()]
+            for row_idx, index_key in enumerate(zip(*index_code_lists), first_row_idx):
+                index.add(index_key, row_idx)
+        return new_idxs
+
+    @staticmethod
+    def _get_distinct_row_idxs(code_arrays):
+        """
+        :return: a sorted int64 array of the index of the first row of each distinct row of code_arrays
+        """
+        if not len(code_arrays[0]):
+            return np.empty(0, dtype=np.int64)
+        # the rows are sorted by their hashes (which is faster than sorting them by their codes), with a stable sort so
+        # the first of the equal rows comes first
+        row_hashes = get_row_hashes(code_arrays)
+        order = np.argsort(row_hashes, kind="stable")
+        sorted_hashes = row_hashes[order]
+        is_first = np.ones(len(order), dtype=bool)
+        is_first[1:] = sorted_hashes[1:] != sorted_hashes[:-1]
+        same_hashes = ~is_first[1:]
+        for code_array in code_arrays:
+            sorted_codes = code_array[order]
+            if np.any(sorted_codes[1:][same_hashes] != sorted_codes[:-1][same_hashes]):
+                # distinct rows with the same hash, sort the rows by their codes instead
+                order = np.lexsort(code_arrays[::-1])
+                is_first[1:] = False
+                for sorted_codes in (code_array[order] for code_array in code_arrays):
+                    is_first[1:] |= sorted_codes[1:] != sorted_codes[:-1]
+                break
+        return np.sort(order[is_first])
+
+    def _encode_row(self, row, add=False):
+        """
+        :return: the codes of each value in row, or None if the row can not be in the relation
+        """
+        if len(row) != len(self.columns):
+            return None
+        row_codes = []
+        for column, value in zip(self.columns, row):
+            codes = column.encode(value, add)
+            if codes is None:
+                return None
+            row_codes.append(codes)
+        return row_codes
+
+    @staticmethod
+    def _get_key(row_codes):
+        """
+        :return: the codes of a row, flattened (as in get_code_arrays())
+        """
+        return tuple(code for codes in row_codes for code in codes)
+
+    @staticmethod
+    def _get_index_key(row_codes, column_indices):
+        return tuple(code for column_idx in column_indices for code in row_codes[column_idx])
+
+    def _to_codes(self, internal_row):
+        return [codes if code_width > 1 else (codes,) for codes, code_width in zip(internal_row, self._code_widths)]
+
+    @staticmethod
+    def _to_internal_row(row_codes):
+        return tuple(codes if len(codes) > 1 else codes[0] for codes in row_codes)
+
+    def encode_row(self, row, add=False):
+        """
+        :return: the internal form of row (see the module's docstring), or None if the row can not be in the
+            relation (with add, the strings of the row are added to the string dictionary)
+        """
+        row_codes = self._encode_row(row, add)
+        return None if row_codes is None else self._to_internal_row(row_codes)
+
+    def decode_row(self, internal_row):
+        return tuple(column.decode(codes) for column, codes in zip(self.columns, self._to_codes(internal_row)))
+
+    def add(self, row):
+        """
+        :param row: a sequence of values of the relation's types (str, int, and ast_nodes.Span or a (start, stop)
+            tuple).
+        :return: True if the row was added, False if it was already in the relation
+        """
+        row_codes = self._encode_row(row, add=True)
+        if row_codes is None:
+            raise ValueError("the row " + str(tuple(row)) + " does not fit the schema of relation " + self.name)
+        return self._add_codes(row_codes)
+
+    def add_internal(self, internal_row):
+        """
+        same as add(), for a row in internal form
+        """
+        return self._add_codes(self._to_codes(internal_row))
+
+    def _add_codes(self, row_codes):
+        if self._find_row(row_codes) is not None:
+            return False
+        row_idx = self._size
+        if self._row_keys is not None:
+            self._row_keys.add(self._get_key(row_codes), row_idx, self.get_code_arrays())
+        self._size += 1
+        self._version += 1
+        for column, codes in zip(self.columns, row_codes):
+            column.append(codes)
+        for column_indices, index in self.indexes.items():
+            index.add(self._get_index_key(row_codes, column_indices), row_idx)
+        return True
+
+    def remove(self, row):
+        """
+        :return: True if the row was removed, False if it was not in the relation
+        """
+        row_codes = self._encode_row(row)
+        return row_codes is not None and self._remove_codes(row_codes)
+
+    def remove_internal(self, internal_row):
+        return self._remove_codes(self._to_codes(internal_row))
+
+    def _remove_codes(self, row_codes):
+        row_idx = self._find_row(row_codes)
+        if row_idx is None:
+            return False
+        if self._row_keys is not None:
+            self._row_keys.remove(self._get_key(row_codes), row_idx)
+        self._size -= 1
+        self._version += 1
+        last_idx = self._size
+        last_row_codes = self._get_row_codes(last_idx) if row_idx != last_idx else row_codes
+        for column_indices, index in self.indexes.items():
+            index.remove(self._get_index_key(row_codes, column_indices), row_idx)
+            if row_idx != last_idx:
+                last_index_key = self._get_index_key(last_row_codes, column_indices)
+                index.remove(last_index_key, last_idx)
+                index.add(last_index_key, row_idx)
+        if row_idx != last_idx:
+            # move the last row into the removed row's place
+            if self._row_keys is not None:
+                self._row_keys.move(self._get_key(last_row_codes), last_idx, row_idx)
+            for column, codes in zip(self.columns, last_row_codes):
+                column.set(row_idx, codes)
+        for column in self.columns:
+            column.pop()
+        return True
+
+    def __contains__(self, row):
+        row_codes = self._encode_row(row)
+        return row_codes is not None and self._find_row(row_codes) is not None
+
+    def contains_internal(self, internal_row):
+        return self._find_row(self._to_codes(internal_row)) is not None
+
+    def _get_row_codes(self, row_idx):
+        return [column.get_codes(row_idx) for column in self.columns]
+
+    def get_row(self, row_idx):
+        return tuple(column.decode(column.get_codes(row_idx)) for column in self.columns)
+
+    def get_internal_row(self, row_idx):
+        return self._to_internal_row(self._get_row_codes(row_idx))
+
+    def iter_internal_rows(self, row_idxs=None):
+        """
+        :param row_idxs: an int64 array of the indices of the rows to read, every row if not given.
+        :return: an iterator of the rows in internal form, read from the code arrays a column at a time
+        """
+        column_values = []
+        for column in self.columns:
+            code_lists = [(code_array if row_idxs is None else code_array[row_idxs]).tolist()
+                          for code_array in column.get_code_arrays()]
+            column_values.append(code_lists[0] if len(code_lists) == 1 else zip(*code_lists))
+        return zip(*column_values)
+
+    def __iter__(self):
+        for row_idx in range(len(self)):
+            yield self.get_row(row_idx)
+
+    def get_statistics(self):
+        """
+        :return: a RelationStatistics of the relation, computed from the code arrays. like
+            execution.EvalRelation.get_statistics(), the distinct counts are computed again only when the relation has
+            doubled or halved since they were computed (so keeping them costs O(1) amortized per changed row), and in
+            between only the cardinality is kept current.
+        """
+        size = len(self)
+        if self._statistics is None or size > 2 * self._statistics_size or 2 * size < self._statistics_size:
+            distinct_counts = []
+            for column in self.columns:
+                code_arrays = column.get_code_arrays()
+                if len(code_arrays) == 1:
+                    distinct_counts.append(len(np.unique(code_arrays[0])))
+                else:
+                    distinct_counts.append(len(np.unique(np.stack(code_arrays, axis=1), axis=0)))
+            self._statistics = RelationStatistics(size, distinct_counts)
+            self._statistics_size = size
+        elif self._statistics.cardinality != size:
+            # a column can not have more distinct values than rows
+            self._statistics = RelationStatistics(
+                size, [min(distinct_count, size) for distinct_count in self._statistics.distinct_counts])
+        return self._statistics
+
+    def create_index(self, column_indices):
+        """
+        creates (if needed) a hash index over the given columns, it is kept up to date by add() and remove()
+        """
+        column_indices = tuple(column_indices)
+        if column_indices in self.indexes:
+            return self.indexes[column_indices]
+        index = HashIndex(column_indices, sum(self.columns[column_idx].code_width for column_idx in column_indices))
+        for row_idx in range(len(self)):
+            index.add(self._get_index_key(self._get_row_codes(row_idx), column_indices), row_idx)
+        self.indexes[column_indices] = index
+        return index
+
+    def drop_index(self, column_indices):
+        del self.indexes[tuple(column_indices)]
+
+    def get_index_nbytes(self):
+        return sum(index.nbytes for index in self.indexes.values())
+
+    def lookup(self, bindings):
+        """
+        :param bindings: a dict of column index -> value.
+        :return: an int64 array of the indices of the rows that hold the given values
+        """
+        row_codes = {}
+        for column_idx, value in bindings.items():
+            codes = self.columns[column_idx].encode(value)
+            if codes is None:
+                return np.empty(0, dtype=np.int64)
+            row_codes[column_idx] = codes
+        return self._lookup_codes(row_codes)
+
+    def lookup_internal(self, bindings):
+        """
+        same as lookup(), for values in internal form
+        """
+        return self._lookup_codes({column_idx: value if self._code_widths[column_idx] > 1 else (value,)
+                                   for column_idx, value in bindings.items()})
+
+    def _lookup_codes(self, row_codes):
+        column_indices = tuple(sorted(row_codes))
+        if len(column_indices) == len(self.columns):
+            # every column is bound, the row keys are an index over all the columns
+            row_idx = self._find_row([row_codes[column_idx] for column_idx in column_indices])
+            return np.array([] if row_idx is None else [row_idx], dtype=np.int64)
+        index = self.indexes.get(column_indices)
+        if index is not None:
+            rows = index.get_rows(self._get_index_key(row_codes, column_indices))
+            return np.fromiter(rows, dtype=np.int64, count=len(rows))
+        mask = np.ones(len(self), dtype=bool)
+        for column_idx, codes in row_codes.items():
+            for code_array, code in zip(self.columns[column_idx].get_code_arrays(), codes):
+                mask &= code_array == code
+        return np.flatnonzero(mask)
+
+    def lookup_keys_internal(self, column_indices, keys):
+        """
+        same as lookup_internal(), for many keys at once: a single scan of the code arrays of the columns, whatever
+        the number of keys.
+        :param keys: a collection of tuples of the (internal) values of the given columns.
+        :return: an int64 array of the indices of the rows that hold the values of one of the keys
+        """
+        column_indices = tuple(column_indices)
+        key_codes = [tuple(code for codes in self._to_key_codes(column_indices, key) for code in codes) for key in keys]
+        if not key_codes:
+            return np.empty(0, dtype=np.int64)
+        index = self.indexes.get(column_indices)
+        if index is not None:
+            return np.unique(np.fromiter(chain.from_iterable(map(index.get_rows, key_codes)), dtype=np.int64))
+        code_arrays = [code_array for column_idx in column_indices
+                       for code_array in self.columns[column_idx].get_code_arrays()]
+        # keep the rows whose codes are each a code of some key, and then the rows whose codes are of the same key
+        mask = np.ones(len(self), dtype=bool)
+        for code_array, codes in zip(code_arrays, np.array(key_codes, dtype=np.int64).T):
+            mask &= np.isin(code_array, codes)
+        row_idxs = np.flatnonzero(mask)
+        if len(code_arrays) == 1:
+            return row_idxs
+        key_codes = set(key_codes)
+        is_match = np.fromiter(map(key_codes.__contains__,
+                                   zip(*(code_array[row_idxs].tolist() for code_array in code_arrays))),
+                               dtype=bool, count=len(row_idxs))
+        return row_idxs[is_match]
+
+    def _to_key_codes(self, column_indices, key):
+        """
+        :return: the codes of each (internal) value of a key of the given columns
+        """
+        return [value if self._code_widths[column_idx] > 1 else (value,)
+                for column_idx, value in zip(column_indices, key)]
+
+
+class RelationStore:
+    """
+    the relations of a session, by name. their string columns share the store's string dictionary.
+
+    relations may be spilled to files (see spill()) to free their memory, a spilled relation is read back when it is
+    next gotten. the store keeps the relations in memory in the order they were last gotten, so the least recently
+    used ones are spilled first when the memory of the relations exceeds a budget (see enforce_memory_budget()).
+    """
+
+    def __init__(self, spill_directory=None, string_dictionary=None):
+        """
+        :param spill_directory: the directory that spilled relations are written to, a temporary directory (removed
+            by close()) if not given.
+        :param string_dictionary: the string_dictionary.StringDictionary of the relations, a new one if not given.
+        """
+        self.string_dictionary = StringDictionary() if string_dictionary is None else string_dictionary
+        # name -> relation, the least recently used relation first
+        self._relations = OrderedDict()
+        # name -> path of the file of a spilled relation
+        self._spilled_relations = dict()
+        self._spill_directory = spill_directory
+        self._owns_spill_directory = False
+        self._spill_count = 0
+
+    def declare(self, name, schema):
+        assert name not in self, "relation " + name + " is already declared"
+        relation = ColumnarRelation(name, schema, self.string_dictionary)
+        self._relations[name] = relation
+        return relation
+
+    def get_relation(self, name):
+        relation = self._relations.get(name)
+        if relation is None:
+            return self._load(name)
+        self._relations.move_to_end(name)
+        return relation
+
+    def remove_relation(self, name):
+        if name in self._spilled_relations:
+            os.remove(self._spilled_relations.pop(name))
+        else:
+            del self._relations[name]
+
+    def __contains__(self, name):
+        return name in self._relations or name in self._spilled_relations
+
+    def get_relations(self):
+        """
+        :return: every relation in the store (the spilled ones are read back)
+        """
+        return [self.get_relation(name) for name in list(self._relations) + list(self._spilled_relations)]
+
+    def is_spilled(self, name):
+        return name in self._spilled_relations
+
+    def get_memory_usage(self):
+        """
+        :return: the estimated memory of the relations in memory (see ColumnarRelation.get_memory_usage)
+        """
+        return sum(relation.get_memory_usage() for relation in self._relations.values())
+
+    def _get_spill_directory(self):
+        if self._spill_directory is None:
+            self._spill_directory = tempfile.mkdtemp(prefix="relations-")
+            self._owns_spill_directory = True
+        return self._spill_directory
+
+    def spill(self, name):
+        """
+        writes a relation to a file and drops it (and its indexes) from memory
+        """
+        relation = self._relations.pop(name)
+        path = os.path.join(self._get_spill_directory(), name + "-" + str(self._spill_count) + ".rel")
+        self._spill_count += 1
+        with open(path, "wb") as file:
+            relation.save(file)
+        self._spilled_relations[name] = path
+
+    def _load(self, name):
+        path = self._spilled_relations.pop(name)
+        with open(path, "rb") as file:
+            relation = ColumnarRelation.load(file, self.string_dictionary)
+        os.remove(path)
+        self._relations[name] = relation
+        return relation
+
+    def enforce_memory_budget(self, memory_budget, pinned_names=()):
+        """
+        spills the least recently used relations (except the pinned ones) until the relations in memory fit in
+        memory_budget bytes.
+        :return: the names of the spilled relations
+        """
+        memory_usage = self.get_memory_usage()
+        spilled_names = []
+        for name in list(self._relations):
+            if memory_usage <= memory_budget:
+                break
+            if name in pinned_names:
+                continue
+            memory_usage -= self._relations[name].get_memory_usage()
+            self.spill(name)
+            spilled_names.append(name)
+        return spilled_names
+
+    def close(self):
+        """
+        removes the files of the spilled relations
+        """
+        for path in self._spilled_relations.values():
+            os.remove(path)
+        self._spilled_relations.clear()
+        if self._owns_spill_directory:
+            shutil.rmtree(self._spill_directory, ignore_errors=True)
+            self._spill_directory = None
+            self._owns_spill_directory = False
@@ -0,0 +1,200 @@
+import numpy as np
+
+import ast_nodes
+
+INITIAL_CAPACITY = 16
+
+
+class SpanColumn:
+    """
+    a column of spans, kept as int64 arrays of starts and stops (and optionally of the ids of the spans' documents)
+    instead of an object per span.
+
+    the comparisons between columns are vectorized: they take a column of the same length (to compare the spans row
+    by row) or a single span (to compare every span to it), and return a bool array. spans of different documents
+    never contain or overlap each other. a column grows like a list, by doubling the capacity of its arrays.
+    """
+
+    def __init__(self, starts=(), stops=(), doc_ids=None):
+        starts = np.asarray(starts, dtype=np.int64)
+        stops = np.asarray(stops, dtype=np.int64)
+        assert starts.shape == stops.shape and starts.ndim == 1
+        self._size = len(starts)
+        capacity = max(INITIAL_CAPACITY, self._size)
+        self._starts = np.empty(capacity, dtype=np.int64)
+        self._stops = np.empty(capacity, dtype=np.int64)
+        self._starts[:self._size] = starts
+        self._stops[:self._size] = stops
+        self._doc_ids = None
+        if doc_ids is not None:
+            self._doc_ids = np.empty(capacity, dtype=np.int64)
+            self._doc_ids[:self._size] = doc_ids
+
+    @classmethod
+    def from_spans(cls, spans):
+        """
+        :param spans: ast_nodes.Span objects or (start, stop) tuples.
+        """
+        starts = []
+        stops = []
+        for span in spans:
+            start, stop = (span.start, span.stop) if type(span) is ast_nodes.Span else span
+            starts.append(start)
+            stops.append(stop)
+        return cls(starts, stops)
+
+    @classmethod
+    def from_arrays(cls, starts, stops):
+        """
+        :return: a column that keeps the given int64 arrays (e.g. memory mapped ones) as its storage, without copying
+            them until it grows
+        """
+        assert starts.dtype == np.int64 and stops.dtype == np.int64 and starts.shape == stops.shape
+        column = cls()
+        column._starts = starts
+        column._stops = stops
+        column._size = len(starts)
+        return column
+
+    def has_doc_ids(self):
+        return self._doc_ids is not None
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def starts(self):
+        return self._starts[:self._size]
+
+    @property
+    def stops(self):
+        return self._stops[:self._size]
+
+    @property
+    def doc_ids(self):
+        return None if self._doc_ids is None else self._doc_ids[:self._size]
+
+    @property
+    def nbytes(self):
+        return self._starts.nbytes + self._stops.nbytes + (0 if self._doc_ids is None else self._doc_ids.nbytes)
+
+    def _reserve(self, size):
+        capacity = len(self._starts)
+        if size <= capacity:
+            return
+        # a column that keeps the arrays it was given (see from_arrays()) may have no capacity
+        capacity = max(capacity, INITIAL_CAPACITY)
+        while capacity < size:
+            capacity *= 2
+        self._starts = np.resize(self._starts, capacity)
+        self._stops = np.resize(self._stops, capacity)
+        if self._doc_ids is not None:
+            self._doc_ids = np.resize(self._doc_ids, capacity)
+
+    def append(self, start, stop, doc_id=None):
+        assert (doc_id is None) == (self._doc_ids is None)
+        self._reserve(self._size + 1)
+        self._starts[self._size] = start
+        self._stops[self._size] = stop
+        if doc_id is not None:
+            self._doc_ids[self._size] = doc_id
+        self._size += 1
+
+    def extend(self, starts, stops, doc_ids=None):
+        assert (doc_ids is None) == (self._doc_ids is None)
+        new_size = self._size + len(starts)
+        self._reserve(new_size)
+        self._starts[self._size:new_size] = starts
+        self._stops[self._size:new_size] = stops
+        if doc_ids is not None:
+            self._doc_ids[self._size:new_size] = doc_ids
+        self._size = new_size
+
+    def set(self, idx, start, stop, doc_id=None):
+        assert 0 <= idx < self._size
+        self._starts[idx] = start
+        self._stops[idx] = stop
+        if doc_id is not None:
+            self._doc_ids[idx] = doc_id
+
+    def pop(self):
+        """
+        removes the last span, a row is removed from a relation by moving its last row into its place
+        """
+        assert self._size > 0
+        self._size -= 1
+
+    def __getitem__(self, idx):
+        """
+        :param idx: an int (returns an ast_nodes.Span), or a slice, an index array or a bool mask (returns a
+            SpanColumn).
+        """
+        if isinstance(idx, (int, np.integer)):
+            if idx < 0:
+                idx += self._size
+            if not 0 <= idx < self._size:
+                raise IndexError("span column index out of range")
+            return ast_nodes.Span(int(self._starts[idx]), int(self._stops[idx]))
+        doc_ids = None if self._doc_ids is None else self.doc_ids[idx]
+        return SpanColumn(self.starts[idx], self.stops[idx], doc_ids)
+
+    def __iter__(self):
+        return (ast_nodes.Span(start, stop) for start, stop in zip(self.starts.tolist(), self.stops.tolist()))
+
+    def __repr__(self):
+        return "SpanColumn(" + str(self._size) + " spans)"
+
+    def _get_other_arrays(self, other):
+        """
+        :return: (starts, stops, doc_ids) of other, a SpanColumn of the same length or a single span
+        """
+        if isinstance(other, SpanColumn):
+            assert len(other) == self._size
+            return other.starts, other.stops, other.doc_ids
+        start, stop = (other.start, other.stop) if type(other) is ast_nodes.Span else other
+        return start, stop, None
+
+    def _same_documents(self, other_doc_ids, result):
+        if self._doc_ids is None or other_doc_ids is None:
+            return result
+        return result & (self.doc_ids == other_doc_ids)
+
+    def lengths(self):
+        return self.stops - self.starts
+
+    def contains(self, other):
+        """
+        :return: a bool array, whether each span contains other (or the span in the same row of other)
+        """
+        other_starts, other_stops, other_doc_ids = self._get_other_arrays(other)
+        result = (self.starts <= other_starts) & (other_stops <= self.stops)
+        return self._same_documents(other_doc_ids, result)
+
+    def is_contained_in(self, other):
+        other_starts, other_stops, other_doc_ids = self._get_other_arrays(other)
+        result = (other_starts <= self.starts) & (self.stops <= other_stops)
+        return self._same_documents(other_doc_ids, result)
+
+    def overlaps(self, other):
+        """
+        :return: a bool array, whether each span shares at least one position with other (or with the span in the
+            same row of other)
+        """
+        other_starts, other_stops, other_doc_ids = self._get_other_arrays(other)
+        result = (self.starts < other_stops) & (other_starts < self.stops)
+        return self._same_documents(other_doc_ids, result)
+
+    def equals(self, other):
+        other_starts, other_stops, other_doc_ids = self._get_other_arrays(other)
+        result = (self.starts == other_starts) & (self.stops == other_stops)
+        return self._same_documents(other_doc_ids, result)
+
+    def argsort(self):
+        """
+        :return: the indices that sort the spans by document, start and then stop
+        """
+        keys = (self.stops, self.starts) if self._doc_ids is None else (self.stops, self.starts, self.doc_ids)
+        return np.lexsort(keys)
+
+    def sorted(self):
+        return self[self.argsort()]
@@ -0,0 +1,78 @@
+import sys
+from itertools import filterfalse
+
+
+class StringDictionary:
+    """
+    maps every string of a session (the string values of variables, facts and rule constants) to a dense int id.
+
+    the string columns of relations hold the ids, so a string is kept once no matter how many rows hold it, and the
+    joins compare, hash and deduplicate ints. the ids are decoded back to strings only for output.
+    """
+
+    # rough size (in bytes) of the list and dict entries of a string, without the string itself
+    ENTRY_BYTES = 100
+
+    def __init__(self, strings=()):
+        self.strings = []
+        self._string_to_id = dict()
+        self._strings_nbytes = 0
+        self.extend(strings)
+
+    def __len__(self):
+        return len(self.strings)
+
+    def __contains__(self, string):
+        return string in self._string_to_id
+
+    def get_id(self, string, add=False):
+        """
+        :return: the id of string, or None if it is not in the dictionary and add is False
+        """
+        string_id = self._string_to_id.get(string)
+        if string_id is None and add:
+            string_id = len(self.strings)
+            self.strings.append(string)
+            self._string_to_id[string] = string_id
+            self._strings_nbytes += sys.getsizeof(string)
+        return string_id
+
+    def get_ids(self, strings):
+        """
+        :param strings: distinct strings, the ones that are not in the dictionary are added.
+        :return: a sequence of the ids of the strings
+        """
+        new_strings = list(filterfalse(self._string_to_id.__contains__, strings))
+        first_id = len(self.strings)
+        self.extend(new_strings)
+        if len(new_strings) == len(strings):
+            # every string is new, so they got consecutive ids in order
+            return range(first_id, len(self.strings))
+        return list(map(self._string_to_id.__getitem__, strings))
+
+    def extend(self, strings):
+        """
+        adds distinct strings that are not in the dictionary, in order (so the strings of a dictionary are added to an
+        empty one with the same ids)
+        """
+        first_id = len(self.strings)
+        self.strings.extend(strings)
+        self._string_to_id.update(zip(self.strings[first_id:], range(first_id, len(self.strings))))
+        assert len(self._string_to_id) == len(self.strings), "the strings are not distinct"
+        self._strings_nbytes += sum(map(sys.getsizeof, self.strings[first_id:]))
+
+    def get_string(self, string_id):
+        return self.strings[string_id]
+
+    def intern(self, string):
+        """
+        :return: the dictionary's copy of string (which is added if needed), so equal strings share one object
+        """
+        return self.strings[self.get_id(string, add=True)]
+
+    @property
+    def nbytes(self):
+        """
+        an estimate of the memory of the dictionary
+        """
+        return self._strings_nbytes + len(self.strings) * self.ENTRY_BYTES
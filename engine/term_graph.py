@@ -0,0 +1,173 @@
+from abc import ABC, abstractmethod
+
+import networkx as nx
+
+# the states of a term: a computed term is up to date, a dirty term was computed but some of the terms it depends on
+# changed since (and it can be brought up to date by applying their changes), a term that is not computed has to be
+# computed from scratch
+COMPUTED = "computed"
+NOT_COMPUTED = "not computed"
+DIRTY = "dirty"
+
+
+class MemoryHeapBase(ABC):
+    @abstractmethod
+    def collect_garbage(self):
+        pass
+
+
+# TODO: the term graph is itself a heap, what use is there to have a separate
+# TODO: structure for it? better just force it to implement heap methods imo
+# TODO: i assume some optimizations would not occur on a single node but rather,
+# TODO: they would happen on the entire term graph (global optimizations)
+# TODO: what interface would be comfy for this purpose?
+class TermGraphBase(MemoryHeapBase):
+    @abstractmethod
+    def add_term(self, name, data):
+        pass
+
+    @abstractmethod
+    def remove_term(self, name):
+        pass
+
+    @abstractmethod
+    def get_node_state(self, name):
+        # for now, computed / not computed / dirty
+        pass
+
+    @abstractmethod
+    def get_term_data(self, name):
+        # will be called to get an AST and send it to the execution engine
+        # or get the result of a node's computation
+        pass
+
+    @abstractmethod
+    def transform_node_data(self, name, transformer):
+        pass
+
+    @abstractmethod
+    def transform_graph(self):
+        pass
+
+
+class TermGraph(TermGraphBase):
+    """
+    the dependency graph of the relations: a term is a relation, with an edge from every relation to the relations
+    whose rules use it. the data of a derived relation's term is the list of its rules, a base relation's term has no
+    data (and is always computed).
+
+    a change of a term makes the terms that depend on it stale: mark_dirty() makes the computed ones dirty (their
+    changes can be maintained incrementally) and invalidate() makes them not computed.
+    """
+
+    def __init__(self):
+        self._g = nx.DiGraph()
+
+    def __contains__(self, name):
+        return name in self._g
+
+    def add_term(self, name, data=None):
+        """
+        adds a term that is not computed, or replaces the data of an existing term (which makes it not computed)
+        """
+        if name in self._g:
+            self._g.nodes[name]['data'] = data
+            self.invalidate(name)
+        else:
+            self._g.add_node(name, data=data, state=NOT_COMPUTED)
+
+    def add_base_term(self, name):
+        """
+        adds (if needed) the term of a base relation, which is always computed
+        """
+        if name not in self._g:
+            self._g.add_node(name, data=None, state=COMPUTED)
+
+    def add_dependency(self, name, dependent_name):
+        """
+        records that the term dependent_name is computed from the term name
+        """
+        self._g.add_edge(name, dependent_name)
+
+    def remove_term(self, name):
+        self._g.remove_node(name)
+
+    def get_node_state(self, name):
+        return self._g.nodes[name]['state']
+
+    def set_node_state(self, name, state):
+        self._g.nodes[name]['state'] = state
+
+    def get_term_data(self, name):
+        return self._g.nodes[name]['data']
+
+    def get_terms(self, state=None):
+        """
+        :return: the names of the terms (in the given state)
+        """
+        return [name for name, node_state in self._g.nodes(data='state') if state is None or node_state == state]
+
+    def get_dependencies(self, name):
+        """
+        :return: the terms that a term is computed from, directly or through other terms
+        """
+        return nx.ancestors(self._g, name)
+
+    def get_dependents(self, name):
+        return nx.descendants(self._g, name)
+
+    def is_recursive(self, names):
+        """
+        :return: whether the terms of a strongly connected component depend on themselves
+        """
+        return len(names) > 1 or any(self._g.has_edge(name, name) for name in names)
+
+    def get_strata(self, names):
+        """
+        :return: the strongly connected components of the subgraph of the given terms, in an order in which every
+            component comes after the components it depends on
+        """
+        condensed_graph = nx.condensation(self._g.subgraph(names))
+        return [condensed_graph.nodes[component_idx]['members']
+                for component_idx in nx.topological_sort(condensed_graph)]
+
+    def invalidate(self, name):
+        """
+        marks a (non base) term and the terms that depend on it as not computed
+        :return: the terms whose state changed
+        """
+        invalidated = []
+        for term_name in self.get_dependents(name) | {name}:
+            if self._g.nodes[term_name]['data'] is not None and self.get_node_state(term_name) != NOT_COMPUTED:
+                self.set_node_state(term_name, NOT_COMPUTED)
+                invalidated.append(term_name)
+        return invalidated
+
+    def mark_dirty(self, name):
+        """
+        marks the computed terms that depend on a term as dirty
+        :return: whether any term that depends on the term is dirty (so its changes have to be maintained)
+        """
+        has_dirty_dependents = False
+        for term_name in self.get_dependents(name):
+            if self.get_node_state(term_name) != NOT_COMPUTED:
+                self.set_node_state(term_name, DIRTY)
+                has_dirty_dependents = True
+        return has_dirty_dependents
+
+    def transform_node_data(self, name, transformer):
+        assert callable(transformer)
+        return transformer(self._g.nodes[name]['data'])
+
+    def get_graph(self):
+        return self._g
+
+    def collect_garbage(self):
+        """
+        :return: the names of the derived terms that are not computed, whatever was computed for them before (e.g.
+            a materialized relation) is stale and may be reclaimed
+        """
+        return [name for name in self.get_terms(NOT_COMPUTED) if self.get_term_data(name) is not None]
+
+    def transform_graph(self):
+        pass
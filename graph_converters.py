@@ -1,8 +1,9 @@
 from abc import ABC, abstractmethod
 from lark import Tree as LarkTree
 import networkx as nx
-from custom_trees import NetxTree
+from custom_trees import ArrayTree, NetxTree
 from collections import deque
+import ast_nodes
 
 
 class Converter(ABC):
@@ -83,3 +84,226 @@ class NetxTreeToLarkTreeConverter(Converter):
                     assert child_netx_node in netx_value_attr
                     cur_lark_node.children.append(netx_value_attr[child_netx_node])
         return lark_tree
+
+
+class _ArrayTreeBuilder:
+    """
+    collects the nodes of an ArrayTree in breadth first order
+    """
+
+    def __init__(self):
+        self.parent = []
+        self.first_child = []
+        self.child_count = []
+        self.label_id = []
+        self.value_index = []
+        self.labels = []
+        self.values = []
+        self._label_to_id = dict()
+
+    def add_inner_node(self, parent, label):
+        if label not in self._label_to_id:
+            self._label_to_id[label] = len(self.labels)
+            self.labels.append(label)
+        self.parent.append(parent)
+        self.label_id.append(self._label_to_id[label])
+        self.value_index.append(-1)
+        self.first_child.append(-1)
+        self.child_count.append(0)
+        return len(self.parent) - 1
+
+    def add_leaf(self, parent, value):
+        self.parent.append(parent)
+        self.label_id.append(-1)
+        self.value_index.append(len(self.values))
+        self.values.append(value)
+        self.first_child.append(-1)
+        self.child_count.append(0)
+        return len(self.parent) - 1
+
+    def set_children_range(self, node, first_child, child_count):
+        if child_count:
+            self.first_child[node] = first_child
+            self.child_count[node] = child_count
+
+    def build(self):
+        return ArrayTree(self.parent, self.first_child, self.child_count, self.label_id, self.value_index,
+                         self.labels, self.values)
+
+
+class LarkTreeToArrayTreeConverter(Converter):
+    """
+    Converts a lark tree to an array tree
+    """
+
+    def __init__(self):
+        super().__init__()
+
+    @staticmethod
+    def convert(lark_tree: LarkTree) -> ArrayTree:
+        builder = _ArrayTreeBuilder()
+        q = deque()
+        q.append((builder.add_inner_node(-1, lark_tree.data), lark_tree))
+        while q:
+            cur_array_node, cur_lark_node = q.popleft()
+            first_child = len(builder.parent)
+            for child_lark_node in cur_lark_node.children:
+                if isinstance(child_lark_node, LarkTree):
+                    q.append((builder.add_inner_node(cur_array_node, child_lark_node.data), child_lark_node))
+                else:
+                    builder.add_leaf(cur_array_node, child_lark_node)
+            builder.set_children_range(cur_array_node, first_child, len(cur_lark_node.children))
+        return builder.build()
+
+
+class ArrayTreeToLarkTreeConverter(Converter):
+    """
+    Converts an array tree to a lark tree
+    """
+
+    def __init__(self):
+        super().__init__()
+
+    @staticmethod
+    def convert(array_tree: ArrayTree) -> LarkTree:
+        labels = array_tree.labels
+        values = array_tree.values
+        lark_nodes = []
+        # the breadth first order creates each parent before its children, and the children in their order
+        for parent, label_id, value_index in zip(array_tree.parent.tolist(), array_tree.label_id.tolist(),
+                                                 array_tree.value_index.tolist()):
+            if label_id >= 0:
+                node = LarkTree(labels[label_id], [])
+            else:
+                node = values[value_index]
+            lark_nodes.append(node)
+            if parent >= 0:
+                lark_nodes[parent].children.append(node)
+        return lark_nodes[0]
+
+
+class NetxTreeToArrayTreeConverter(Converter):
+    """
+    Converts a Networkx tree to an array tree
+    """
+
+    def __init__(self):
+        super().__init__()
+
+    @staticmethod
+    def convert(netx_tree: NetxTree) -> ArrayTree:
+        builder = _ArrayTreeBuilder()
+        node_attrs = netx_tree.nodes
+        netx_root = netx_tree.get_root()
+        q = deque()
+        q.append((builder.add_inner_node(-1, node_attrs[netx_root]["data"]), netx_root))
+        while q:
+            cur_array_node, cur_netx_node = q.popleft()
+            first_child = len(builder.parent)
+            child_count = 0
+            for child_netx_node in netx_tree.successors(cur_netx_node):
+                child_attrs = node_attrs[child_netx_node]
+                if "data" in child_attrs:
+                    q.append((builder.add_inner_node(cur_array_node, child_attrs["data"]), child_netx_node))
+                else:
+                    builder.add_leaf(cur_array_node, child_attrs["value"])
+                child_count += 1
+            builder.set_children_range(cur_array_node, first_child, child_count)
+        return builder.build()
+
+
+class ArrayTreeToNetxTreeConverter(Converter):
+    """
+    Converts an array tree to a Networkx tree.
+    The Networkx nodes are the array tree's node numbers.
+    """
+
+    def __init__(self):
+        super().__init__()
+
+    @staticmethod
+    def convert(array_tree: ArrayTree) -> NetxTree:
+        netx_tree = NetxTree(root=0)
+        labels = array_tree.labels
+        values = array_tree.values
+        for node, (label_id, value_index) in enumerate(zip(array_tree.label_id.tolist(),
+                                                           array_tree.value_index.tolist())):
+            if label_id >= 0:
+                netx_tree.add_node(node, data=labels[label_id])
+            else:
+                netx_tree.add_node(node, value=values[value_index])
+        # the edges are added in the children's order, which keeps the order of each node's successors
+        netx_tree.add_edges_from(zip(array_tree.parent[1:].tolist(), range(1, len(array_tree))))
+        return netx_tree
+
+
+class LarkTreeToAstConverter(Converter):
+    """
+    Converts a checked lark tree (without tokens, see lark_passes) to a list of ast_nodes statements.
+    the conversion comes after the semantic passes, which check the lark tree, so it assumes a well formed tree.
+    """
+
+    def __init__(self):
+        super().__init__()
+
+    @staticmethod
+    def convert(lark_tree: LarkTree) -> list:
+        if lark_tree.data != "start":
+            return [LarkTreeToAstConverter.convert_statement(lark_tree)]
+        return [LarkTreeToAstConverter.convert_statement(statement) for statement in lark_tree.children]
+
+    @staticmethod
+    def convert_statement(statement: LarkTree) -> ast_nodes.Statement:
+        line = statement.meta.line if not statement.meta.empty else None
+        children = statement.children
+        data = statement.data
+        if data in ("assign_literal_string", "assign_span", "assign_int", "assign_var"):
+            return ast_nodes.Assignment(children[0].children[0], _convert_term(children[1]), line)
+        if data in ("assign_string_from_file_string_param", "assign_string_from_file_var_param"):
+            return ast_nodes.ReadAssignment(children[0].children[0], _convert_term(children[1]), line)
+        if data == "relation_declaration":
+            schema = tuple(ast_nodes.DECL_TERM_TO_VAR_TYPE[term.data] for term in children[1].children)
+            return ast_nodes.RelationDeclaration(children[0].children[0], schema, line)
+        if data == "add_fact":
+            return ast_nodes.AddFact(children[0].children[0], _convert_term_list(children[1]), line)
+        if data == "remove_fact":
+            return ast_nodes.RemoveFact(children[0].children[0], _convert_term_list(children[1]), line)
+        if data == "query":
+            return ast_nodes.Query(_convert_rule_body_relation(children[0]), line)
+        if data == "rule":
+            head_node, body_node = children
+            head_free_vars = tuple(free_var_node.children[0] for free_var_node in head_node.children[1].children)
+            body = tuple(_convert_rule_body_relation(relation_node)
+                         for relation_node in body_node.children[0].children)
+            return ast_nodes.Rule(head_node.children[0].children[0], head_free_vars, body, line)
+        assert 0, "unknown statement: " + data
+
+
+def _convert_term(term_node):
+    data = term_node.data
+    if data in ("string", "integer"):
+        return term_node.children[0]
+    if data == "var_name":
+        return ast_nodes.VarName(term_node.children[0])
+    if data == "free_var_name":
+        return ast_nodes.FreeVar(term_node.children[0])
+    if data == "span":
+        start_node, stop_node = term_node.children
+        return ast_nodes.Span(start_node.children[0], stop_node.children[0])
+    assert 0, "unknown term: " + data
+
+
+def _convert_term_list(term_list_node):
+    return tuple(_convert_term(term_node) for term_node in term_list_node.children)
+
+
+def _convert_rule_body_relation(relation_node):
+    children = relation_node.children
+    if relation_node.data == "relation":
+        return ast_nodes.Relation(children[0].children[0], _convert_term_list(children[1]))
+    if relation_node.data == "func_ie_relation":
+        return ast_nodes.FuncIERelation(children[0].children[0], _convert_term_list(children[1]),
+                                        _convert_term_list(children[2]))
+    assert relation_node.data == "rgx_ie_relation"
+    return ast_nodes.RgxIERelation(_convert_term_list(children[0]), _convert_term_list(children[1]),
+                                   _convert_term(children[2]))
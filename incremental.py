@@ -0,0 +1,150 @@
+from collections import OrderedDict
+
+import engine
+import graph_converters
+import lark_passes
+import parser_factory
+from pass_manager import PassManager
+from statement_splitter import iter_statements
+
+
+def shift_tree_lines(tree, line_delta):
+    """
+    moves the positions of a parse tree (and all of its subtrees) line_delta lines down
+    """
+    for subtree in tree.iter_subtrees():
+        meta = subtree.meta
+        if not meta.empty:
+            meta.line += line_delta
+            meta.end_line += line_delta
+
+
+def get_assigned_var_name(statement):
+    """
+    :return: the name of the variable that a (normalized) statement tree assigns, or None if it is not an assignment
+    """
+    if statement.data.startswith("assign_"):
+        return statement.children[0].children[0]
+    return None
+
+
+def get_defined_relation_name(statement):
+    """
+    :return: the name of the relation that a (normalized) statement tree defines, or None if it does not define one
+    """
+    if statement.data == "relation_declaration":
+        return statement.children[0].children[0]
+    if statement.data == "rule":
+        return statement.children[0].children[0].children[0]
+    return None
+
+
+class IncrementalFrontEnd:
+    """
+    parses, checks and executes a program one top-level statement at a time.
+
+    the semantic checks keep their state between calls to run(), and every checked statement is converted to an
+    ast_nodes statement and fed to the session (the checks run on the statement's lark tree, only the session keeps the
+    ast). a call to run() only pays for the statements it was given, no matter how long the program that was run before
+    it is. parse trees are cached by the statement's text and line, so running the same cell again does not parse its
+    unchanged statements again. the line is part of the key since the positions in a tree are absolute: the same text on
+    two lines (even of one cell) gets two trees, so the errors of each report its own line.
+    """
+
+    def __init__(self, session=None, parser=None, max_cached_statements=10000):
+        self.session = engine.Session() if session is None else session
+        self._parser = parser_factory.get_parser(normalize_tokens=True) if parser is None else parser
+        self._normalizing_parser = parser_factory.is_normalizing_parser(self._parser)
+        self._max_cached_statements = max_cached_statements
+        # (statement text, line number) -> normalized parse tree, whose positions are in the lines of the run's text
+        self._parsed_statements = OrderedDict()
+        self._pass_manager = PassManager([
+            lark_passes.CheckReferencedVariablesInterpreter,
+            lark_passes.CheckReferencedRelationsInterpreter,
+            lark_passes.CheckRuleSafetyVisitor,
+            lark_passes.TypeCheckingInterpreter(type_environment=self.session.type_environment)
+        ])
+        self._variables_pass = self._pass_manager.get_pass(lark_passes.CheckReferencedVariablesInterpreter)
+        self._relations_pass = self._pass_manager.get_pass(lark_passes.CheckReferencedRelationsInterpreter)
+        # a session may already hold variables and relations (e.g. one restored from a snapshot), the checks of new
+        # statements start from them
+        for var_name in self.session.type_environment.var_name_to_type:
+            self._variables_pass.define_var(var_name)
+        for relation_name, schema in self.session.type_environment.relation_name_to_schema.items():
+            self._relations_pass.define_relation(relation_name, len(schema),
+                                                 relation_name in self.session.type_environment.rule_name_to_nodes)
+
+    def run(self, text):
+        """
+        parses, checks and executes the statements in text, after all the statements of the previous runs.
+        if a statement is parsed but does not pass the checks (or fails to execute), the statements before it stay
+        executed, and the checks forget what the failed statement defined.
+        :param text: a part of a program, e.g. a notebook cell. line numbers in errors are relative to it.
+        :return: a list of the results of the queries in text (see engine.Session.update_state), in the order of the
+            queries
+        """
+        # parse the whole text before executing any of it so a syntax error leaves the session untouched
+        trees = [self._parse_statement(statement_text, line) for statement_text, line in iter_statements(text)]
+        query_results = []
+        for tree in trees:
+            # the statement splitter puts each statement in its own tree
+            assert len(tree.children) <= 1
+            if not tree.children:
+                continue
+            result = self._run_statement_tree(tree)
+            if tree.children[0].data == "query":
+                query_results.append(result)
+        return query_results
+
+    def _parse_statement(self, statement_text, line):
+        key = (statement_text, line)
+        tree = self._parsed_statements.get(key)
+        if tree is not None:
+            self._parsed_statements.move_to_end(key)
+            return tree
+        tree = self._parser.parse(statement_text)
+        if not self._normalizing_parser:
+            tree = lark_passes.RemoveTokensTransformer().transform(tree)
+            lark_passes.StringVisitor().visit(tree)
+        if line != 1:
+            shift_tree_lines(tree, line - 1)
+        self._parsed_statements[key] = tree
+        if len(self._parsed_statements) > self._max_cached_statements:
+            self._parsed_statements.popitem(last=False)
+        return tree
+
+    def _run_statement_tree(self, tree):
+        """
+        checks the statement of a tree and executes it in the session. if either fails, the variable or the relation
+        that the checks defined for the statement is undone (the type of a reassigned variable, and the schemas of
+        the rules that use it, are restored), so the checks keep agreeing with the session.
+        :return: the result of the statement if it is a query, None otherwise
+        """
+        statement = tree.children[0]
+        type_environment = self.session.type_environment
+        defined_relation_name = get_defined_relation_name(statement)
+        relation_was_defined = defined_relation_name in self._relations_pass.relation_name_to_arity
+        assigned_var_name = get_assigned_var_name(statement)
+        var_was_defined = assigned_var_name in self._variables_pass.vars
+        old_var_type = type_environment.var_name_to_type.get(assigned_var_name)
+        # a new type of a variable may change the schemas of the rules that use it
+        old_schemas = dict(type_environment.relation_name_to_schema) \
+            if var_was_defined and type_environment.get_rules_depending_on_var(assigned_var_name) else None
+        try:
+            self._pass_manager.run(tree)
+            return self.session.update_state(graph_converters.LarkTreeToAstConverter.convert_statement(statement))
+        except Exception:
+            if defined_relation_name is not None and not relation_was_defined:
+                self._relations_pass.undefine_relation(defined_relation_name)
+                type_environment.remove_relation(defined_relation_name)
+            elif defined_relation_name is not None and statement.data == "rule":
+                # another rule of a relation that rules define
+                type_environment.remove_rule(defined_relation_name, statement)
+            if assigned_var_name is not None and not var_was_defined:
+                self._variables_pass.vars.discard(assigned_var_name)
+                type_environment.var_name_to_type.pop(assigned_var_name, None)
+            elif assigned_var_name is not None:
+                type_environment.var_name_to_type[assigned_var_name] = old_var_type
+                if old_schemas is not None:
+                    type_environment.relation_name_to_schema.update(old_schemas)
+            raise
@@ -1,5 +1,6 @@
 from lark import Lark, Transformer, v_args, Visitor, Tree
 from lark.visitors import Interpreter, Visitor_Recursive
+from collections import deque
 from enum import Enum
 import exceptions
 
@@ -18,7 +19,11 @@ class VarTypes(Enum):
 
 
 def get_error_line_string(tree):
-    return "line " + str(tree.meta.line) + ": "
+    return get_line_string(tree.meta.line)
+
+
+def get_line_string(line):
+    return "line " + str(line) + ": "
 
 
 def assert_correct_node(tree, node_name, len_children=None, *children_names):
@@ -34,6 +39,41 @@ def assert_correct_node(tree, node_name, len_children=None, *children_names):
                                                     "\n actual child name: " + tree.children[idx].data
 
 
+def get_safe_relation_order(relations_input_free_vars, relations_output_free_vars):
+    """
+    finds the order in which the relations of a rule body become safe (see CheckRuleSafetyVisitor).
+    a worklist algorithm: every relation waits on its unbound input free variables, and binding a free variable
+    releases the relations that wait on it. each relation and each free variable is processed once.
+    :param relations_input_free_vars: a list of the set of input free variables of each relation.
+    :param relations_output_free_vars: a list of the set of output free variables of each relation.
+    :return: a tuple of (a list of the indexes of the safe relations, in the order they become safe,
+                         the set of bound free variables)
+    """
+    free_var_to_waiting_relations = dict()
+    unbound_input_counts = []
+    safe_relations = deque()
+    for idx, input_free_vars in enumerate(relations_input_free_vars):
+        unbound_input_counts.append(len(input_free_vars))
+        if not input_free_vars:
+            safe_relations.append(idx)
+        for free_var in input_free_vars:
+            free_var_to_waiting_relations.setdefault(free_var, []).append(idx)
+    safe_relation_order = []
+    bound_free_vars = set()
+    while safe_relations:
+        idx = safe_relations.popleft()
+        safe_relation_order.append(idx)
+        for free_var in relations_output_free_vars[idx]:
+            if free_var in bound_free_vars:
+                continue
+            bound_free_vars.add(free_var)
+            for waiting_idx in free_var_to_waiting_relations.pop(free_var, ()):
+                unbound_input_counts[waiting_idx] -= 1
+                if unbound_input_counts[waiting_idx] == 0:
+                    safe_relations.append(waiting_idx)
+    return safe_relation_order, bound_free_vars
+
+
 @v_args(inline=False)
 class RemoveTokensTransformer(Transformer):
     """
@@ -41,6 +81,9 @@ class RemoveTokensTransformer(Transformer):
     should be used before all the other passes as they assume no tokens exists
     """
 
+    handled_nodes = {"INT", "LOWER_CASE_NAME", "UPPER_CASE_NAME", "STRING"}
+    dependencies = ()
+
     def __init__(self):
         super().__init__(visit_tokens=True)
 
@@ -58,12 +101,43 @@ class RemoveTokensTransformer(Transformer):
         return args[1:-1]
 
 
+class ParseTimeNormalizationTransformer(Transformer):
+    """
+    normalizes the lark tree while it is being parsed.
+    meant to be the lalr parser's inline transformer (see parser_factory), so the tree comes out of the parser without
+    tokens and with fixed strings. it does the work of RemoveTokensTransformer and StringVisitor, and those passes
+    should not run on its trees.
+    """
+
+    def integer(self, args):
+        return Tree("integer", [int(args[0])])
+
+    def string(self, args):
+        # removes the quotation marks and the line overflow escapes
+        return Tree("string", [args[0][1:-1].replace('\\\n', '')])
+
+    def var_name(self, args):
+        return Tree("var_name", [args[0][0:]])
+
+    def free_var_name(self, args):
+        return Tree("free_var_name", [args[0][0:]])
+
+    def relation_name(self, args):
+        return Tree("relation_name", [args[0][0:]])
+
+    def function_name(self, args):
+        return Tree("function_name", [args[0][0:]])
+
+
 class StringVisitor(Visitor_Recursive):
     """
      Fixes the strings in the lark tree.
      Removes the line overflow escapes from strings
      """
 
+    handled_nodes = {"string"}
+    dependencies = (RemoveTokensTransformer,)
+
     def string(self, tree):
         tree.children[0] = tree.children[0].replace('\\\n', '')
 
@@ -74,21 +148,30 @@ class CheckReferencedVariablesInterpreter(Interpreter):
     checks whether each variable reference refers to a defined variable.
     """
 
+    handled_nodes = {"assign_literal_string", "assign_string_from_file_string_param",
+                     "assign_string_from_file_var_param", "assign_span", "assign_int", "assign_var", "relation",
+                     "add_fact", "remove_fact", "rgx_ie_relation", "func_ie_relation"}
+    dependencies = (RemoveTokensTransformer,)
+
     def __init__(self):
         super().__init__()
         self.vars = set()
 
+    def define_var(self, var_name):
+        self.vars.add(var_name)
+
+    def check_var_defined(self, var_name, line):
+        if var_name not in self.vars:
+            raise exceptions.VariableNotDefinedError(
+                get_line_string(line) + "variable " + var_name + " is not defined")
+
     def __add_var_name_to_vars(self, var_name_node):
         assert_correct_node(var_name_node, "var_name", 1)
-        var_name = var_name_node.children[0]
-        self.vars.add(var_name)
+        self.define_var(var_name_node.children[0])
 
     def __check_if_var_not_defined(self, var_name_node):
         assert_correct_node(var_name_node, "var_name", 1)
-        var_name = var_name_node.children[0]
-        if var_name not in self.vars:
-            raise exceptions.VariableNotDefinedError(
-                get_error_line_string(var_name_node) + "variable " + var_name + " is not defined")
+        self.check_var_defined(var_name_node.children[0], var_name_node.meta.line)
 
     def __check_if_vars_in_list_not_defined(self, tree):
         assert tree.data in NODES_OF_LIST_WITH_VAR_NAMES
@@ -151,43 +234,78 @@ class CheckReferencedRelationsInterpreter(Interpreter):
     A lark tree semantic check.
     checks whether each non ie relation reference refers to a defined relation.
     Also checks if the relation reference uses the correct arity.
+
+    a relation is defined either by a declaration or by rules: any number of rules may define a relation (with the
+    same arity), and a rule may refer to the relation it defines (a recursive rule).
     """
 
+    handled_nodes = {"relation_declaration", "query", "add_fact", "remove_fact", "rule"}
+    dependencies = (RemoveTokensTransformer,)
+
     def __init__(self):
         super().__init__()
         self.relation_name_to_arity = dict()
+        # the defined relations that rules define
+        self.rule_relation_names = set()
 
-    def __add_relation_definition(self, relation_name_node, schema_defining_node):
-        assert_correct_node(relation_name_node, "relation_name", 1)
-        assert schema_defining_node.data in SCHEMA_DEFINING_NODES
-        relation_name = relation_name_node.children[0]
+    def define_relation(self, relation_name, arity, is_rule_relation=False):
         assert relation_name not in self.relation_name_to_arity
-        arity = len(schema_defining_node.children)
         self.relation_name_to_arity[relation_name] = arity
+        if is_rule_relation:
+            self.rule_relation_names.add(relation_name)
 
-    def __check_if_relation_not_defined(self, relation_name_node, term_list_node):
-        assert_correct_node(relation_name_node, "relation_name", 1)
-        assert term_list_node.data in NODES_OF_TERM_LISTS
-        relation_name = relation_name_node.children[0]
+    def undefine_relation(self, relation_name):
+        """
+        forgets a relation, e.g. one whose statement failed a later check
+        """
+        self.relation_name_to_arity.pop(relation_name, None)
+        self.rule_relation_names.discard(relation_name)
+
+    def define_rule_relation(self, relation_name, arity, line):
+        """
+        defines the relation of a rule's head, or checks that the relation is defined by other rules with the same
+        arity
+        """
         if relation_name not in self.relation_name_to_arity:
-            raise exceptions.RelationNotDefinedError(get_error_line_string(relation_name_node) + "relation " +
+            self.define_relation(relation_name, arity, is_rule_relation=True)
+            return
+        if relation_name not in self.rule_relation_names:
+            # a declared relation
+            self.check_relation_not_defined(relation_name, line)
+        self.check_relation_defined(relation_name, arity, line)
+
+    def check_relation_defined(self, relation_name, arity, line):
+        if relation_name not in self.relation_name_to_arity:
+            raise exceptions.RelationNotDefinedError(get_line_string(line) + "relation " +
                                                      relation_name + " is not defined")
-        arity = len(term_list_node.children)
         correct_arity = self.relation_name_to_arity[relation_name]
         if arity != correct_arity:
             raise exceptions.IncorrectArityError(
-                get_error_line_string(relation_name_node) +
+                get_line_string(line) +
                 "incorrect arity used for relation " + relation_name + ": " +
                 str(arity) + " (expected " + str(correct_arity) + ")")
 
-    def __check_if_relation_already_defined(self, relation_name_node):
-        assert_correct_node(relation_name_node, "relation_name", 1)
-        relation_name = relation_name_node.children[0]
+    def check_relation_not_defined(self, relation_name, line):
         if relation_name in self.relation_name_to_arity:
             raise exceptions.RelationRedefinitionError(
-                get_error_line_string(relation_name_node) + "relation "
+                get_line_string(line) + "relation "
                 + relation_name + " is already defined")
 
+    def __add_relation_definition(self, relation_name_node, schema_defining_node):
+        assert_correct_node(relation_name_node, "relation_name", 1)
+        assert schema_defining_node.data in SCHEMA_DEFINING_NODES
+        self.define_relation(relation_name_node.children[0], len(schema_defining_node.children))
+
+    def __check_if_relation_not_defined(self, relation_name_node, term_list_node):
+        assert_correct_node(relation_name_node, "relation_name", 1)
+        assert term_list_node.data in NODES_OF_TERM_LISTS
+        self.check_relation_defined(relation_name_node.children[0], len(term_list_node.children),
+                                    relation_name_node.meta.line)
+
+    def __check_if_relation_already_defined(self, relation_name_node):
+        assert_correct_node(relation_name_node, "relation_name", 1)
+        self.check_relation_not_defined(relation_name_node.children[0], relation_name_node.meta.line)
+
     def relation_declaration(self, tree):
         assert_correct_node(tree, "relation_declaration", 2, "relation_name", "decl_term_list")
         self.__check_if_relation_already_defined(tree.children[0])
@@ -213,14 +331,17 @@ class CheckReferencedRelationsInterpreter(Interpreter):
         rule_body_node = tree.children[1]
         assert_correct_node(rule_head_node, "rule_head", 2, "relation_name", "free_var_name_list")
         assert_correct_node(rule_body_node, "rule_body", 1, "rule_body_relation_list")
-        self.__check_if_relation_already_defined(rule_head_node.children[0])
+        rule_head_name_node = rule_head_node.children[0]
+        assert_correct_node(rule_head_name_node, "relation_name", 1)
+        # the head is defined before the body is checked, so the body may refer to it
+        self.define_rule_relation(rule_head_name_node.children[0], len(rule_head_node.children[1].children),
+                                  rule_head_name_node.meta.line)
         relation_list_node = rule_body_node.children[0]
         assert_correct_node(relation_list_node, "rule_body_relation_list")
         for relation_node in relation_list_node.children:
             if relation_node.data == "relation":
                 assert_correct_node(relation_node, "relation", 2, "relation_name", "term_list")
                 self.__check_if_relation_not_defined(relation_node.children[0], relation_node.children[1])
-        self.__add_relation_definition(rule_head_node.children[0], rule_head_node.children[1])
 
 
 class CheckReferencedIERelationsVisitor(Visitor_Recursive):
@@ -230,6 +351,9 @@ class CheckReferencedIERelationsVisitor(Visitor_Recursive):
     Also checks if the ie relation reference uses the correct arity for the ie function.
     """
 
+    handled_nodes = {"func_ie_relation", "rgx_ie_relation"}
+    dependencies = (RemoveTokensTransformer,)
+
     def __init__(self):
         super().__init__()
 
@@ -274,6 +398,9 @@ class CheckRuleSafetyVisitor(Visitor_Recursive):
     safe relation.
     """
 
+    handled_nodes = {"rule"}
+    dependencies = (RemoveTokensTransformer,)
+
     def __init__(self):
         super().__init__()
 
@@ -318,15 +445,18 @@ class CheckRuleSafetyVisitor(Visitor_Recursive):
         assert_correct_node(rule_head_term_list_node, "free_var_name_list")
         assert_correct_node(rule_body_relation_list_node, "rule_body_relation_list")
         rule_body_relations = rule_body_relation_list_node.children
+        # get the input and output free variables of each relation once
+        relations_input_free_vars = [self.__get_set_of_input_free_var_names(relation_node)
+                                     for relation_node in rule_body_relations]
+        relations_output_free_vars = [self.__get_set_of_output_free_var_names(relation_node)
+                                      for relation_node in rule_body_relations]
         # check that every free variable in the head occurs at least once in the body as an output of a relation.
         # get the free variables in the rule head
         rule_head_free_vars = self.__get_set_of_free_var_names(rule_head_term_list_node)
         # get the free variables in the rule body
         rule_body_free_vars = set()
-        for relation_node in rule_body_relations:
-            # get all the free variables that appear in the relation's output
-            relation_output_free_vars = self.__get_set_of_output_free_var_names(relation_node)
-            rule_body_free_vars = rule_body_free_vars.union(relation_output_free_vars)
+        for relation_output_free_vars in relations_output_free_vars:
+            rule_body_free_vars.update(relation_output_free_vars)
         # make sure that every free var in the rule head appears at least once in the rule body
         invalid_free_var_names = rule_head_free_vars.difference(rule_body_free_vars)
         if invalid_free_var_names:
@@ -335,35 +465,90 @@ class CheckRuleSafetyVisitor(Visitor_Recursive):
                 "the following free variables appear in the rule head but not in any"
                 " relation's output in the rule body:\n" + str(invalid_free_var_names))
         # check that every relation in the rule body is safe
-        # initialize assuming every relation is unsafe and every free variable is unbound
-        safe_relation_indexes = set()
-        bound_free_vars = set()
-        found_safe_relation_in_cur_iter = True
-        while len(safe_relation_indexes) != len(rule_body_relations) \
-                and found_safe_relation_in_cur_iter:
-            found_safe_relation_in_cur_iter = False
-            for idx, relation_node in enumerate(rule_body_relations):
-                if idx not in safe_relation_indexes:
-                    input_free_vars = self.__get_set_of_input_free_var_names(relation_node)
-                    unbound_free_vars = input_free_vars.difference(bound_free_vars)
-                    if not unbound_free_vars:
-                        # relation is safe, mark all of its output variables as bound
-                        found_safe_relation_in_cur_iter = True
-                        output_free_vars = self.__get_set_of_output_free_var_names(relation_node)
-                        bound_free_vars = bound_free_vars.union(output_free_vars)
-                        safe_relation_indexes.add(idx)
-        if len(safe_relation_indexes) != len(rule_body_relations):
+        safe_relation_order, bound_free_vars = get_safe_relation_order(relations_input_free_vars,
+                                                                       relations_output_free_vars)
+        if len(safe_relation_order) != len(rule_body_relations):
             # find and print all the free variables that are unbound
             all_input_free_vars = set()
-            for relation_node in rule_body_relations:
-                all_input_free_vars = \
-                    all_input_free_vars.union(self.__get_set_of_input_free_var_names(relation_node))
+            for input_free_vars in relations_input_free_vars:
+                all_input_free_vars.update(input_free_vars)
             unbound_free_vars = all_input_free_vars.difference(bound_free_vars)
             assert unbound_free_vars
             raise exceptions.RuleNotSafeError(
                 get_error_line_string(tree) + "the following free variables are unbound:\n" + str(unbound_free_vars))
 
 
+class TypeEnvironment:
+    """
+    the types that the type check knows: the type of each variable and the schema of each relation.
+
+    the environment may outlive a single type check (e.g. it is shared with engine.Session), so a program can be
+    type checked a chunk at a time. it also remembers the rules and what each of them depends on (the variables used
+    as constants in its body and the relations in its body), so that when a variable is reassigned with a new type
+    only the rules that depend on it (and on their heads, and so on) are checked again.
+    the rules are kept by the name of the relation they define (a "rule name"), which may have several rules.
+    """
+
+    def __init__(self):
+        self.var_name_to_type = dict()
+        self.relation_name_to_schema = dict()
+        # rule name -> the nodes of the rules that define the relation
+        self.rule_name_to_nodes = dict()
+        self._var_name_to_dependent_rules = dict()
+        self._relation_name_to_dependent_rules = dict()
+
+    def add_rule(self, rule_name, rule_node, var_names, relation_names):
+        """
+        remembers a rule that was checked.
+        :param var_names: the variables the rule's body uses as constants.
+        :param relation_names: the relations in the rule's body.
+        """
+        self.rule_name_to_nodes.setdefault(rule_name, []).append(rule_node)
+        for var_name in var_names:
+            self._var_name_to_dependent_rules.setdefault(var_name, set()).add(rule_name)
+        for relation_name in relation_names:
+            self._relation_name_to_dependent_rules.setdefault(relation_name, set()).add(rule_name)
+
+    def remove_rule(self, rule_name, rule_node):
+        """
+        forgets a rule of a relation that other rules define as well, if it was added (the relation keeps depending
+        on what the rule depended on, which at most checks the other rules again for nothing)
+        """
+        rule_nodes = self.rule_name_to_nodes.get(rule_name, [])
+        if any(node is rule_node for node in rule_nodes):
+            rule_nodes[:] = [node for node in rule_nodes if node is not rule_node]
+
+    def remove_relation(self, relation_name):
+        """
+        forgets a relation (and the rules that define it, if there are any)
+        """
+        self.relation_name_to_schema.pop(relation_name, None)
+        if self.rule_name_to_nodes.pop(relation_name, None) is not None:
+            for dependent_rules in self._var_name_to_dependent_rules.values():
+                dependent_rules.discard(relation_name)
+            for dependent_rules in self._relation_name_to_dependent_rules.values():
+                dependent_rules.discard(relation_name)
+
+    def copy_from(self, type_environment):
+        """
+        replaces the types (and rules) of the environment with those of another environment, e.g. of a saved session
+        """
+        self.var_name_to_type = dict(type_environment.var_name_to_type)
+        self.relation_name_to_schema = dict(type_environment.relation_name_to_schema)
+        self.rule_name_to_nodes = {rule_name: list(rule_nodes)
+                                   for rule_name, rule_nodes in type_environment.rule_name_to_nodes.items()}
+        self._var_name_to_dependent_rules = {var_name: set(rule_names) for var_name, rule_names in
+                                             type_environment._var_name_to_dependent_rules.items()}
+        self._relation_name_to_dependent_rules = {relation_name: set(rule_names) for relation_name, rule_names in
+                                                  type_environment._relation_name_to_dependent_rules.items()}
+
+    def get_rules_depending_on_var(self, var_name):
+        return self._var_name_to_dependent_rules.get(var_name, set())
+
+    def get_rules_depending_on_relation(self, relation_name):
+        return self._relation_name_to_dependent_rules.get(relation_name, set())
+
+
 class TypeCheckingInterpreter(Interpreter):
     """
     A lark tree semantic check.
@@ -376,17 +561,65 @@ class TypeCheckingInterpreter(Interpreter):
     new A(str)
     new B(int)
     C(X) <- A(X), B(X) # error since X is expected to be both an int and a string
+
+    the types are kept in a TypeEnvironment. when one is given, the check continues from the types that it already
+    has, and the types of the visited program are added to it.
+    if a variable that a rule uses as a constant is reassigned with a different type, the rules that depend on it
+    are checked again (see TypeEnvironment).
     """
 
-    def __init__(self):
+    handled_nodes = {"assign_literal_string", "assign_string_from_file_string_param",
+                     "assign_string_from_file_var_param", "assign_span", "assign_int", "assign_var",
+                     "relation_declaration", "add_fact", "remove_fact", "query", "rule"}
+    # the type checks assume that every referenced variable and relation is defined, and that the rules are safe
+    dependencies = (RemoveTokensTransformer, CheckReferencedVariablesInterpreter, CheckReferencedRelationsInterpreter,
+                    CheckRuleSafetyVisitor)
+
+    def __init__(self, type_environment: TypeEnvironment = None):
         super().__init__()
-        self.var_name_to_type = dict()
-        self.relation_name_to_schema = dict()
+        self.type_environment = TypeEnvironment() if type_environment is None else type_environment
+        self.var_name_to_type = self.type_environment.var_name_to_type
+        self.relation_name_to_schema = self.type_environment.relation_name_to_schema
 
     def __add_var_type(self, var_name_node, var_type: VarTypes):
         assert_correct_node(var_name_node, "var_name", 1)
         var_name = var_name_node.children[0]
+        old_var_type = self.var_name_to_type.get(var_name)
         self.var_name_to_type[var_name] = var_type
+        if old_var_type is None or old_var_type == var_type:
+            return
+        dependent_rules = self.type_environment.get_rules_depending_on_var(var_name)
+        if not dependent_rules:
+            return
+        try:
+            self.__recheck_rules(dependent_rules)
+        except exceptions.CustomException as e:
+            self.var_name_to_type[var_name] = old_var_type
+            raise type(e)(get_error_line_string(var_name_node) + "the new type of variable " + var_name +
+                          " does not fit the rules that use it:\n" + str(e)) from e
+
+    def __recheck_rules(self, rule_names):
+        """
+        checks the rules again, and then the rules that depend on the rules whose schema changed, and so on.
+        if a rule fails the check, the schemas that were changed are restored.
+        """
+        old_schemas = []
+        rules_to_check = deque(rule_names)
+        try:
+            while rules_to_check:
+                rule_name = rules_to_check.popleft()
+                rule_nodes = self.type_environment.rule_name_to_nodes[rule_name]
+                rule_schema = self.__check_rule(rule_nodes[0])
+                for rule_node in rule_nodes[1:]:
+                    self.__check_rule_schema(rule_node, rule_schema, self.__check_rule(rule_node))
+                if rule_schema != self.relation_name_to_schema[rule_name]:
+                    old_schemas.append((rule_name, self.relation_name_to_schema[rule_name]))
+                    self.relation_name_to_schema[rule_name] = rule_schema
+                    rules_to_check.extend(self.type_environment.get_rules_depending_on_relation(rule_name))
+        except exceptions.CustomException:
+            for rule_name, old_schema in reversed(old_schemas):
+                self.relation_name_to_schema[rule_name] = old_schema
+            raise
 
     def __get_var_type(self, var_name_node):
         assert_correct_node(var_name_node, "var_name", 1)
@@ -587,23 +820,78 @@ class TypeCheckingInterpreter(Interpreter):
         assert_correct_node(tree, "rule", 2, "rule_head", "rule_body")
         assert_correct_node(tree.children[0], "rule_head", 2, "relation_name", "free_var_name_list")
         assert_correct_node(tree.children[1], "rule_body", 1, "rule_body_relation_list")
+        rule_head_name = tree.children[0].children[0].children[0]
+        rule_head_schema = self.__check_rule(tree)
+        if rule_head_name in self.relation_name_to_schema:
+            # the relation is defined by other rules as well
+            self.__check_rule_schema(tree, self.relation_name_to_schema[rule_head_name], rule_head_schema)
+        else:
+            self.relation_name_to_schema[rule_head_name] = rule_head_schema
+        # remember what the rule depends on, so it can be checked again when a variable it uses changes its type
+        var_names = set()
+        relation_names = set()
+        for relation_node in tree.children[1].children[0].children:
+            if relation_node.data == "relation":
+                relation_names.add(relation_node.children[0].children[0])
+                for term_node in relation_node.children[1].children:
+                    if term_node.data == "var_name":
+                        var_names.add(term_node.children[0])
+        self.type_environment.add_rule(rule_head_name, tree, var_names, relation_names)
+
+    def __check_rule_schema(self, tree, schema, rule_head_schema):
+        """
+        checks that the head of a rule has the schema of the relation that other rules define
+        """
+        if rule_head_schema != schema:
+            raise exceptions.TermsNotProperlyTypedError(
+                get_error_line_string(tree) + "the rule head is not properly typed, other rules define the relation "
+                                              "with another schema\n" +
+                self.__get_schema_comparison_string(tree.children[0].children[0], schema, rule_head_schema))
+
+    def __get_rule_head_free_var_types(self, rule_head_term_list_node, free_var_to_type):
+        """
+        :return: the types of the free variables of a rule head (the schema of the rule head), None if a free
+            variable has no type yet
+        """
+        rule_head_schema = []
+        for rule_head_term_node in rule_head_term_list_node.children:
+            assert_correct_node(rule_head_term_node, "free_var_name", 1)
+            free_var_name = rule_head_term_node.children[0]
+            if free_var_name not in free_var_to_type:
+                return None
+            rule_head_schema.append(free_var_to_type[free_var_name])
+        return rule_head_schema
+
+    def __check_rule(self, tree):
+        """
+        type checks a rule.
+        the first rule of a recursive relation refers to a relation without a schema yet, the schema of its head
+        (which comes from the other relations of its body) is the schema of those references.
+        :return: the schema of the rule head
+        """
         rule_head_name_node = tree.children[0].children[0]
-        assert rule_head_name_node.children[0] not in self.relation_name_to_schema
         rule_head_term_list_node = tree.children[0].children[1]
         rule_body_relation_list_node = tree.children[1].children[0]
         assert_correct_node(rule_head_name_node, "relation_name", 1)
         assert_correct_node(rule_head_term_list_node, "free_var_name_list")
         assert_correct_node(rule_body_relation_list_node, "rule_body_relation_list")
+        rule_head_name = rule_head_name_node.children[0]
         rule_body_relations = rule_body_relation_list_node.children
         free_var_to_type = dict()
         conflicted_free_vars = dict()
         improperly_typed_relation_idxs = list()
+        # the references to the rule's own relation, while it has no schema
+        recursive_relation_idxs = list()
         # The actual type checking. Look for conflicting free variables and improperly typed relations
         for idx, relation_node in enumerate(rule_body_relations):
             if relation_node.data == "relation":
                 assert_correct_node(relation_node, "relation", 2, "relation_name", "term_list")
                 relation_name_node = relation_node.children[0]
                 term_list_node = relation_node.children[1]
+                if relation_name_node.children[0] == rule_head_name and \
+                        rule_head_name not in self.relation_name_to_schema:
+                    recursive_relation_idxs.append(idx)
+                    continue
                 schema = self.__get_relation_schema(relation_name_node)
                 if not self.__type_check_rule_body_term_list(term_list_node, schema,
                                                              free_var_to_type, conflicted_free_vars):
@@ -615,6 +903,18 @@ class TypeCheckingInterpreter(Interpreter):
                 assert_correct_node(relation_node, "rgx_ie_relation", 3, "term_list", "term_list", "var_name")
                 # TODO
 
+        rule_head_schema = None
+        if recursive_relation_idxs:
+            rule_head_schema = self.__get_rule_head_free_var_types(rule_head_term_list_node, free_var_to_type)
+            if rule_head_schema is None:
+                raise exceptions.TermsNotProperlyTypedError(
+                    get_error_line_string(tree) + "the schema of relation " + rule_head_name + " can not be inferred "
+                    "from the rule, a free variable of the rule head only appears in references to the relation")
+            for idx in recursive_relation_idxs:
+                if not self.__type_check_rule_body_term_list(rule_body_relations[idx].children[1], rule_head_schema,
+                                                             free_var_to_type, conflicted_free_vars):
+                    improperly_typed_relation_idxs.append(idx)
+
         if conflicted_free_vars:
             error = get_error_line_string(tree) + "the following free variables have conflicting types\n"
             for free_var in conflicted_free_vars:
@@ -631,7 +931,8 @@ class TypeCheckingInterpreter(Interpreter):
                     relation_name_node = relation_node.children[0]
                     relation_term_types = self.__get_term_types_list(relation_node.children[1],
                                                                      free_var_mapping=free_var_to_type)
-                    schema = self.__get_relation_schema(relation_name_node)
+                    schema = rule_head_schema if idx in recursive_relation_idxs \
+                        else self.__get_relation_schema(relation_name_node)
                     error += self.__get_schema_comparison_string(relation_name_node, schema, relation_term_types)
                 elif relation_node.data == "func_ie_relation":
                     assert_correct_node(relation_node, "func_ie_relation", 3,
@@ -644,13 +945,7 @@ class TypeCheckingInterpreter(Interpreter):
                 error += "\n"
             raise exceptions.TermsNotProperlyTypedError(error)
 
-        # no issues were found, add the new schema to the schema dict
-        rule_head_schema = []
-        for rule_head_term_node in rule_head_term_list_node.children:
-            assert_correct_node(rule_head_term_node, "free_var_name", 1)
-            free_var_name = rule_head_term_node.children[0]
-            assert free_var_name in free_var_to_type
-            var_type = free_var_to_type[free_var_name]
-            rule_head_schema.append(var_type)
-        rule_head_name = rule_head_name_node.children[0]
-        self.relation_name_to_schema[rule_head_name] = rule_head_schema
+        # no issues were found, return the schema of the rule head
+        rule_head_schema = self.__get_rule_head_free_var_types(rule_head_term_list_node, free_var_to_type)
+        assert rule_head_schema is not None
+        return rule_head_schema
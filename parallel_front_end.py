@@ -0,0 +1,253 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from lark import Tree
+from lark.tree import Meta
+from lark.exceptions import LarkError
+
+import exceptions
+import lark_passes
+import parser_factory
+from incremental import shift_tree_lines
+from pass_manager import FusedStage
+from statement_splitter import iter_statement_spans
+
+# chunks smaller than this are not worth sending to another process
+MIN_CHUNK_SIZE = 64 * 1024
+# the number of chunks per worker, more chunks balance the work better but cost more messages
+CHUNKS_PER_WORKER = 4
+
+VARIABLES_CHECK = "variables"
+RELATIONS_CHECK = "relations"
+ERROR = "error"
+
+# the parser of a worker process, built once by init_worker()
+_worker_parser = None
+
+
+def init_worker():
+    global _worker_parser
+    _worker_parser = parser_factory.get_parser(normalize_tokens=True)
+
+
+def get_worker_parser():
+    """
+    :return: the parser of the current worker process (or of the main process, when it does the work itself)
+    """
+    if _worker_parser is None:
+        init_worker()
+    return _worker_parser
+
+
+def create_worker_pool(max_workers=None):
+    """
+    creates a process pool whose workers build the parser once, when they start
+    """
+    return ProcessPoolExecutor(max_workers=max_workers, initializer=init_worker)
+
+
+def encode_tree(tree):
+    """
+    encodes a parse tree as nested (data, line, end line, children) tuples, which are several times smaller and
+    faster to pickle than lark trees. only the line numbers of the positions are kept, since the checks only report
+    lines.
+    """
+    meta = tree.meta
+    line, end_line = (None, None) if meta.empty else (meta.line, meta.end_line)
+    return tree.data, line, end_line, [encode_tree(child) if isinstance(child, Tree) else child
+                                       for child in tree.children]
+
+
+def decode_tree(encoded_tree):
+    data, line, end_line, children = encoded_tree
+    meta = Meta()
+    if line is not None:
+        meta.line = line
+        meta.end_line = end_line
+        meta.empty = False
+    return Tree(data, [decode_tree(child) if type(child) is tuple else child for child in children], meta)
+
+
+class _RecordingVariablesCheck(lark_passes.CheckReferencedVariablesInterpreter):
+    """
+    records the definitions and references of variables instead of checking them, since a chunk does not know the
+    variables that the chunks before it define
+    """
+
+    def __init__(self, events):
+        super().__init__()
+        self.events = events
+
+    def define_var(self, var_name):
+        self.events.append((VARIABLES_CHECK, "define_var", (var_name,)))
+
+    def check_var_defined(self, var_name, line):
+        self.events.append((VARIABLES_CHECK, "check_var_defined", (var_name, line)))
+
+
+class _RecordingRelationsCheck(lark_passes.CheckReferencedRelationsInterpreter):
+    """
+    records the definitions and references of relations instead of checking them, see _RecordingVariablesCheck
+    """
+
+    def __init__(self, events):
+        super().__init__()
+        self.events = events
+
+    def define_relation(self, relation_name, arity, is_rule_relation=False):
+        self.events.append((RELATIONS_CHECK, "define_relation", (relation_name, arity, is_rule_relation)))
+
+    def define_rule_relation(self, relation_name, arity, line):
+        self.events.append((RELATIONS_CHECK, "define_rule_relation", (relation_name, arity, line)))
+
+    def check_relation_defined(self, relation_name, arity, line):
+        self.events.append((RELATIONS_CHECK, "check_relation_defined", (relation_name, arity, line)))
+
+    def check_relation_not_defined(self, relation_name, line):
+        self.events.append((RELATIONS_CHECK, "check_relation_not_defined", (relation_name, line)))
+
+
+def check_chunk(chunk_text, first_line, parser=None):
+    """
+    parses a chunk of a program and runs the checks that do not need the chunks before it.
+    the checks run in the same order as in the serial PassManager, but the references to variables and relations are
+    recorded (in order) to be checked later. the rule safety check is local to a rule, so it is checked here.
+    :param first_line: the line number of the chunk's first line in the program.
+    :return: None if the chunk has a syntax error, otherwise a list of (encoded statement tree, events) tuples, where
+        events is the list of recorded (check, method name, args) tuples of the statement. if a statement is not safe,
+        the last event is (ERROR, "raise", (exception,)) and the statements after it are not returned.
+    """
+    parser = get_worker_parser() if parser is None else parser
+    try:
+        tree = parser.parse(chunk_text)
+    except LarkError:
+        # lark's exceptions do not always survive pickling, the main process parses the chunk again to raise it
+        return None
+    if first_line != 1:
+        shift_tree_lines(tree, first_line - 1)
+    events = []
+    stage = FusedStage()
+    stage.add_pass(_RecordingVariablesCheck(events))
+    stage.add_pass(_RecordingRelationsCheck(events))
+    stage.add_pass(lark_passes.CheckRuleSafetyVisitor())
+    checked_statements = []
+    for statement in tree.children:
+        try:
+            stage.visit_statement(statement)
+        except exceptions.CustomException as e:
+            events.append((ERROR, "raise", (e,)))
+            checked_statements.append((encode_tree(statement), list(events)))
+            break
+        checked_statements.append((encode_tree(statement), list(events)))
+        events.clear()
+    return checked_statements
+
+
+class ParallelFrontEnd:
+    """
+    parses and checks a large program in a process pool.
+
+    the program is split into chunks at top-level statement boundaries (see statement_splitter), and each chunk is
+    parsed and checked by check_chunk() in a worker. the workers record every definition of and reference to a
+    variable or a relation, and the main process replays the records of the chunks in order on the real checks.
+    the type check runs in the main process, statement by statement, after the statement's records are replayed.
+    so the checks see the statements in the same order as PassManager([CheckReferencedVariablesInterpreter,
+    CheckReferencedRelationsInterpreter, CheckRuleSafetyVisitor, TypeCheckingInterpreter]) on the whole program,
+    and they raise the same error.
+
+    like PassManager, the state of the checks is kept between calls to check().
+    """
+
+    def __init__(self, max_workers=None, chunk_size=None, type_environment=None, pool=None):
+        """
+        :param max_workers: the number of worker processes (defaults to the number of cpus).
+        :param chunk_size: the minimal number of characters in a chunk, by default a program is split into
+            CHUNKS_PER_WORKER chunks per worker, of at least MIN_CHUNK_SIZE characters.
+        :param type_environment: a lark_passes.TypeEnvironment for the type check, e.g. of an engine.Session.
+        :param pool: a pool created by create_worker_pool() to use instead of creating one.
+        """
+        self.max_workers = (os.cpu_count() or 1) if max_workers is None else max_workers
+        self.chunk_size = chunk_size
+        self.variables_check = lark_passes.CheckReferencedVariablesInterpreter()
+        self.relations_check = lark_passes.CheckReferencedRelationsInterpreter()
+        self.type_check = lark_passes.TypeCheckingInterpreter(type_environment=type_environment)
+        self._type_check_stage = FusedStage()
+        self._type_check_stage.add_pass(self.type_check)
+        self._pool = pool
+        self._owns_pool = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        if self._owns_pool:
+            self._pool.shutdown()
+            self._pool = None
+            self._owns_pool = False
+
+    def split(self, text):
+        """
+        :return: a list of (chunk text, line number of the chunk's first line) tuples
+        """
+        chunk_size = self.chunk_size
+        if chunk_size is None:
+            chunk_size = max(MIN_CHUNK_SIZE, len(text) // (self.max_workers * CHUNKS_PER_WORKER))
+        chunks = []
+        chunk_start = chunk_line = None
+        for start, end, line in iter_statement_spans(text):
+            if chunk_start is None:
+                chunk_start, chunk_line = start, line
+            if end - chunk_start >= chunk_size:
+                chunks.append((text[chunk_start:end], chunk_line))
+                chunk_start = None
+        if chunk_start is not None:
+            chunks.append((text[chunk_start:], chunk_line))
+        return chunks
+
+    def check(self, text):
+        """
+        parses and checks a program (or the next part of a program).
+        :return: the normalized parse tree of text, as the parser of parser_factory.get_parser(normalize_tokens=True)
+            returns it, except that the positions of its nodes only have line numbers (see encode_tree).
+        """
+        chunks = self.split(text)
+        if len(chunks) <= 1 or self.max_workers <= 1:
+            parser = parser_factory.get_parser(normalize_tokens=True)
+            chunk_results = [check_chunk(chunk_text, line, parser) for chunk_text, line in chunks]
+        else:
+            if self._pool is None:
+                self._pool = create_worker_pool(self.max_workers)
+                self._owns_pool = True
+            chunk_texts, lines = zip(*chunks)
+            chunk_results = list(self._pool.map(check_chunk, chunk_texts, lines))
+        # the whole program is parsed before it is checked, so a syntax error comes before any semantic error
+        for (chunk_text, line), chunk_result in zip(chunks, chunk_results):
+            if chunk_result is None:
+                self._raise_syntax_error(chunk_text, line)
+        statements = []
+        for chunk_result in chunk_results:
+            for encoded_statement, events in chunk_result:
+                statement = decode_tree(encoded_statement)
+                self._replay(events)
+                self._type_check_stage.visit_statement(statement)
+                statements.append(statement)
+        return Tree("start", statements)
+
+    def _replay(self, events):
+        for check, method_name, args in events:
+            if check == VARIABLES_CHECK:
+                getattr(self.variables_check, method_name)(*args)
+            elif check == RELATIONS_CHECK:
+                getattr(self.relations_check, method_name)(*args)
+            else:
+                assert check == ERROR
+                raise args[0]
+
+    @staticmethod
+    def _raise_syntax_error(chunk_text, line):
+        # the program may start with new lines, so padding the chunk gives the error the line of the program
+        parser_factory.get_parser(normalize_tokens=True).parse("\n" * (line - 1) + chunk_text)
+        assert 0, "a chunk failed to parse in a worker but not in the main process"
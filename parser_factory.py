@@ -0,0 +1,109 @@
+import hashlib
+import os
+import sys
+
+import lark
+from lark import Lark
+from lark.tools.standalone import gen_standalone
+
+import lark_passes
+
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+GRAMMAR_FILE = os.path.join(PACKAGE_DIR, "grammar.lark")
+DEFAULT_CACHE_DIR = os.path.join(PACKAGE_DIR, ".parser_cache")
+DEFAULT_PARSER_OPTIONS = {"parser": "lalr", "debug": True, "propagate_positions": True}
+
+# options that hold python objects. they do not change the parse tables, so they are not a part of the cache key
+# and are handed to lark again whenever the tables are loaded from the cache.
+UNHASHABLE_OPTIONS = {"transformer", "postlex", "lexer_callbacks", "tree_class"}
+
+# parsers that were already built by this process, mapped by their cache key
+_parsers = dict()
+
+
+def _read_grammar(grammar_file):
+    with open(grammar_file, 'r') as grammar:
+        return grammar.read()
+
+
+def _get_options(options):
+    parser_options = dict(DEFAULT_PARSER_OPTIONS)
+    parser_options.update(options)
+    return parser_options
+
+
+def get_cache_key(grammar_text, options):
+    """
+    computes the key of a parser in the cache.
+    the key is a hash of the grammar text and every hashable lark option, along with the lark and python versions
+    as the cached tables are pickled.
+    """
+    hashable_options = sorted((name, repr(value)) for name, value in options.items()
+                              if name not in UNHASHABLE_OPTIONS)
+    key_string = "\n".join([grammar_text, repr(hashable_options), lark.__version__,
+                            "%d.%d" % sys.version_info[:2]])
+    return hashlib.sha256(key_string.encode("utf-8")).hexdigest()
+
+
+def get_cache_file(grammar_text, options, cache_dir=DEFAULT_CACHE_DIR):
+    return os.path.join(cache_dir, "grammar_" + get_cache_key(grammar_text, options) + ".lark_cache")
+
+
+def is_normalizing_parser(parser):
+    """
+    returns whether the parser normalizes its trees while parsing, see build_parser
+    """
+    return isinstance(parser.options.transformer, lark_passes.ParseTimeNormalizationTransformer)
+
+
+def build_parser(grammar_file=GRAMMAR_FILE, cache_dir=DEFAULT_CACHE_DIR, normalize_tokens=False, **options):
+    """
+    builds a lark parser for the grammar in grammar_file.
+    on the first build, the LALR tables are saved to a file in cache_dir. later builds (in this process or in
+    another one) load the tables from that file instead of rebuilding them.
+    :param grammar_file: path of the grammar.
+    :param cache_dir: directory of the cached tables. if None, the tables are always built from the grammar.
+    :param normalize_tokens: if True, the parser removes the tokens and fixes the strings of the tree while parsing
+                             (with lark_passes.ParseTimeNormalizationTransformer), so RemoveTokensTransformer and
+                             StringVisitor should not run on its trees.
+    :param options: lark options, override DEFAULT_PARSER_OPTIONS.
+    :return: a lark parser
+    """
+    grammar_text = _read_grammar(grammar_file)
+    parser_options = _get_options(options)
+    if normalize_tokens:
+        parser_options["transformer"] = lark_passes.ParseTimeNormalizationTransformer()
+    if cache_dir is not None and parser_options["parser"] == "lalr":
+        os.makedirs(cache_dir, exist_ok=True)
+        parser_options["cache"] = get_cache_file(grammar_text, parser_options, cache_dir)
+    return Lark(grammar_text, **parser_options)
+
+
+def get_parser(grammar_file=GRAMMAR_FILE, cache_dir=DEFAULT_CACHE_DIR, normalize_tokens=False, **options):
+    """
+    returns a lark parser for the grammar in grammar_file, see build_parser.
+    parsers without python object options (e.g. a transformer) are built once per process and then reused.
+    """
+    parser_options = _get_options(options)
+    if UNHASHABLE_OPTIONS.intersection(parser_options):
+        return build_parser(grammar_file, cache_dir, normalize_tokens, **options)
+    key = (os.path.abspath(grammar_file), cache_dir, normalize_tokens,
+           get_cache_key(_read_grammar(grammar_file), parser_options))
+    if key not in _parsers:
+        _parsers[key] = build_parser(grammar_file, cache_dir, normalize_tokens, **options)
+    return _parsers[key]
+
+
+def generate_standalone_parser(output_file, grammar_file=GRAMMAR_FILE, **options):
+    """
+    writes a standalone python module that contains the LALR parser of the grammar in grammar_file.
+    the generated module does not depend on lark, and its parser is created with Lark_StandAlone().
+    """
+    parser_options = _get_options(options)
+    # debug only adds grammar construction warnings, and lark cannot serialize its debug states into a module
+    parser_options["debug"] = False
+    if parser_options["parser"] != "lalr":
+        raise ValueError("a standalone parser can only be generated for the lalr parser")
+    parser = Lark(_read_grammar(grammar_file), **parser_options)
+    with open(output_file, 'w') as out:
+        gen_standalone(parser, out=out)
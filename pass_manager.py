@@ -0,0 +1,240 @@
+import time
+
+from lark import Transformer, Tree, Visitor
+from lark.visitors import Interpreter, Visitor_Recursive
+
+from graph_converters import Converter
+
+VISITING_PASS_TYPES = (Visitor, Visitor_Recursive, Interpreter)
+
+
+def count_tree_nodes(tree):
+    """
+    counts the nodes (not including the leaves) of a lark tree, or all the nodes of a networkx tree
+    """
+    if isinstance(tree, Tree):
+        return sum(1 for _ in tree.iter_subtrees())
+    return tree.number_of_nodes()
+
+
+def is_fusible_pass(cur_pass):
+    """
+    a pass can share a traversal with other passes if it declares the nodes it handles, and it works on each top-level
+    statement on its own (i.e. it does not handle the root of the tree or change the tree's representation).
+    """
+    handled_nodes = getattr(cur_pass, "handled_nodes", None)
+    if handled_nodes is None or "start" in handled_nodes:
+        return False
+    return isinstance(cur_pass, VISITING_PASS_TYPES) or isinstance(cur_pass, Transformer)
+
+
+def order_passes(passes):
+    """
+    orders the passes so that every pass comes after the passes in its dependencies.
+    dependencies that are not in passes are ignored, otherwise the original order is kept.
+    """
+    pass_types = [type(cur_pass) for cur_pass in passes]
+    ordered_passes = []
+    ordered_pass_types = set()
+    remaining_passes = list(passes)
+    while remaining_passes:
+        for idx, cur_pass in enumerate(remaining_passes):
+            dependencies = getattr(cur_pass, "dependencies", ())
+            if all(dependency in ordered_pass_types or dependency not in pass_types for dependency in dependencies):
+                ordered_passes.append(cur_pass)
+                ordered_pass_types.add(type(cur_pass))
+                del remaining_passes[idx]
+                break
+        else:
+            raise ValueError("the dependencies of the following passes are cyclic: " +
+                             str([type(cur_pass).__name__ for cur_pass in remaining_passes]))
+    return ordered_passes
+
+
+def get_statement_nodes(statement):
+    """
+    :return: a list of the nodes (not including the leaves) of a statement's tree, top-down
+    """
+    nodes = []
+    stack = [statement]
+    while stack:
+        node = stack.pop()
+        nodes.append(node)
+        stack.extend(child for child in reversed(node.children) if isinstance(child, Tree))
+    return nodes
+
+
+class FusedStage:
+    """
+    runs several passes over the top-level statements one statement at a time, walking the tree of each statement
+    once.
+    the transformers of the stage rewrite a statement first, then the nodes of the statement are collected top-down,
+    and each visiting pass (in the passes' order) is handed the nodes it handles. a pass sees a statement only after
+    the passes before it have checked all of the statement, just like running the passes one after another, so a pass
+    may rely on the checks of the passes it depends on (e.g. the type check on every variable being defined).
+
+    unlike an Interpreter that handles a node, the walk does not stop at the node, so a fused Interpreter must not
+    handle a node that is nested in another node it handles (none of the passes in lark_passes do).
+    """
+
+    def __init__(self):
+        self.transformers = []
+        self.visiting_passes = []
+        # a dict of node name -> handler for each visiting pass, in the passes' order
+        self._pass_handlers = []
+
+    def add_pass(self, cur_pass):
+        if isinstance(cur_pass, Transformer):
+            assert not self.visiting_passes, "a fused transformer must run before the fused visiting passes"
+            self.transformers.append(cur_pass)
+            return
+        self.visiting_passes.append(cur_pass)
+        self._pass_handlers.append({node_name: getattr(cur_pass, node_name) for node_name in cur_pass.handled_nodes})
+
+    def accepts(self, cur_pass):
+        return not (isinstance(cur_pass, Transformer) and self.visiting_passes)
+
+    def get_name(self):
+        return "fused(" + ", ".join(type(cur_pass).__name__
+                                    for cur_pass in self.transformers + self.visiting_passes) + ")"
+
+    def run(self, tree, profiler=None):
+        if profiler is not None:
+            return self._run_profiled(tree, profiler)
+        statements = tree.children
+        for idx, statement in enumerate(statements):
+            if not isinstance(statement, Tree):
+                continue
+            for transformer in self.transformers:
+                statement = transformer.transform(statement)
+            statements[idx] = statement
+            if self._pass_handlers:
+                self.visit_statement(statement)
+        return tree
+
+    def visit_statement(self, statement):
+        nodes = get_statement_nodes(statement)
+        for node_to_handler in self._pass_handlers:
+            for node in nodes:
+                handler = node_to_handler.get(node.data)
+                if handler is not None:
+                    handler(node)
+
+    def _run_profiled(self, tree, profiler):
+        """
+        same as run(), but also times each pass and counts the nodes each pass handled
+        """
+        pass_to_time = {id(cur_pass): 0.0 for cur_pass in self.transformers + self.visiting_passes}
+        pass_to_nodes = {id(cur_pass): 0 for cur_pass in self.transformers + self.visiting_passes}
+        nodes_visited = 0
+        with profiler.measure(self.get_name(), category="stage") as stage_record:
+            stage_start = time.perf_counter()
+            statements = tree.children
+            for idx, statement in enumerate(statements):
+                if not isinstance(statement, Tree):
+                    continue
+                for transformer in self.transformers:
+                    start = time.perf_counter()
+                    statement = transformer.transform(statement)
+                    pass_to_time[id(transformer)] += time.perf_counter() - start
+                    pass_to_nodes[id(transformer)] += count_tree_nodes(statement)
+                statements[idx] = statement
+                nodes = get_statement_nodes(statement)
+                nodes_visited += len(nodes)
+                for cur_pass, node_to_handler in zip(self.visiting_passes, self._pass_handlers):
+                    for node in nodes:
+                        handler = node_to_handler.get(node.data)
+                        if handler is not None:
+                            start = time.perf_counter()
+                            handler(node)
+                            pass_to_time[id(cur_pass)] += time.perf_counter() - start
+                            pass_to_nodes[id(cur_pass)] += 1
+            stage_record["nodes_visited"] = nodes_visited
+        for cur_pass in self.transformers + self.visiting_passes:
+            profiler.add_record(type(cur_pass).__name__, "fused pass", pass_to_time[id(cur_pass)],
+                                pass_to_nodes[id(cur_pass)], stage_start)
+        return tree
+
+
+class TreeStage:
+    """
+    runs a single pass over the whole tree
+    """
+
+    def __init__(self, cur_pass):
+        self.cur_pass = cur_pass
+
+    def get_name(self):
+        return type(self.cur_pass).__name__
+
+    def run(self, tree, profiler=None):
+        if profiler is not None:
+            category = "convert" if isinstance(self.cur_pass, Converter) else "pass"
+            with profiler.measure(self.get_name(), category, count_tree_nodes(tree)):
+                return self.run(tree)
+        if isinstance(self.cur_pass, VISITING_PASS_TYPES):
+            self.cur_pass.visit(tree)
+        elif isinstance(self.cur_pass, Transformer):
+            tree = self.cur_pass.transform(tree)
+        elif isinstance(self.cur_pass, Converter):
+            tree = self.cur_pass.convert(tree)
+        else:
+            assert 0
+        return tree
+
+
+class PassManager:
+    """
+    runs passes on a tree, combining passes into as few traversals as possible.
+
+    passes declare the nodes they handle (handled_nodes) and the passes they must run after (dependencies).
+    the passes are ordered by their dependencies, and consecutive passes that can be fused (see is_fusible_pass)
+    run together, a statement at a time (see FusedStage).
+
+    since fused passes check each statement in turn rather than the whole program one pass after another, a program
+    with several errors may report a different (earlier) error than running the passes one after another would.
+
+    the passes are created once, so running the manager again (e.g. on the next statements of a program) continues
+    from the state that the previous runs left.
+    """
+
+    def __init__(self, passes):
+        """
+        :param passes: pass classes or pass instances.
+        """
+        passes = [cur_pass() if isinstance(cur_pass, type) else cur_pass for cur_pass in passes]
+        self.passes = order_passes(passes)
+        self.stages = []
+        for cur_pass in self.passes:
+            if is_fusible_pass(cur_pass):
+                if not self.stages or not isinstance(self.stages[-1], FusedStage) \
+                        or not self.stages[-1].accepts(cur_pass):
+                    self.stages.append(FusedStage())
+                self.stages[-1].add_pass(cur_pass)
+            else:
+                self.stages.append(TreeStage(cur_pass))
+
+    def get_pass(self, pass_type):
+        for cur_pass in self.passes:
+            if isinstance(cur_pass, pass_type):
+                return cur_pass
+        raise KeyError(pass_type.__name__)
+
+    def run(self, tree, profiler=None):
+        """
+        :param profiler: a pass_profiler.PassProfiler to record the time, nodes and allocations of each pass into.
+        """
+        for stage in self.stages:
+            tree = stage.run(tree, profiler)
+        return tree
+
+    def parse_and_run(self, parser, text, profiler=None):
+        """
+        parses text and runs the passes on its tree, the parse is recorded by the profiler as well
+        """
+        if profiler is None:
+            return self.run(parser.parse(text))
+        with profiler.measure("parse", category="parse") as record:
+            tree = parser.parse(text)
+        record["nodes_visited"] = count_tree_nodes(tree)
+        return self.run(tree, profiler)
@@ -0,0 +1,163 @@
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+import graph_converters
+import lark_passes
+import parser_factory
+from pass_manager import PassManager
+
+
+class PassProfiler:
+    """
+    records the wall time, nodes visited and peak memory allocations of each step of the front end
+    (parsing, passes and conversions).
+
+    every measured step becomes a record:
+    name - the step's name, e.g. the pass class name.
+    category - "parse", "pass", "stage", "fused pass" (a pass inside a fused stage) or "convert".
+    start_ms, wall_time_ms - relative to the creation of the profiler.
+    nodes_visited - number of tree nodes the step visited (None if unknown).
+    peak_allocated_bytes - peak of the memory allocated (by tracemalloc) during the step, over the memory that was
+        allocated when the step started. passes inside a fused stage share the stage's traversal, so they only have
+        a wall time and node count.
+    """
+
+    def __init__(self, trace_memory=True):
+        self.trace_memory = trace_memory
+        self.records = []
+        self._origin = time.perf_counter()
+        self._open_records = []
+        self._started_tracemalloc = False
+
+    @contextmanager
+    def measure(self, name, category="pass", nodes_visited=None):
+        """
+        measures the code in the with block, the yielded record may be updated (e.g. with the number of nodes visited)
+        """
+        record = {"name": name, "category": category, "start_ms": 0.0, "wall_time_ms": 0.0,
+                  "nodes_visited": nodes_visited, "peak_allocated_bytes": None}
+        self.records.append(record)
+        self._start_memory_trace(record)
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            end = time.perf_counter()
+            record["start_ms"] = (start - self._origin) * 1000
+            record["wall_time_ms"] = (end - start) * 1000
+            self._stop_memory_trace(record)
+
+    def add_record(self, name, category, wall_time, nodes_visited=None, start=None):
+        """
+        adds a step that was measured by the caller.
+        :param wall_time: in seconds.
+        :param start: time.perf_counter() value at the start of the step.
+        """
+        start_ms = 0.0 if start is None else (start - self._origin) * 1000
+        self.records.append({"name": name, "category": category, "start_ms": start_ms,
+                             "wall_time_ms": wall_time * 1000, "nodes_visited": nodes_visited,
+                             "peak_allocated_bytes": None})
+
+    def _start_memory_trace(self, record):
+        if not self.trace_memory:
+            return
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+        current, peak = tracemalloc.get_traced_memory()
+        # reset_peak() is global, remember the peak that the enclosing steps reached so far
+        for open_record in self._open_records:
+            open_record["_peak"] = max(open_record["_peak"], peak)
+        tracemalloc.reset_peak()
+        record["_base"] = current
+        record["_peak"] = current
+        self._open_records.append(record)
+
+    def _stop_memory_trace(self, record):
+        if not self.trace_memory:
+            return
+        peak = max(record.pop("_peak"), tracemalloc.get_traced_memory()[1])
+        record["peak_allocated_bytes"] = peak - record.pop("_base")
+        self._open_records.pop()
+        if self._open_records:
+            self._open_records[-1]["_peak"] = max(self._open_records[-1]["_peak"], peak)
+        elif self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+
+    def report(self):
+        return {
+            "total_wall_time_ms": sum(record["wall_time_ms"] for record in self.records
+                                      if record["category"] in ("parse", "pass", "stage", "convert")),
+            "steps": [dict(record) for record in self.records]
+        }
+
+    def to_json(self, indent=2):
+        return json.dumps(self.report(), indent=indent)
+
+    def write_report(self, path):
+        with open(path, 'w') as report_file:
+            report_file.write(self.to_json())
+
+    def write_chrome_trace(self, path):
+        """
+        writes the records as a trace event file, which can be opened in chrome://tracing or in perfetto
+        """
+        events = []
+        for record in self.records:
+            events.append({
+                "name": record["name"],
+                "cat": record["category"],
+                "ph": "X",
+                "ts": record["start_ms"] * 1000,
+                "dur": record["wall_time_ms"] * 1000,
+                "pid": os.getpid(),
+                "tid": 0,
+                "args": {"nodes_visited": record["nodes_visited"],
+                         "peak_allocated_bytes": record["peak_allocated_bytes"]}
+            })
+        with open(path, 'w') as trace_file:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, trace_file)
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="profiles the front end on a program")
+    arg_parser.add_argument("program", help="path of the program file")
+    arg_parser.add_argument("--report", help="write the json report to this path instead of stdout")
+    arg_parser.add_argument("--trace", help="also write a chrome trace event file to this path")
+    arg_parser.add_argument("--no-memory", action="store_true", help="do not trace memory allocations")
+    arg_parser.add_argument("--normalize-at-parse", action="store_true",
+                            help="remove the tokens while parsing instead of in separate passes")
+    args = arg_parser.parse_args(argv)
+
+    profiler = PassProfiler(trace_memory=not args.no_memory)
+    with profiler.measure("build parser", category="parse"):
+        parser = parser_factory.get_parser(normalize_tokens=args.normalize_at_parse)
+    with open(args.program, 'r') as program_file:
+        program = program_file.read()
+    passes = [
+        lark_passes.CheckReferencedVariablesInterpreter,
+        lark_passes.CheckReferencedRelationsInterpreter,
+        lark_passes.CheckRuleSafetyVisitor,
+        lark_passes.TypeCheckingInterpreter,
+        graph_converters.LarkTreeToNetxTreeConverter
+    ]
+    if not args.normalize_at_parse:
+        passes = [lark_passes.RemoveTokensTransformer, lark_passes.StringVisitor] + passes
+    pass_manager = PassManager(passes)
+    pass_manager.parse_and_run(parser, program, profiler)
+    if args.report:
+        profiler.write_report(args.report)
+    else:
+        sys.stdout.write(profiler.to_json() + "\n")
+    if args.trace:
+        profiler.write_chrome_trace(args.trace)
+
+
+if __name__ == "__main__":
+    main()
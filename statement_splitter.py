@@ -0,0 +1,59 @@
+import re
+
+# the lexemes that decide where a top-level statement ends (see grammar.lark):
+# strings and comments may contain anything, a line overflow escape continues the statement on the next line and
+# any other newline ends it. a newline may be a "\r\n" (see _NEWLINE), the "\r" is not a part of the statement.
+_STATEMENT_BOUNDARY_REGEX = re.compile(r'"(?:\\(?:\r?\n|.)|[^"\\\n])*"'
+                                       r'|#[^\r\n]*'
+                                       r'|\\\r?\n'
+                                       r'|\r?\n')
+
+
+def iter_statement_spans(text):
+    """
+    splits a program into its top-level statements, without parsing it.
+    a statement ends at a newline, unless the newline is a part of a line overflow escape (inside or outside of a
+    string). lines that only hold whitespace or comments are skipped.
+    :param text: the program.
+    :return: a generator of (start offset, end offset, line number of the statement's first line) tuples
+    """
+    statement_start = 0
+    statement_line = 1
+    cur_line = 1
+    has_content = False
+    last_lexeme_end = 0
+    for match in _STATEMENT_BOUNDARY_REGEX.finditer(text):
+        if not has_content and text[last_lexeme_end:match.start()].strip():
+            has_content = True
+        last_lexeme_end = match.end()
+        lexeme = match.group()
+        if lexeme[0] == '"':
+            has_content = True
+            cur_line += lexeme.count('\n')
+        elif lexeme[0] == '\\':
+            cur_line += 1
+        elif lexeme[-1] == '\n':
+            if has_content:
+                yield statement_start, match.start(), statement_line
+            cur_line += 1
+            statement_start = match.end()
+            statement_line = cur_line
+            has_content = False
+    if has_content or text[last_lexeme_end:].strip():
+        yield statement_start, len(text), statement_line
+
+
+def iter_statements(text):
+    """
+    :return: a generator of (statement text, line number of the statement's first line) tuples,
+        see iter_statement_spans
+    """
+    for start, end, line in iter_statement_spans(text):
+        yield text[start:end], line
+
+
+def split_statements(text):
+    """
+    returns a list of the (statement text, first line number) tuples of a program, see iter_statements
+    """
+    return list(iter_statements(text))
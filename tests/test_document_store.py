@@ -0,0 +1,26 @@
+from engine.document_store import DocumentStore
+
+
+def test_rewritten_file_gets_a_new_document(tmp_path):
+    path = tmp_path / "document.txt"
+    path.write_text("hello world")
+    document_store = DocumentStore()
+    view = document_store.read(str(path))
+    assert view.get_text() == "hello world"
+    assert document_store.read(str(path)).document is view.document
+    path.write_text("bye")
+    new_view = document_store.read(str(path))
+    assert new_view.document is not view.document
+    assert new_view.get_text() == "bye"
+    assert document_store.read(str(path)).document is new_view.document
+
+
+def test_changed_document_is_not_shared_by_content(tmp_path):
+    path = tmp_path / "document.txt"
+    path.write_text("abc")
+    document_store = DocumentStore()
+    view = document_store.read(str(path))
+    path.write_text("xyz")
+    other_path = tmp_path / "other.txt"
+    other_path.write_text("abc")
+    assert document_store.read(str(other_path)).document is not view.document
@@ -0,0 +1,40 @@
+import re
+
+import numpy as np
+import pytest
+
+from engine.fact_import import read_code_arrays, split_columns
+from engine.string_dictionary import StringDictionary
+from lark_passes import VarTypes
+
+
+def test_read_code_arrays(tmp_path):
+    path = tmp_path / "facts.tsv"
+    path.write_text("name\tspan\tcount\nbob\t[0, 3)\t7\nann\t [4,9) \t-2\nbob\t[0,3)\t+1\n")
+    string_dictionary = StringDictionary(["ann"])
+    code_arrays = read_code_arrays(str(path), (VarTypes.STRING, VarTypes.SPAN, VarTypes.INT), string_dictionary,
+                                   has_header=True)
+    assert [code_array.tolist() for code_array in code_arrays] == [[1, 0, 1], [0, 4, 0], [3, 9, 3], [7, -2, 1]]
+    assert string_dictionary.strings == ["ann", "bob"]
+
+
+@pytest.mark.parametrize("text, schema, message", [
+    ("1\t2\n3\n", (VarTypes.INT, VarTypes.INT), "row 2 has 1 fields (expected 2)"),
+    ("a\t1\nb\tx\n", (VarTypes.STRING, VarTypes.INT), "row 2: 'x' is not a valid int"),
+    ("9223372036854775808\n", (VarTypes.INT,), "row 1: '9223372036854775808' is not a valid int"),
+    ("[1,2)\t1\n[1,2\t2\n", (VarTypes.SPAN, VarTypes.INT), "row 2: '[1,2' is not a valid spn"),
+    ("[5,2)\n", (VarTypes.SPAN,), "row 1: the span [5,2) ends before it starts"),
+])
+def test_bad_field(tmp_path, text, schema, message):
+    path = tmp_path / "facts.tsv"
+    path.write_text(text)
+    string_dictionary = StringDictionary()
+    with pytest.raises(ValueError, match=re.escape(message)):
+        read_code_arrays(str(path), schema, string_dictionary)
+    assert not len(string_dictionary)
+
+
+def test_split_columns_of_a_multibyte_delimiter():
+    assert split_columns("é§1\n§2", 2, "§") == [["é", ""], ["1", "2"]]
+    assert split_columns("", 2) == [[], []]
+    assert np.array_equal(split_columns("\n", 1), [[""]])
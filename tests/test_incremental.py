@@ -0,0 +1,41 @@
+import pytest
+
+import exceptions
+from incremental import IncrementalFrontEnd
+
+
+def test_failed_execution_undoes_the_checked_definitions():
+    front_end = IncrementalFrontEnd()
+    with pytest.raises(FileNotFoundError):
+        front_end.run('x = read("/nonexistent")\n')
+    with pytest.raises(exceptions.VariableNotDefinedError):
+        front_end.run('y = x\n')
+    front_end.run('n = 1\nnew r(int)\nr(n)\n')
+    with pytest.raises(FileNotFoundError):
+        front_end.run('n = read("/nonexistent")\n')
+    # n is still an int
+    assert front_end.run('r(n)\n?r(X)\n') == [[(1,)]]
+
+
+def test_recursive_rules_of_a_relation():
+    front_end = IncrementalFrontEnd()
+    assert front_end.run('new parent(str, str)\n'
+                         'parent("a", "b")\n'
+                         'parent("b", "c")\n'
+                         'ancestor(X, Y) <- parent(X, Y)\n'
+                         'ancestor(X, Z) <- ancestor(X, Y), parent(Y, Z)\n'
+                         '?ancestor("a", X)\n') == [[("b",), ("c",)]]
+    assert sorted(front_end.run('parent("c", "d")\n?ancestor(X, "d")\n')[0]) == [("a",), ("b",), ("c",)]
+    assert front_end.run('parent("a", "b") <- False\n?ancestor("a", X)\n') == [[]]
+    with pytest.raises(exceptions.IncorrectArityError):
+        front_end.run('ancestor(X) <- parent(X, X)\n')
+    with pytest.raises(exceptions.TermsNotProperlyTypedError):
+        front_end.run('new age(str, int)\nancestor(X, N) <- age(X, N)\n')
+    with pytest.raises(exceptions.RelationRedefinitionError):
+        front_end.run('parent(X, Y) <- ancestor(X, Y)\n')
+    # the failed rules are not rules of ancestor
+    assert sorted(front_end.run('?ancestor(X, Y)\n')[0]) == [("b", "c"), ("b", "d"), ("c", "d")]
+
+
+def test_crlf_newlines():
+    assert IncrementalFrontEnd().run('new a(int)\r\na(1)\r\n?a(X)\r\n') == [[(1,)]]
@@ -0,0 +1,106 @@
+"""
+the incremental maintenance of derived relations (counting and dred, see engine.execution.Execution) must leave them
+as computing them from scratch would, and must cost in proportion to the change rather than to the relations.
+"""
+import random
+
+import numpy as np
+import pytest
+
+import ast_nodes
+import engine
+from engine.relation_store import ColumnarRelation
+from lark_passes import VarTypes
+
+
+def make_relation(name, *terms):
+    return ast_nodes.Relation(name, tuple(ast_nodes.FreeVar(term) if term.isupper() else term for term in terms))
+
+
+RULES = [
+    ast_nodes.Rule("copy", ("X", "Y"), (make_relation("p", "X", "Y"),)),
+    ast_nodes.Rule("join", ("X", "Z"), (make_relation("p", "X", "Y"), make_relation("q", "Y", "Z"))),
+    ast_nodes.Rule("join", ("X", "Z"), (make_relation("q", "X", "Z"),)),
+    ast_nodes.Rule("self_join", ("X", "Z"), (make_relation("p", "X", "Y"), make_relation("p", "Y", "Z"))),
+    ast_nodes.Rule("constant", ("X",), (make_relation("q", "X", "0"),)),
+    # recursive
+    ast_nodes.Rule("ancestor", ("X", "Y"), (make_relation("p", "X", "Y"),)),
+    ast_nodes.Rule("ancestor", ("X", "Z"), (make_relation("ancestor", "X", "Y"), make_relation("p", "Y", "Z"))),
+    ast_nodes.Rule("cycle", ("X",), (make_relation("ancestor", "X", "Y"), make_relation("q", "Y", "Y"))),
+    # mutually recursive
+    ast_nodes.Rule("even", ("X", "Y"), (make_relation("p", "X", "Y"),)),
+    ast_nodes.Rule("odd", ("X", "Y"), (make_relation("even", "X", "Z"), make_relation("p", "Z", "Y"))),
+    ast_nodes.Rule("even", ("X", "Y"), (make_relation("odd", "X", "Z"), make_relation("p", "Z", "Y"))),
+]
+DERIVED_RELATION_NAMES = sorted({rule.head_name for rule in RULES})
+
+
+def make_session(facts, index_memory_budget):
+    session = engine.Session(index_memory_budget=index_memory_budget)
+    for relation_name in ("p", "q"):
+        session.update_state(ast_nodes.RelationDeclaration(relation_name, (VarTypes.STRING, VarTypes.STRING)))
+    for rule in RULES:
+        session.type_environment.relation_name_to_schema[rule.head_name] = \
+            (VarTypes.STRING,) * len(rule.head_free_vars)
+        session.update_state(rule)
+    for relation_name, row in facts:
+        session.update_state(ast_nodes.AddFact(relation_name, row))
+    return session
+
+
+def query_all(session, relation_name):
+    arity = len(session.type_environment.relation_name_to_schema[relation_name])
+    free_vars = tuple(ast_nodes.FreeVar("V" + str(idx)) for idx in range(arity))
+    return sorted(session.update_state(ast_nodes.Query(ast_nodes.Relation(relation_name, free_vars))))
+
+
+# a budget of 0 makes the index advisor refuse every index, so the joins scan the stored relations
+@pytest.mark.parametrize("index_memory_budget", [0, engine.DEFAULT_INDEX_MEMORY_BUDGET])
+@pytest.mark.parametrize("seed", range(20))
+def test_maintenance_matches_recomputation(seed, index_memory_budget):
+    rnd = random.Random(seed)
+    values = [str(value) for value in range(rnd.randint(2, 6))]
+    facts = set()
+    session = make_session((), index_memory_budget)
+    for _ in range(25):
+        relation_name = rnd.choice("pq")
+        row = (rnd.choice(values), rnd.choice(values))
+        if rnd.random() < 0.6:
+            session.update_state(ast_nodes.AddFact(relation_name, row))
+            facts.add((relation_name, row))
+        else:
+            session.update_state(ast_nodes.RemoveFact(relation_name, row))
+            facts.discard((relation_name, row))
+        if rnd.random() < 0.5:
+            recomputed_session = make_session(sorted(facts), index_memory_budget)
+            for relation_name in rnd.sample(DERIVED_RELATION_NAMES, rnd.randint(1, len(DERIVED_RELATION_NAMES))):
+                assert query_all(session, relation_name) == query_all(recomputed_session, relation_name), \
+                    relation_name
+
+
+def test_maintenance_does_not_copy_an_unindexed_stored_relation(monkeypatch):
+    row_count = 20000
+    session = engine.Session(index_memory_budget=0)
+    for relation_name in ("p", "q"):
+        session.update_state(ast_nodes.RelationDeclaration(relation_name, (VarTypes.INT, VarTypes.INT)))
+    session.get_relation("p").add_code_arrays([np.arange(row_count), np.arange(row_count) % 7])
+    session.type_environment.relation_name_to_schema["j"] = (VarTypes.INT, VarTypes.INT)
+    session.update_state(ast_nodes.Rule("j", ("X", "Z"), (make_relation("q", "X", "Y"), make_relation("p", "Y", "Z"))))
+    assert not len(session.get_relation("j"))
+
+    def iter_internal_rows(relation, row_idxs=None):
+        assert row_idxs is not None, "every row of relation " + relation.name + " was read"
+        return original_iter_internal_rows(relation, row_idxs)
+
+    original_iter_internal_rows = ColumnarRelation.iter_internal_rows
+    monkeypatch.setattr(ColumnarRelation, "iter_internal_rows", iter_internal_rows)
+    for value in range(3):
+        session.update_state(ast_nodes.AddFact("q", (value, 10 * value)))
+        assert not session.get_relation("p").indexes
+        assert sorted(session.get_relation("j")) == [(x, (10 * x) % 7) for x in range(value + 1)]
+    # a change of many rows scans p once for all of them
+    for value in range(3, 100):
+        session.update_state(ast_nodes.AddFact("q", (value, value)))
+    assert len(session.get_relation("j")) == 100
+    session.update_state(ast_nodes.RemoveFact("q", (0, 0)))
+    assert len(session.get_relation("j")) == 99
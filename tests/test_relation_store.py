@@ -0,0 +1,68 @@
+import random
+
+import numpy as np
+
+from engine import relation_store
+from engine.relation_store import ColumnarRelation
+from lark_passes import VarTypes
+
+
+def test_statistics_are_computed_again_only_when_the_size_doubles_or_halves(monkeypatch):
+    relation = ColumnarRelation("r", (VarTypes.INT, VarTypes.STRING))
+    for value in range(8):
+        relation.add((value, "a"))
+    assert relation.get_statistics().distinct_counts == (8, 1)
+    unique_calls = []
+
+    def unique(*args, **kwargs):
+        unique_calls.append(args)
+        return original_unique(*args, **kwargs)
+
+    original_unique = np.unique
+    monkeypatch.setattr(np, "unique", unique)
+    for value in range(8, 16):
+        relation.add((value, "b"))
+        assert relation.get_statistics().cardinality == len(relation)
+    assert not unique_calls
+    relation.add((16, "c"))
+    assert relation.get_statistics().distinct_counts == (17, 3)
+    assert unique_calls
+    for value in range(16):
+        relation.remove((value, "a" if value < 8 else "b"))
+    statistics = relation.get_statistics()
+    assert statistics.cardinality == 1 and statistics.distinct_counts == (1, 1)
+
+
+def test_row_keys_keep_set_semantics():
+    rnd = random.Random(0)
+    relation = ColumnarRelation("r", (VarTypes.INT, VarTypes.SPAN))
+    relation.ROW_KEY_SCANS = 0
+    relation.create_index((0,))
+    rows = set()
+    for _ in range(2000):
+        row = (rnd.randrange(-20, 20), (rnd.randrange(5), rnd.randrange(5)))
+        if rnd.random() < 0.1:
+            new_rows = [(rnd.randrange(-20, 20), (rnd.randrange(5), rnd.randrange(5))) for _ in range(20)]
+            added_idxs = relation.add_code_arrays([np.array([value for value, _ in new_rows]),
+                                                   np.array([span[0] for _, span in new_rows]),
+                                                   np.array([span[1] for _, span in new_rows])])
+            assert [new_rows[idx] for idx in added_idxs] == \
+                list(dict.fromkeys(new_row for new_row in new_rows if new_row not in rows))
+            rows.update(new_rows)
+        elif rnd.random() < 0.5:
+            assert relation.add_internal(row) == (row not in rows)
+            rows.add(row)
+        else:
+            assert relation.remove_internal(row) == (row in rows)
+            rows.discard(row)
+        assert relation.contains_internal(row) == (row in rows)
+    assert len(relation) == len(rows) and set(relation.iter_internal_rows()) == rows
+
+
+def test_add_code_arrays_with_colliding_row_hashes(monkeypatch):
+    monkeypatch.setattr(relation_store, "get_row_hashes", lambda code_arrays: np.zeros(len(code_arrays[0]),
+                                                                                        dtype=np.uint64))
+    relation = ColumnarRelation("r", (VarTypes.INT, VarTypes.INT))
+    added_idxs = relation.add_code_arrays([np.array([3, 1, 3, 2, 1]), np.array([0, 1, 0, 2, 5])])
+    assert added_idxs.tolist() == [0, 1, 3, 4]
+    assert sorted(relation.iter_internal_rows()) == [(1, 1), (1, 5), (2, 2), (3, 0)]
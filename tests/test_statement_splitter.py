@@ -0,0 +1,8 @@
+from parallel_front_end import ParallelFrontEnd
+from statement_splitter import split_statements
+
+
+def test_crlf_ends_a_statement():
+    text = 'new a(int)\r\na(1) # one\r\n\r\na(2) \\\r\n\r\n?a(X)\r\n'
+    assert split_statements(text) == [('new a(int)', 1), ('a(1) # one', 2), ('a(2) \\\r\n', 4), ('?a(X)', 6)]
+    assert len(ParallelFrontEnd(max_workers=1, chunk_size=1).check(text).children) == 4